@@ -43,6 +43,11 @@ try:
 except Exception as e:
     print(f"⚠️ No se pudo configurar cliente httpx personalizado: {e}")
 
+# Perfilado de consultas por request (conteo, latencia y bytes por tabla)
+from api.query_profiler import instrument_client
+
+instrument_client(supabase)
+
 def guardar_dato(peso, alerta=False, idproducto=1, pesado_por="00000000-0000-0000-0000-000000000000"):
    
    # Guarda un registro en la tabla pesajes de Supabase
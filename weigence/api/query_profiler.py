@@ -0,0 +1,191 @@
+# api/query_profiler.py
+"""
+Perfilado de consultas PostgREST por request.
+
+Se engancha a los event hooks del cliente httpx que usa Supabase, así que
+registra cualquier ``.execute()`` sin importar el tipo de query builder.
+El perfil activo vive en un ContextVar: los hilos que copien el contexto
+(p. ej. ``contextvars.copy_context().run``) suman sus consultas al mismo perfil.
+"""
+from __future__ import annotations
+
+from collections import deque
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+_T0_KEY = "weigence_query_t0"
+_MAX_FILTER_CHARS = 300
+
+
+@dataclass
+class QueryRecord:
+    """Una llamada HTTP a PostgREST."""
+
+    table: str
+    method: str
+    filters: str
+    status: int
+    bytes: int
+    ms: float
+
+
+@dataclass
+class RequestProfile:
+    """Consultas ejecutadas durante un request Flask."""
+
+    route: str
+    method: str = "GET"
+    started_at: float = field(default_factory=time.time)
+    queries: List[QueryRecord] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(q.ms for q in self.queries)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(q.bytes for q in self.queries)
+
+    def by_table(self) -> Dict[str, Dict[str, float]]:
+        tablas: Dict[str, Dict[str, float]] = {}
+        for q in self.queries:
+            t = tablas.setdefault(q.table, {"count": 0, "ms": 0.0, "bytes": 0})
+            t["count"] += 1
+            t["ms"] += q.ms
+            t["bytes"] += q.bytes
+        return tablas
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "route": self.route,
+            "method": self.method,
+            "started_at": self.started_at,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "total_bytes": self.total_bytes,
+            "by_table": self.by_table(),
+            "queries": [q.__dict__ for q in self.queries],
+        }
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("weigence_query_profile", default=None)
+
+# Últimos perfiles para el endpoint de diagnóstico
+_recent: Deque[RequestProfile] = deque(maxlen=200)
+_recent_lock = threading.Lock()
+
+
+def start_profile(route: str, method: str = "GET") -> Token:
+    return _current.set(RequestProfile(route=route, method=method))
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def finish_profile(token: Token) -> Optional[RequestProfile]:
+    """Cierra el perfil activo y lo guarda entre los recientes."""
+
+    profile = _current.get()
+    _current.reset(token)
+    if profile is not None:
+        with _recent_lock:
+            _recent.append(profile)
+    return profile
+
+
+def recent_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    with _recent_lock:
+        perfiles = list(_recent)[-limit:]
+    return [p.to_dict() for p in reversed(perfiles)]
+
+
+def route_summary() -> List[Dict[str, Any]]:
+    """Agrega los perfiles recientes por ruta, ordenados por consultas promedio."""
+
+    with _recent_lock:
+        perfiles = list(_recent)
+    rutas: Dict[str, Dict[str, Any]] = {}
+    for p in perfiles:
+        r = rutas.setdefault(p.route, {"route": p.route, "requests": 0, "queries": 0, "max_queries": 0, "ms": 0.0})
+        r["requests"] += 1
+        r["queries"] += p.count
+        r["max_queries"] = max(r["max_queries"], p.count)
+        r["ms"] += p.total_ms
+    for r in rutas.values():
+        r["avg_queries"] = round(r["queries"] / r["requests"], 2)
+        r["avg_ms"] = round(r["ms"] / r["requests"], 2)
+        del r["ms"]
+    return sorted(rutas.values(), key=lambda r: r["avg_queries"], reverse=True)
+
+
+# ------------------------------------------------------------------
+# Hooks httpx
+# ------------------------------------------------------------------
+def _on_request(request) -> None:
+    if _current.get() is not None:
+        request.extensions[_T0_KEY] = time.perf_counter()
+
+
+def _on_response(response) -> None:
+    profile = _current.get()
+    if profile is None:
+        return
+    t0 = response.request.extensions.get(_T0_KEY)
+    if t0 is None:
+        return
+    # Leer el cuerpo aquí para medir bytes y latencia completa; httpx lo deja cacheado
+    response.read()
+    url = response.request.url
+    partes = [p for p in url.path.split("/") if p]
+    tabla = "/".join(partes[2:]) if len(partes) > 2 and partes[0] == "rest" else url.path
+    filtros = url.query.decode("utf-8", "replace") if isinstance(url.query, bytes) else str(url.query)
+    profile.queries.append(
+        QueryRecord(
+            table=tabla,
+            method=response.request.method,
+            filters=filtros[:_MAX_FILTER_CHARS],
+            status=response.status_code,
+            bytes=len(response.content),
+            ms=(time.perf_counter() - t0) * 1000.0,
+        )
+    )
+
+
+def _ensure_hooks(session) -> None:
+    hooks = session.event_hooks
+    if _on_request in hooks.get("request", []):
+        return
+    session.event_hooks = {
+        "request": [*hooks.get("request", []), _on_request],
+        "response": [*hooks.get("response", []), _on_response],
+    }
+
+
+def instrument_client(client) -> None:
+    """Envuelve ``table``/``from_``/``rpc`` para asegurar los hooks en la sesión vigente.
+
+    Supabase puede recrear el cliente PostgREST (p. ej. al refrescar la sesión
+    de auth), por eso los hooks se verifican en cada llamada y no solo una vez.
+    """
+
+    for nombre in ("table", "from_", "rpc"):
+        original = getattr(client, nombre, None)
+        if original is None:
+            continue
+
+        def envoltura(*args, __original=original, **kwargs):
+            try:
+                _ensure_hooks(client.postgrest.session)
+            except Exception:
+                pass
+            return __original(*args, **kwargs)
+
+        setattr(client, nombre, envoltura)
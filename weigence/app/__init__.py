@@ -10,6 +10,7 @@ from .routes import bp as routes_bp
 from .routes.utils import obtener_notificaciones
 from .app_config import get_config
 from .utils.logger import setup_logging
+from .utils.query_profiling import init_query_profiler
 
 load_dotenv()
 
@@ -153,6 +154,9 @@ def create_app(config_name=None):
     
     logger.info("Headers de seguridad anti-caché configurados")
 
+    init_query_profiler(app)
+    logger.info("Perfilador de consultas Supabase activo")
+
     # Registrar endpoint de debug (solo en desarrollo)
     if app.config.get("DEBUG"):
         try:
@@ -221,12 +225,37 @@ def create_app(config_name=None):
 
     logger.info("Rutas de recuperacion de contrasena exentas de CSRF (metodo wrapper)")
 
+    # ========== MODELO ML (precarga en segundo plano) ==========
+    try:
+        from .ia.ia_ml_anomalies import preload_detector
+
+        preload_detector()
+        logger.info("Precarga del modelo ML iniciada")
+    except Exception as e:
+        logger.warning(f"No se pudo precargar el modelo ML: {e}")
+
+    # ========== TAREAS EN SEGUNDO PLANO (alertas) ==========
+    if os.getenv("SCHEDULER_ENABLED", "1").lower() not in ("0", "false", "no"):
+        try:
+            from .utils.scheduler import scheduler
+
+            scheduler.start()
+            logger.info("Scheduler de alertas iniciado")
+        except Exception as e:
+            logger.warning(f"No se pudo iniciar el scheduler de alertas: {e}")
+
     # ========== SOCKETIO (CHAT TIEMPO REAL) ==========
     try:
         from .chat.sockets.chat_ws import init_socketio
 
         socketio_instance = init_socketio(app)
         logger.info("WebSocket (SocketIO) configurado para chat")
+
+        # Lecturas de las pesas en tiempo real (namespace /pesos)
+        from .sensores.pesos_ws import init_pesos_ws
+
+        init_pesos_ws(socketio_instance)
+        logger.info("Stream de lecturas de peso configurado")
         
         # Configurar logging de engineio/socketio para ser menos verboso
         import logging
@@ -51,6 +51,11 @@ class Config:
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE = os.getenv("LOG_FILE", "app.log")
     
+    # ========== PERFILADO DE CONSULTAS ==========
+    QUERY_PROFILER_ENABLED = os.getenv("QUERY_PROFILER_ENABLED", "1").lower() not in ("0", "false", "no")
+    # Máximo de consultas Supabase por request antes de loguear una advertencia (0 = sin límite)
+    QUERY_BUDGET_PER_REQUEST = int(os.getenv("QUERY_BUDGET_PER_REQUEST", "25"))
+    
     # ========== APLICACIÓN ==========
     BASE_URL = os.getenv("BASE_URL", "http://localhost:5000")
 
@@ -46,6 +46,20 @@ def chat_conversaciones():
         })
     
 
+@bp_chat.get("/no_leidos")
+def chat_no_leidos():
+    """Total de mensajes no leídos (badge del panel), sin armar la lista de conversaciones."""
+    user = session.get("usuario_id")
+    if not user:
+        return jsonify({"success": False, "msg": "No autenticado"}), 401
+
+    try:
+        return jsonify({"success": True, "total": model.contar_no_leidos_usuario(user)})
+    except Exception as e:
+        print(f"[CHAT_API] Error en no_leidos: {e}")
+        return jsonify({"success": False, "total": 0})
+
+
 # =============================================
 # 2. Historial con otro usuario
 # =============================================
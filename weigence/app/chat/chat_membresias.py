@@ -0,0 +1,96 @@
+"""
+Caché en memoria de participantes por conversación.
+
+Las validaciones de acceso (``join`` del socket, endpoints de mensajes) leen
+de aquí en vez de consultar ``chat_participantes`` cada vez. Al conectarse un
+usuario se cargan de una vez todas sus conversaciones (dos consultas), así que
+reunirse a N salas tras una reconexión no cuesta N consultas.
+
+Las entradas vencen a los ``CHAT_MEMBRESIAS_TTL`` segundos; crear una
+conversación la registra de inmediato.
+"""
+import os
+import threading
+import time
+
+_TTL_SECONDS = float(os.getenv("CHAT_MEMBRESIAS_TTL", "300"))
+
+
+def _clave(conversacion_id):
+    return str(conversacion_id)
+
+
+class MembresiasCache:
+    """Mapa conversación -> participantes con vencimiento por entrada.
+
+    ``cargar_conversacion(conv_id)`` y ``cargar_usuario(usuario_id)`` son las
+    funciones que consultan la BD cuando falta una entrada; la segunda devuelve
+    ``{conv_id: [participantes]}`` con todas las conversaciones del usuario.
+    """
+
+    def __init__(self, cargar_conversacion, cargar_usuario, ttl=_TTL_SECONDS):
+        self._cargar_conversacion = cargar_conversacion
+        self._cargar_usuario = cargar_usuario
+        self._ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._conversaciones = {}
+        self._usuarios_cargados = {}
+        self._aciertos = 0
+        self._fallos = 0
+
+    def es_participante(self, conversacion_id, usuario_id):
+        participantes = self.participantes(conversacion_id)
+        return usuario_id in participantes
+
+    def participantes(self, conversacion_id):
+        clave = _clave(conversacion_id)
+        with self._lock:
+            entrada = self._conversaciones.get(clave)
+            if entrada is not None and entrada[1] > time.monotonic():
+                self._aciertos += 1
+                return entrada[0]
+            self._fallos += 1
+
+        participantes = frozenset(self._cargar_conversacion(conversacion_id) or ())
+        self.registrar(clave, participantes)
+        return participantes
+
+    def registrar(self, conversacion_id, participantes):
+        vence = time.monotonic() + self._ttl
+        with self._lock:
+            self._conversaciones[_clave(conversacion_id)] = (frozenset(participantes), vence)
+
+    def precargar_usuario(self, usuario_id):
+        """Carga en bloque todas las conversaciones del usuario.
+
+        Si ya se cargaron dentro del TTL no consulta de nuevo (reconexiones en
+        ráfaga); una conversación nueva de otro proceso se resuelve igual en
+        ``participantes`` al no estar en caché.
+        """
+        with self._lock:
+            if self._usuarios_cargados.get(usuario_id, 0) > time.monotonic():
+                return 0
+        conversaciones = self._cargar_usuario(usuario_id) or {}
+        for conversacion_id, participantes in conversaciones.items():
+            self.registrar(conversacion_id, participantes)
+        with self._lock:
+            self._usuarios_cargados[usuario_id] = time.monotonic() + self._ttl
+        return len(conversaciones)
+
+    def invalidar(self, conversacion_id=None):
+        with self._lock:
+            if conversacion_id is None:
+                self._conversaciones.clear()
+                self._usuarios_cargados.clear()
+            else:
+                self._conversaciones.pop(_clave(conversacion_id), None)
+
+    def estado(self):
+        with self._lock:
+            return {
+                "conversaciones": len(self._conversaciones),
+                "usuarios_precargados": len(self._usuarios_cargados),
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+                "ttl_segundos": self._ttl,
+            }
@@ -1,4 +1,7 @@
+import time
+
 from api.conexion_supabase import supabase
+from app.chat.chat_membresias import MembresiasCache
 try:
     from postgrest.exceptions import APIError
 except ImportError:
@@ -77,6 +80,7 @@ def crear_conversacion(user1, user2):
         ]
     ).execute()
 
+    membresias.registrar(conv_id, [user1, user2])
     return conv.data[0]
 
 
@@ -116,36 +120,66 @@ def insertar_mensaje(conversacion_id, usuario_id, contenido, reply_to=None):
 # 4. PARTICIPANTES / PERMISOS
 # ============================================================
 
+def _consultar_participantes(conversacion_id):
+    r = (
+        supabase.table("chat_participantes")
+        .select("usuario_id")
+        .eq("conversacion_id", conversacion_id)
+        .execute()
+    )
+    return [p["usuario_id"] for p in r.data or []]
+
+
+def _consultar_conversaciones_de_usuario(usuario_id):
+    """{conversacion_id: [participantes]} de todas las conversaciones del usuario."""
+    r = (
+        supabase.table("chat_participantes")
+        .select("conversacion_id")
+        .eq("usuario_id", usuario_id)
+        .execute()
+    )
+    conv_ids = [p["conversacion_id"] for p in r.data or []]
+    if not conv_ids:
+        return {}
+
+    todos = (
+        supabase.table("chat_participantes")
+        .select("conversacion_id, usuario_id")
+        .in_("conversacion_id", conv_ids)
+        .execute()
+    )
+    resultado = {cid: [] for cid in conv_ids}
+    for p in todos.data or []:
+        resultado.setdefault(p["conversacion_id"], []).append(p["usuario_id"])
+    return resultado
+
+
+# Participantes por conversación en memoria (validaciones de acceso sin ir a la BD)
+membresias = MembresiasCache(_consultar_participantes, _consultar_conversaciones_de_usuario)
+
+
 def obtener_participantes(conversacion_id):
     try:
-        r = (
-            supabase.table("chat_participantes")
-            .select("usuario_id")
-            .eq("conversacion_id", conversacion_id)
-            .execute()
-        )
+        return list(membresias.participantes(conversacion_id))
     except APIError:
         return []
 
-    if not r.data:
-        return []
-    return [p["usuario_id"] for p in r.data]
-
 
 def validar_usuario_en_conversacion(conversacion_id, usuario_id):
     try:
-        r = (
-            supabase.table("chat_participantes")
-            .select("id")
-            .eq("conversacion_id", conversacion_id)
-            .eq("usuario_id", usuario_id)
-            .execute()
-        )
-        return bool(r.data and len(r.data) > 0)
+        return membresias.es_participante(conversacion_id, usuario_id)
     except APIError:
         return False
 
 
+def precargar_membresias(usuario_id):
+    """Carga en el caché todas las conversaciones del usuario (al conectarse)."""
+    try:
+        return membresias.precargar_usuario(usuario_id)
+    except APIError:
+        return 0
+
+
 def obtener_participacion(conversacion_id, usuario_id):
     try:
         r = (
@@ -183,40 +217,177 @@ def obtener_conversaciones_de_usuario(rut):
     return [conv for conv in r.data if validar_usuario_en_conversacion(conv["id"], rut)]
 
 
+# Si la BD no tiene las columnas del resumen (migración pendiente) se usan los
+# mensajes y se vuelve a probar el resumen pasado este plazo
+_RESUMEN_REINTENTO_SECONDS = 300.0
+# Columna inexistente: PostgREST (caché de esquema) y Postgres
+_COLUMNA_INEXISTENTE = ("PGRST204", "42703")
+_resumen_sin_columnas_hasta = 0.0
+
+
+def _resumen_disponible():
+    return time.monotonic() >= _resumen_sin_columnas_hasta
+
+
+def _marcar_resumen_si_falta_columna(error):
+    """True (y desactiva el resumen por un rato) si el error es por columnas inexistentes."""
+    global _resumen_sin_columnas_hasta
+    if str(getattr(error, "code", "")) not in _COLUMNA_INEXISTENTE:
+        return False
+    _resumen_sin_columnas_hasta = time.monotonic() + _RESUMEN_REINTENTO_SECONDS
+    return True
+
+
 def obtener_conversaciones_optimizado(usuario_id):
-    """Obtiene conversaciones con todos los datos necesarios en una sola consulta optimizada."""
+    """Conversaciones del usuario con último mensaje y no leídos, en O(conversaciones).
+
+    Lee el resumen que mantienen los triggers de ``sql/chat_resumen_conversaciones.sql``
+    (``chat_conversaciones.ultimo_mensaje_*`` y ``chat_participantes.no_leidos``).
+    Si la migración aún no se aplicó, usa el cálculo antiguo sobre los mensajes.
+    """
+    if not _resumen_disponible():
+        return _obtener_conversaciones_desde_mensajes(usuario_id)
+
     try:
-        # Obtener conversaciones donde participa el usuario
         participaciones = (
             supabase.table("chat_participantes")
-            .select("conversacion_id, ultimo_mensaje_leido")
+            .select("conversacion_id, no_leidos")
             .eq("usuario_id", usuario_id)
             .execute()
         )
-        
         if not participaciones.data:
             return []
-        
+
         conv_ids = [p["conversacion_id"] for p in participaciones.data]
-        ultimo_leido_map = {p["conversacion_id"]: p["ultimo_mensaje_leido"] for p in participaciones.data}
-        
-        # Obtener todos los participantes de esas conversaciones
-        todos_participantes = (
+        no_leidos_map = {p["conversacion_id"]: p.get("no_leidos") or 0 for p in participaciones.data}
+
+        resumenes = (
+            supabase.table("chat_conversaciones")
+            .select("id, ultimo_mensaje_preview, ultimo_mensaje_timestamp")
+            .in_("id", conv_ids)
+            .execute()
+        )
+    except APIError as e:
+        if not _marcar_resumen_si_falta_columna(e):
+            # Error transitorio (5xx, timeout): no se abandona el resumen
+            print(f"[CHAT_MODEL] Error en obtener_conversaciones_optimizado: {e}")
+            return []
+        # Columnas del resumen inexistentes: migración pendiente
+        print(f"[CHAT_MODEL] Resumen de conversaciones no disponible, usando mensajes: {e}")
+        return _obtener_conversaciones_desde_mensajes(usuario_id)
+    except Exception as e:
+        print(f"[CHAT_MODEL] Error en obtener_conversaciones_optimizado: {e}")
+        return []
+
+    resumen_map = {r["id"]: r for r in resumenes.data or []}
+
+    def datos(cid):
+        resumen = resumen_map.get(cid) or {}
+        return (
+            resumen.get("ultimo_mensaje_preview") or "",
+            resumen.get("ultimo_mensaje_timestamp"),
+            no_leidos_map.get(cid, 0),
+        )
+
+    try:
+        return _armar_lista_conversaciones(usuario_id, conv_ids, datos)
+    except Exception as e:
+        print(f"[CHAT_MODEL] Error en obtener_conversaciones_optimizado: {e}")
+        return []
+
+
+def contar_no_leidos_usuario(usuario_id):
+    """Total de mensajes no leídos del usuario (badge del chat) con una consulta."""
+    if _resumen_disponible():
+        try:
+            r = (
+                supabase.table("chat_participantes")
+                .select("no_leidos")
+                .eq("usuario_id", usuario_id)
+                .execute()
+            )
+            return sum(p.get("no_leidos") or 0 for p in r.data or [])
+        except APIError as e:
+            if not _marcar_resumen_si_falta_columna(e):
+                print(f"[CHAT_MODEL] Error contando no leídos: {e}")
+                return 0
+    return sum(c["unread"] for c in obtener_conversaciones_optimizado(usuario_id))
+
+
+def _armar_lista_conversaciones(usuario_id, conv_ids, datos_conversacion):
+    """Agrega el otro participante a cada conversación.
+
+    ``datos_conversacion(cid)`` devuelve ``(ultimo_mensaje, fecha, unread)``.
+    """
+    todos_participantes = (
+        supabase.table("chat_participantes")
+        .select("conversacion_id, usuario_id")
+        .in_("conversacion_id", conv_ids)
+        .execute()
+    )
+
+    # Mapear participantes por conversación
+    participantes_map = {}
+    for p in todos_participantes.data:
+        participantes_map.setdefault(p["conversacion_id"], []).append(p["usuario_id"])
+    for cid, miembros in participantes_map.items():
+        membresias.registrar(cid, miembros)
+
+    # Obtener info de todos los usuarios de una vez
+    otros_usuarios_ids = list({
+        m for miembros in participantes_map.values() for m in miembros if m != usuario_id
+    })
+
+    usuarios_info = {}
+    if otros_usuarios_ids:
+        usuarios_data = (
+            supabase.table("usuarios")
+            .select("rut_usuario, nombre, rol")
+            .in_("rut_usuario", otros_usuarios_ids)
+            .execute()
+        )
+        usuarios_info = {u["rut_usuario"]: u for u in usuarios_data.data}
+
+    # Construir resultado
+    resultado = []
+    for cid in conv_ids:
+        otros = [m for m in participantes_map.get(cid, []) if m != usuario_id]
+        if not otros:
+            continue
+
+        info_otro = usuarios_info.get(otros[0])
+        if not info_otro:
+            continue
+
+        ultimo_mensaje, fecha, unread = datos_conversacion(cid)
+        resultado.append({
+            "conversacion_id": cid,
+            "usuario": info_otro,
+            "ultimo_mensaje": ultimo_mensaje,
+            "fecha": fecha,
+            "unread": unread,
+            "is_online": False  # Se actualiza después
+        })
+
+    return resultado
+
+
+def _obtener_conversaciones_desde_mensajes(usuario_id):
+    """Cálculo antiguo: recorre todos los mensajes de las conversaciones del usuario."""
+    try:
+        participaciones = (
             supabase.table("chat_participantes")
-            .select("conversacion_id, usuario_id")
-            .in_("conversacion_id", conv_ids)
+            .select("conversacion_id, ultimo_mensaje_leido")
+            .eq("usuario_id", usuario_id)
             .execute()
         )
-        
-        # Mapear participantes por conversación
-        participantes_map = {}
-        for p in todos_participantes.data:
-            cid = p["conversacion_id"]
-            if cid not in participantes_map:
-                participantes_map[cid] = []
-            participantes_map[cid].append(p["usuario_id"])
-        
-        # Obtener todos los últimos mensajes de esas conversaciones
+
+        if not participaciones.data:
+            return []
+
+        conv_ids = [p["conversacion_id"] for p in participaciones.data]
+        ultimo_leido_map = {p["conversacion_id"]: p["ultimo_mensaje_leido"] for p in participaciones.data}
+
         mensajes = (
             supabase.table("chat_mensajes")
             .select("*")
@@ -224,68 +395,31 @@ def obtener_conversaciones_optimizado(usuario_id):
             .order("fecha_envio", desc=False)
             .execute()
         )
-        
+
         # Agrupar mensajes por conversación (solo el último)
         ultimos_mensajes = {}
         mensajes_no_leidos = {}
-        
+
         for msg in mensajes.data:
             cid = msg["conversacion_id"]
             ultimos_mensajes[cid] = msg
-            
+
             # Contar no leídos
             if msg["usuario_id"] != usuario_id:
                 ultimo_leido = ultimo_leido_map.get(cid)
                 if not ultimo_leido or msg["id"] > ultimo_leido:
                     mensajes_no_leidos[cid] = mensajes_no_leidos.get(cid, 0) + 1
-        
-        # Obtener info de todos los usuarios de una vez
-        otros_usuarios_ids = []
-        for cid, miembros in participantes_map.items():
-            otros = [m for m in miembros if m != usuario_id]
-            otros_usuarios_ids.extend(otros)
-        
-        otros_usuarios_ids = list(set(otros_usuarios_ids))
-        
-        usuarios_info = {}
-        if otros_usuarios_ids:
-            usuarios_data = (
-                supabase.table("usuarios")
-                .select("rut_usuario, nombre, rol")
-                .in_("rut_usuario", otros_usuarios_ids)
-                .execute()
-            )
-            usuarios_info = {u["rut_usuario"]: u for u in usuarios_data.data}
-        
-        # Construir resultado
-        resultado = []
-        for cid in conv_ids:
-            miembros = participantes_map.get(cid, [])
-            otros = [m for m in miembros if m != usuario_id]
-            
-            if not otros:
-                continue
-            
-            otro_id = otros[0]
-            info_otro = usuarios_info.get(otro_id)
-            
-            if not info_otro:
-                continue
-            
+
+        def datos(cid):
             ultimo_msg = ultimos_mensajes.get(cid)
-            unread = mensajes_no_leidos.get(cid, 0)
-            
-            resultado.append({
-                "conversacion_id": cid,
-                "usuario": info_otro,
-                "ultimo_mensaje": ultimo_msg["contenido"] if ultimo_msg else "",
-                "fecha": ultimo_msg["fecha_envio"] if ultimo_msg else None,
-                "unread": unread,
-                "is_online": False  # Se actualiza después
-            })
-        
-        return resultado
-        
+            return (
+                ultimo_msg["contenido"] if ultimo_msg else "",
+                ultimo_msg["fecha_envio"] if ultimo_msg else None,
+                mensajes_no_leidos.get(cid, 0),
+            )
+
+        return _armar_lista_conversaciones(usuario_id, conv_ids, datos)
+
     except Exception as e:
         print(f"[CHAT_MODEL] Error en obtener_conversaciones_optimizado: {e}")
         return []
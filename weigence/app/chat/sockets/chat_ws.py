@@ -1,12 +1,21 @@
 from flask import session
 from flask_socketio import SocketIO, emit, join_room
 import logging
+import os
 
 from app.chat import chat_service as svc
 
 socketio = None
 logger = logging.getLogger(__name__)
 
+# "threading" (desarrollo, un hilo por conexión) o "gevent"/"eventlet" (producción).
+# Con gevent/eventlet el proceso debe arrancar desde wsgi.py, que aplica el monkey patch.
+SOCKETIO_ASYNC_MODE = os.getenv("SOCKETIO_ASYNC_MODE", "threading")
+# Cola compartida entre workers (redis://...; amqp:// o memory:// para pruebas requieren kombu).
+# Sin cola, las salas y los emit solo llegan a los clientes del mismo proceso.
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE") or None
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "weigence-socketio")
+
 
 # ============================================================
 # INIT - called from app/__init__.py
@@ -15,12 +24,18 @@ logger = logging.getLogger(__name__)
 def init_socketio(app):
     """Inicializa SocketIO y registra eventos."""
     global socketio
+    opciones_cola = {}
+    if SOCKETIO_MESSAGE_QUEUE:
+        opciones_cola = {"message_queue": SOCKETIO_MESSAGE_QUEUE, "channel": SOCKETIO_CHANNEL}
+        logger.info(f"[WS] Cola de mensajes compartida: {SOCKETIO_MESSAGE_QUEUE.split('@')[-1]} ({SOCKETIO_CHANNEL})")
+
     socketio = SocketIO(
         app,
         cors_allowed_origins="*",
         logger=False,
         engineio_logger=False,
-        async_mode="threading",  # simple y compatible
+        async_mode=SOCKETIO_ASYNC_MODE,
+        **opciones_cola,
         ping_timeout=60,
         ping_interval=25,
         max_http_buffer_size=1000000,
@@ -52,6 +67,9 @@ def on_connect():
             return False
 
         print(f"[WS] usuario conectado: {user}")
+        # Conversaciones del usuario en caché: los join siguientes no consultan la BD
+        from app.chat import chat_model as model
+        model.precargar_membresias(user)
         emit("ws_connected", {"usuario_id": user})
     except Exception as e:
         print(f"[WS ERROR] Error en on_connect: {e}")
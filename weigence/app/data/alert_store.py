@@ -0,0 +1,192 @@
+"""
+Acceso por lotes a la tabla ``alertas``.
+
+Las alertas abiertas (``pendiente``/``activo``) se mantienen en un índice en
+memoria por título, así que generar o resolver N alertas cuesta una o dos
+consultas en vez de un SELECT de duplicados y un INSERT/UPDATE por alerta.
+El índice se recarga cada ``ALERT_INDEX_TTL`` segundos para ver los cambios
+hechos por otros procesos.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from api.conexion_supabase import supabase
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_ABIERTOS = ("pendiente", "activo")
+
+_INDEX_TTL_SECONDS = float(os.getenv("ALERT_INDEX_TTL", "60"))
+
+
+def _mismo_valor(a, b):
+    # None actúa como comodín: una alerta sin producto/estante coincide por título
+    return a is None or b is None or a == b
+
+
+def coincide(alerta, titulo, idproducto=None, id_estante=None):
+    """True si ``alerta`` corresponde a la clave (titulo, idproducto, id_estante)."""
+    return (
+        (alerta.get("titulo") or "").strip().lower() == (titulo or "").strip().lower()
+        and _mismo_valor(alerta.get("idproducto"), idproducto)
+        and _mismo_valor(alerta.get("id_estante"), id_estante)
+    )
+
+
+class AlertStore:
+    """Operaciones set-based sobre ``alertas`` con índice de alertas abiertas.
+
+    Los cambios se notifican a los suscriptores (p. ej. el caché de
+    notificaciones) una vez por operación, no por fila.
+    """
+
+    def __init__(self, client=None, index_ttl=_INDEX_TTL_SECONDS):
+        self._client = client or supabase
+        self._index_ttl = float(index_ttl)
+        self._lock = threading.RLock()
+        self._abiertas = {}
+        self._cargado_en = None
+        self._suscriptores = []
+
+    # ------------------------------------------------------------
+    # Índice
+    # ------------------------------------------------------------
+    def refresh(self):
+        """Recarga el índice con una sola consulta de alertas abiertas."""
+        filas = (
+            self._client.table("alertas")
+            .select("*")
+            .in_("estado", list(ESTADOS_ABIERTOS))
+            .execute()
+            .data or []
+        )
+        with self._lock:
+            self._abiertas = {f["id"]: f for f in filas if f.get("id") is not None}
+            self._cargado_en = time.monotonic()
+        return len(filas)
+
+    def invalidate(self):
+        with self._lock:
+            self._cargado_en = None
+
+    def abiertas(self, **filtros):
+        """Alertas abiertas, opcionalmente filtradas por igualdad de columnas."""
+        self._asegurar_indice()
+        with self._lock:
+            filas = list(self._abiertas.values())
+        if filtros:
+            filas = [f for f in filas if all(f.get(k) == v for k, v in filtros.items())]
+        return filas
+
+    def buscar(self, titulo, idproducto=None, id_estante=None):
+        """Primera alerta abierta con esa clave, o None."""
+        for alerta in self.abiertas():
+            if coincide(alerta, titulo, idproducto, id_estante):
+                return alerta
+        return None
+
+    # ------------------------------------------------------------
+    # Escrituras
+    # ------------------------------------------------------------
+    def upsert_many(self, alertas):
+        """Inserta las alertas que no tengan ya una abierta con la misma clave.
+
+        Usa el índice para descartar duplicados conocidos, confirma el resto con
+        un único SELECT ``in_`` por título (otros procesos pueden haberlas
+        creado) y las inserta en un solo INSERT. Devuelve las filas insertadas.
+        """
+        candidatas = []
+        for alerta in alertas:
+            clave = (alerta.get("titulo"), alerta.get("idproducto"), alerta.get("id_estante"))
+            if self.buscar(*clave) is not None:
+                continue
+            if any(coincide(c, *clave) for c in candidatas):
+                continue
+            fila = dict(alerta)
+            fila.setdefault("estado", "pendiente")
+            fila.setdefault("fecha_creacion", datetime.now().isoformat())
+            candidatas.append(fila)
+
+        if not candidatas:
+            return []
+
+        existentes = (
+            self._client.table("alertas")
+            .select("*")
+            .in_("titulo", sorted({c["titulo"] for c in candidatas}))
+            .in_("estado", list(ESTADOS_ABIERTOS))
+            .execute()
+            .data or []
+        )
+        self._indexar(existentes)
+        nuevas = [
+            c for c in candidatas
+            if not any(coincide(e, c["titulo"], c.get("idproducto"), c.get("id_estante")) for e in existentes)
+        ]
+        if not nuevas:
+            return []
+
+        try:
+            insertadas = self._client.table("alertas").insert(nuevas).execute().data or []
+        except Exception:
+            # Posible carrera con otro proceso: el índice ya no es confiable
+            self.invalidate()
+            raise
+        self._indexar(insertadas)
+        self._notificar()
+        return insertadas
+
+    def resolve_many(self, ids, estado="resuelto", **campos):
+        """Cambia el estado de varias alertas en un solo UPDATE ``in_``."""
+        ids = sorted({i for i in ids if i is not None})
+        if not ids:
+            return 0
+        cambios = {"estado": estado, **campos}
+        self._client.table("alertas").update(cambios).in_("id", ids).execute()
+        with self._lock:
+            for alerta_id in ids:
+                if estado in ESTADOS_ABIERTOS and alerta_id in self._abiertas:
+                    self._abiertas[alerta_id].update(cambios)
+                elif estado not in ESTADOS_ABIERTOS:
+                    self._abiertas.pop(alerta_id, None)
+        self._notificar()
+        return len(ids)
+
+    def actualizar_estado(self, alerta_id, estado, **campos):
+        """Cambio manual de estado de una alerta (descartar, resolver, reabrir)."""
+        self.resolve_many([alerta_id], estado=estado, **campos)
+        if estado in ESTADOS_ABIERTOS:
+            # Una alerta reabierta no está en el índice: recargar en la próxima lectura
+            self.invalidate()
+
+    # ------------------------------------------------------------
+    # Suscriptores
+    # ------------------------------------------------------------
+    def suscribir(self, callback):
+        """Registra una función sin argumentos que se llama tras cada escritura."""
+        self._suscriptores.append(callback)
+
+    def _notificar(self):
+        for callback in list(self._suscriptores):
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"[ALERTAS] Suscriptor falló: {e}")
+
+    def _asegurar_indice(self):
+        with self._lock:
+            vigente = self._cargado_en is not None and time.monotonic() - self._cargado_en < self._index_ttl
+        if not vigente:
+            self.refresh()
+
+    def _indexar(self, filas):
+        with self._lock:
+            for f in filas:
+                if f.get("id") is not None and f.get("estado") in ESTADOS_ABIERTOS:
+                    self._abiertas[f["id"]] = f
+
+
+alert_store = AlertStore()
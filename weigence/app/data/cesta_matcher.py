@@ -0,0 +1,93 @@
+"""
+Identificación de cestas (varios productos distintos) a partir de un peso.
+
+Para cada estante se precalculan todas las sumas alcanzables con hasta
+``CESTA_MAX_UNIDADES`` unidades de sus productos (subset-sum acotado con
+repetición) y se agrupan por gramo. Identificar un retiro es entonces mirar
+los pocos gramos dentro de la tolerancia, sin recorrer combinaciones.
+
+La tolerancia crece con la cantidad de unidades: cada unidad aporta su propia
+variación de peso además del ruido del sensor,
+``sigma(k) = sqrt(ruido² + k * variacion_unidad²)``.
+"""
+from itertools import combinations_with_replacement
+import math
+import os
+
+MAX_UNIDADES = int(os.getenv("CESTA_MAX_UNIDADES", "3"))
+RUIDO_G = float(os.getenv("CESTA_RUIDO_G", "5"))
+VARIACION_UNIDAD_G = float(os.getenv("CESTA_VARIACION_UNIDAD_G", "3"))
+CONFIANZA_MIN = float(os.getenv("CESTA_CONFIANZA_MIN", "0.6"))
+
+# Desviaciones admitidas y penalización por cada unidad extra (cestas chicas son más probables)
+_Z_MAX = 2.0
+_PRIOR_UNIDAD = 0.3
+_MAX_CANDIDATOS = 5
+
+
+def sigma_gramos(unidades, ruido_g=RUIDO_G, variacion_unidad_g=VARIACION_UNIDAD_G):
+    return math.sqrt(ruido_g ** 2 + unidades * variacion_unidad_g ** 2)
+
+
+class TablaCestas:
+    """Sumas alcanzables de un estante, indexadas por gramo.
+
+    ``pesos`` son los pesos de referencia en kg y ``ids`` los productos
+    correspondientes (mismo orden que el índice de pesos del estante).
+    """
+
+    def __init__(self, pesos, ids, max_unidades=MAX_UNIDADES, ruido_g=RUIDO_G, variacion_unidad_g=VARIACION_UNIDAD_G):
+        self._pesos_g = [p * 1000.0 for p in pesos]
+        self._ids = list(ids)
+        self._max_unidades = max(1, int(max_unidades))
+        self._ruido_g = float(ruido_g)
+        self._variacion_g = float(variacion_unidad_g)
+        self._sumas = {}
+        self.total_cestas = 0
+
+        indices = range(len(self._pesos_g))
+        for k in range(1, self._max_unidades + 1):
+            for combo in combinations_with_replacement(indices, k):
+                total = sum(self._pesos_g[i] for i in combo)
+                self._sumas.setdefault(int(round(total)), []).append((total, combo))
+                self.total_cestas += 1
+
+        self._ventana_g = int(math.ceil(_Z_MAX * sigma_gramos(self._max_unidades, self._ruido_g, self._variacion_g)))
+
+    def buscar(self, peso_kg, limite=_MAX_CANDIDATOS):
+        """Cestas candidatas para ``peso_kg`` ordenadas por confianza.
+
+        Cada candidata es ``{"items": [(idproducto, unidades)], "unidades",
+        "peso_g", "error_g", "confianza"}``; la confianza es la probabilidad
+        relativa entre todas las cestas compatibles con la lectura.
+        """
+        objetivo = abs(float(peso_kg)) * 1000.0
+        centro = int(round(objetivo))
+        candidatas = []
+        for gramo in range(centro - self._ventana_g, centro + self._ventana_g + 1):
+            for total, combo in self._sumas.get(gramo, ()):
+                k = len(combo)
+                sigma = sigma_gramos(k, self._ruido_g, self._variacion_g)
+                error = total - objetivo
+                if abs(error) > _Z_MAX * sigma:
+                    continue
+                puntaje = math.exp(-0.5 * (error / sigma) ** 2) * _PRIOR_UNIDAD ** (k - 1)
+                candidatas.append((puntaje, total, error, combo))
+
+        if not candidatas:
+            return []
+        total_puntaje = sum(c[0] for c in candidatas)
+        candidatas.sort(key=lambda c: (-c[0], len(c[3])))
+        resultado = []
+        for puntaje, total, error, combo in candidatas[:limite]:
+            conteo = {}
+            for i in combo:
+                conteo[self._ids[i]] = conteo.get(self._ids[i], 0) + 1
+            resultado.append({
+                "items": sorted(conteo.items(), key=lambda item: -item[1]),
+                "unidades": len(combo),
+                "peso_g": round(total, 1),
+                "error_g": round(error, 1),
+                "confianza": round(puntaje / total_puntaje, 3),
+            })
+        return resultado
@@ -6,6 +6,8 @@ from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 
 from api.conexion_supabase import supabase
+from app.data.cesta_matcher import CONFIANZA_MIN as CESTA_CONFIANZA_MIN
+from app.data.peso_index import peso_index
 
 # Tolerancia estándar para el match de peso (en kg)
 TOLERANCIA_PESO = 0.005  # 5 gramos - más estricto para evitar falsos positivos
@@ -15,19 +17,23 @@ def procesar_movimiento(
 	peso_total: float,
 	tipo_evento: str,
 	timestamp: datetime,
-	rut_usuario: Optional[str] = None
+	rut_usuario: Optional[str] = None,
+	direccion: Optional[int] = None
 ) -> Dict[str, Any]:
 	"""
 	Procesa un movimiento de inventario, identificando producto por peso, validando venta y marcando sospechas.
+
+	``direccion`` (-1 retiro, +1 adición) es obligatoria cuando ``peso_total``
+	llega en valor absoluto, como en los movimientos grises; si se omite se
+	deduce del signo de ``peso_total``.
 	"""
 	try:
 		# 1. Cálculo inicial
 		peso_retirado = abs(peso_total)
 		logging.info(f"[MOVIMIENTO] Peso recibido: {peso_total} kg | Peso retirado abs: {peso_retirado} kg | Estante: {id_estante}")
-		# 2. Traer todos los productos del estante
-		productos_resp = supabase.table("productos").select("*").eq("id_estante", id_estante).execute()
-		productos = productos_resp.data if hasattr(productos_resp, 'data') else productos_resp.get('data', [])
-		if not productos:
+		# 2. Buscar en el índice de pesos del estante (sin consultas por producto)
+		match = peso_index.buscar(id_estante, peso_retirado)
+		if match is None:
 			logging.warning(f"No hay productos para el estante {id_estante}")
 			return {
 				"idproducto": None,
@@ -40,42 +46,41 @@ def procesar_movimiento(
 				"motivo_sospecha": "No hay productos en estante",
 				"observacion": "No se detectó producto por peso"
 			}
-		# 3. Determinar peso_ref para cada producto
-		mejor_match = None
-		min_diff = float('inf')
-		peso_ref_elegido = None
-		idproducto_detectado = None
-		for prod in productos:
-			idprod = prod["idproducto"]
-			# Buscar último pesaje
-			pesaje_resp = supabase.table("pesajes").select("peso_unitario").eq("idproducto", idprod).order("fecha_pesaje", desc=True).limit(1).execute()
-			pesaje = pesaje_resp.data[0]["peso_unitario"] if pesaje_resp.data else prod.get("peso")
-			# Conversión automática de gramos a kilogramos si el valor es mayor a 10
-			peso_ref = pesaje / 1000 if pesaje and pesaje > 10 else pesaje
-			diff = abs(peso_retirado - peso_ref)
-			logging.info(f"[PRODUCTO] id: {idprod} | peso_ref: {peso_ref} kg | diff: {diff} kg | nombre: {prod.get('descripcion','')} | tolerancia: {TOLERANCIA_PESO}")
-			if diff < min_diff:
-				min_diff = diff
-				mejor_match = prod
-				peso_ref_elegido = peso_ref
-				idproducto_detectado = idprod
+		# 3. Mejor combinación: k unidades de un mismo producto
+		mejor_match = match["producto"]
+		peso_ref_elegido = match["peso_ref"]
+		min_diff = match["diferencia"]
+		unidades = match["unidades"]
+		idproducto_detectado = mejor_match["idproducto"]
+		logging.info(f"[PRODUCTO] id: {idproducto_detectado} | peso_ref: {peso_ref_elegido} kg | unidades: {unidades} | diff: {min_diff} kg | nombre: {mejor_match.get('descripcion','')} | tolerancia: {TOLERANCIA_PESO}")
+		identificado = min_diff <= TOLERANCIA_PESO
+		if not identificado:
+			# 3b. Cestas: varios productos distintos, con tolerancia según cantidad de unidades
+			cestas = peso_index.buscar_cesta(id_estante, peso_retirado)
+			cesta = cestas[0] if cestas and cestas[0]["confianza"] >= CESTA_CONFIANZA_MIN else None
+			if cesta and len(cesta["items"]) > 1:
+				if direccion is None:
+					direccion = -1 if peso_total < 0 else 1
+				return _resultado_cesta(cesta, direccion, cestas)
+			if cesta:
+				item = cesta["items"][0]
+				mejor_match = item["producto"]
+				peso_ref_elegido = item["peso_ref"]
+				unidades = item["cantidad"]
+				min_diff = abs(cesta["error_g"]) / 1000
+				idproducto_detectado = mejor_match["idproducto"]
+				identificado = True
 		# 4. Identificar producto usando mínima diferencia
-		if mejor_match is not None and min_diff <= TOLERANCIA_PESO:
-			logging.info(f"[MATCH] Producto detectado: {mejor_match.get('descripcion','')} | id: {idproducto_detectado} | peso_ref: {peso_ref_elegido} | diff: {min_diff}")
+		if identificado:
+			logging.info(f"[MATCH] Producto detectado: {mejor_match.get('descripcion','')} | id: {idproducto_detectado} | peso_ref: {peso_ref_elegido} | unidades: {unidades} | diff: {min_diff}")
 		else:
 			# Si la diferencia es mayor a la tolerancia, registramos como movimiento no identificado
-			if mejor_match is not None:
-				logging.warning(f"[NO MATCH] Peso detectado ({peso_retirado} kg) no coincide con ningún producto. Producto más cercano: {mejor_match.get('descripcion','')} | peso_ref: {peso_ref_elegido} | diff: {min_diff} kg (tolerancia: {TOLERANCIA_PESO} kg)")
-			else:
-				logging.warning(f"[NO MATCH] No hay productos en el estante para comparar")
+			logging.warning(f"[NO MATCH] Peso detectado ({peso_retirado} kg) no coincide con ningún producto. Producto más cercano: {mejor_match.get('descripcion','')} | peso_ref: {peso_ref_elegido} | unidades: {unidades} | diff: {min_diff} kg (tolerancia: {TOLERANCIA_PESO} kg)")
 			
 			# No hay match por peso - devolver sin producto asociado
 			# Crear motivo conciso con información del producto más cercano
-			if mejor_match:
-				nombre_prod = mejor_match.get('nombre') or mejor_match.get('descripcion', 'N/A')
-				motivo = f"Peso detectado ({peso_retirado:.3f} kg) no coincide con ningún producto registrado. Producto más cercano: {nombre_prod} ({peso_ref_elegido:.3f} kg, diff: {min_diff:.3f} kg)"
-			else:
-				motivo = "No se encontró producto con peso coincidente"
+			nombre_prod = mejor_match.get('nombre') or mejor_match.get('descripcion', 'N/A')
+			motivo = f"Peso detectado ({peso_retirado:.3f} kg) no coincide con ningún producto registrado. Producto más cercano: {nombre_prod} ({peso_ref_elegido:.3f} kg, diff: {min_diff:.3f} kg)"
 			
 			return {
 				"idproducto": None,
@@ -88,10 +93,8 @@ def procesar_movimiento(
 				"motivo_sospecha": motivo,
 				"observacion": "Producto no identificado - peso fuera de tolerancia"
 			}
-		# 5. Calcular cantidad con redondeo hacia abajo
-		cantidad_abs = floor(peso_retirado / peso_ref_elegido) if peso_ref_elegido else 1
-		if cantidad_abs < 1:
-			cantidad_abs = 1
+		# 5. Cantidad = unidades de la combinación encontrada
+		cantidad_abs = max(1, unidades)
 		signo = -1 if peso_total < 0 else 1
 		cantidad = signo * cantidad_abs
 		# 6. Validar venta si es retiro
@@ -225,6 +228,37 @@ def procesar_movimiento(
 		}
 
 
+def _resultado_cesta(cesta: Dict[str, Any], direccion: int, candidatas: list) -> Dict[str, Any]:
+	"""
+	Resultado para un retiro (``direccion`` < 0) o adición de varios productos
+	distintos. Un movimiento guarda un solo producto, así que la cesta queda
+	descrita en la observación.
+	"""
+	detalle = " + ".join(
+		f"{item['cantidad']}x {item['producto'].get('nombre') or item['producto'].get('descripcion', 'N/A')}"
+		for item in cesta["items"]
+	)
+	tipo = "RETIRO" if direccion < 0 else "ADICIÓN"
+	logging.info(f"[MATCH CESTA] {detalle} | error: {cesta['error_g']} g | confianza: {cesta['confianza']} | alternativas: {len(candidatas) - 1}")
+	signo = -1 if direccion < 0 else 1
+	return {
+		"idproducto": None,
+		"idproducto_detectado": None,
+		"cantidad": signo * cesta["unidades"],
+		"peso_por_unidad": None,
+		"match_por_peso": False,
+		"es_venta_validada": False,
+		"es_retiro_sospechoso": False,
+		"motivo_sospecha": None,
+		"observacion": f"{tipo} de varios productos: {detalle} (confianza {cesta['confianza']:.0%})",
+		"cesta": [
+			{"idproducto": item["producto"]["idproducto"], "cantidad": item["cantidad"]}
+			for item in cesta["items"]
+		],
+		"confianza": cesta["confianza"],
+	}
+
+
 # NUEVA FUNCIÓN: registrar movimiento de inventario justificado por venta
 def registrar_movimiento_por_venta(id_estante: int, idproducto: int, cantidad: int, peso_por_unidad: float, rut_usuario: str, timestamp: datetime = None):
     """
@@ -0,0 +1,350 @@
+"""
+Índice en memoria de pesos de referencia por estante.
+
+Para cada estante guarda un arreglo ordenado de ``(peso_ref_kg, idproducto)``
+construido con los productos y su último pesaje, de modo que identificar el
+producto de un movimiento es una búsqueda binaria (``bisect``) sin consultas.
+Los pesajes nuevos se incorporan por high-water mark de ``fecha_pesaje`` cada
+``PESO_INDEX_TTL`` segundos; las ediciones de productos avisan con
+``actualizar_producto``. Cada ``PESO_INDEX_REBUILD_SECONDS`` se reconstruye
+completo por si hubo cambios hechos fuera de la aplicación.
+"""
+from bisect import bisect_left
+import logging
+import os
+import threading
+import time
+
+from api.conexion_supabase import supabase
+from app.data.cesta_matcher import TablaCestas
+
+logger = logging.getLogger(__name__)
+
+_TTL_SECONDS = float(os.getenv("PESO_INDEX_TTL", "30"))
+_REBUILD_SECONDS = float(os.getenv("PESO_INDEX_REBUILD_SECONDS", "600"))
+MAX_UNIDADES = int(os.getenv("PESO_INDEX_MAX_UNIDADES", "10"))
+
+_COLUMNAS_PRODUCTO = "idproducto,id_estante,nombre,descripcion,peso"
+_PAGE_SIZE = 1000
+
+
+def peso_referencia(pesaje, producto=None):
+    """Peso unitario en kg: último pesaje o, si no hay, el peso del producto.
+
+    Los valores mayores a 10 se asumen en gramos (misma regla que usaba
+    ``procesar_movimiento``).
+    """
+    valor = pesaje if pesaje is not None else (producto or {}).get("peso")
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return None
+    if valor <= 0:
+        return None
+    return valor / 1000 if valor > 10 else valor
+
+
+class _Estante:
+    """Pesos de referencia ordenados de un estante, listos para bisect."""
+
+    __slots__ = ("pesos", "ids")
+
+    def __init__(self, pares):
+        pares = sorted(pares)
+        self.pesos = [p for p, _ in pares]
+        self.ids = [i for _, i in pares]
+
+    def cercano(self, peso):
+        """``(indice, diferencia)`` del peso de referencia más cercano a ``peso``."""
+        if not self.pesos:
+            return None, float("inf")
+        pos = bisect_left(self.pesos, peso)
+        mejor, mejor_diff = None, float("inf")
+        for i in (pos - 1, pos):
+            if 0 <= i < len(self.pesos):
+                diff = abs(self.pesos[i] - peso)
+                if diff < mejor_diff:
+                    mejor, mejor_diff = i, diff
+        return mejor, mejor_diff
+
+
+class PesoIndex:
+    """Índice estante -> pesos de referencia de sus productos."""
+
+    def __init__(self, client=None, ttl=_TTL_SECONDS, rebuild_seconds=_REBUILD_SECONDS):
+        self._client = client or supabase
+        self._ttl = float(ttl)
+        self._rebuild_seconds = float(rebuild_seconds)
+        self._lock = threading.RLock()
+        self._productos = {}
+        self._pesajes = {}
+        self._estantes = {}
+        self._cestas = {}
+        self._ultima_fecha_pesaje = None
+        self._construido_en = None
+        self._sincronizado_en = None
+        # Reconstrucción en curso: (Event, [error]) compartido por quienes la esperan
+        self._reconstruccion = None
+
+    # ------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------
+    def productos_estante(self, id_estante):
+        """Productos del estante con su ``peso_ref`` (kg), ordenados por peso."""
+        self._asegurar()
+        with self._lock:
+            estante = self._estantes.get(int(id_estante))
+            if estante is None:
+                return []
+            return [
+                {**self._productos[i], "peso_ref": p}
+                for p, i in zip(estante.pesos, estante.ids)
+            ]
+
+    def buscar(self, id_estante, peso, max_unidades=None):
+        """Mejor combinación de ``k`` unidades de un mismo producto para ``peso`` (kg).
+
+        Para cada ``k`` busca por bisect el peso de referencia más cercano a
+        ``peso / k``; gana la menor diferencia absoluta ``|peso - k * ref|`` y,
+        a igual diferencia, la menor cantidad de unidades. Devuelve
+        ``{"producto", "peso_ref", "unidades", "diferencia"}`` o None si el
+        estante no tiene productos con peso.
+        """
+        self._asegurar()
+        max_unidades = max(1, int(max_unidades or MAX_UNIDADES))
+        peso = abs(float(peso))
+        with self._lock:
+            estante = self._estantes.get(int(id_estante))
+            if estante is None or not estante.pesos:
+                return None
+            mejor = None
+            for k in range(1, max_unidades + 1):
+                i, _ = estante.cercano(peso / k)
+                diff = abs(peso - k * estante.pesos[i])
+                if mejor is None or diff < mejor[2] - 1e-12:
+                    mejor = (i, k, diff)
+            i, k, diff = mejor
+            return {
+                "producto": dict(self._productos[estante.ids[i]]),
+                "peso_ref": estante.pesos[i],
+                "unidades": k,
+                "diferencia": diff,
+            }
+
+    def buscar_cesta(self, id_estante, peso, limite=None):
+        """Cestas de varios productos compatibles con ``peso`` (kg), por confianza.
+
+        La tabla de sumas alcanzables del estante se construye la primera vez
+        que se consulta y se descarta cuando cambian sus pesos de referencia.
+        """
+        self._asegurar()
+        with self._lock:
+            id_estante = int(id_estante)
+            estante = self._estantes.get(id_estante)
+            if estante is None or not estante.pesos:
+                return []
+            tabla = self._cestas.get(id_estante)
+            if tabla is None:
+                tabla = self._cestas[id_estante] = TablaCestas(estante.pesos, estante.ids)
+            candidatas = tabla.buscar(peso, **({"limite": limite} if limite else {}))
+            pesos_ref = dict(zip(estante.ids, estante.pesos))
+            for candidata in candidatas:
+                candidata["items"] = [
+                    {"producto": dict(self._productos[idproducto]), "cantidad": cantidad, "peso_ref": pesos_ref[idproducto]}
+                    for idproducto, cantidad in candidata["items"]
+                ]
+            return candidatas
+
+    def estado(self):
+        with self._lock:
+            return {
+                "productos": len(self._productos),
+                "estantes": {k: len(v.pesos) for k, v in self._estantes.items()},
+                "tablas_cestas": {k: v.total_cestas for k, v in self._cestas.items()},
+                "ultima_fecha_pesaje": self._ultima_fecha_pesaje,
+                "construido_en": self._construido_en,
+                "sincronizado_en": self._sincronizado_en,
+            }
+
+    # ------------------------------------------------------------
+    # Mantenimiento
+    # ------------------------------------------------------------
+    def refresh(self):
+        """Reconstrucción completa: productos + último pesaje de cada uno."""
+        productos = []
+        desde = 0
+        # Paginado: PostgREST corta cada respuesta en 1000 filas
+        while True:
+            filas = (
+                self._client.table("productos")
+                .select(_COLUMNAS_PRODUCTO)
+                .order("idproducto")
+                .range(desde, desde + _PAGE_SIZE - 1)
+                .execute()
+                .data or []
+            )
+            productos.extend(filas)
+            if len(filas) < _PAGE_SIZE:
+                break
+            desde += _PAGE_SIZE
+
+        pesajes = {}
+        ultima_fecha = None
+        # Pesajes más recientes primero: el primero de cada producto es el vigente
+        desde = 0
+        while True:
+            filas = (
+                self._client.table("pesajes")
+                .select("idproducto,peso_unitario,fecha_pesaje")
+                .order("fecha_pesaje", desc=True)
+                .range(desde, desde + _PAGE_SIZE - 1)
+                .execute()
+                .data or []
+            )
+            for fila in filas:
+                if ultima_fecha is None:
+                    ultima_fecha = fila.get("fecha_pesaje")
+                pesajes.setdefault(fila.get("idproducto"), fila.get("peso_unitario"))
+            if len(filas) < _PAGE_SIZE:
+                break
+            desde += _PAGE_SIZE
+
+        with self._lock:
+            self._productos = {p["idproducto"]: p for p in productos if p.get("idproducto") is not None}
+            self._pesajes = pesajes
+            self._ultima_fecha_pesaje = ultima_fecha
+            self._reindexar()
+            self._construido_en = self._sincronizado_en = time.monotonic()
+        logger.info(f"[PESO INDEX] {len(self._productos)} productos indexados en {len(self._estantes)} estantes")
+
+    def sincronizar_pesajes(self):
+        """Incorpora los pesajes posteriores al último visto (una consulta)."""
+        with self._lock:
+            desde = self._ultima_fecha_pesaje
+        consulta = self._client.table("pesajes").select("idproducto,peso_unitario,fecha_pesaje")
+        if desde is not None:
+            consulta = consulta.gt("fecha_pesaje", desde)
+        filas = consulta.order("fecha_pesaje").execute().data or []
+
+        with self._lock:
+            afectados = set()
+            for fila in filas:
+                self._pesajes[fila.get("idproducto")] = fila.get("peso_unitario")
+                self._ultima_fecha_pesaje = fila.get("fecha_pesaje") or self._ultima_fecha_pesaje
+                afectados.add(fila.get("idproducto"))
+            if afectados & self._productos.keys():
+                self._reindexar()
+            self._sincronizado_en = time.monotonic()
+        return len(filas)
+
+    def actualizar_producto(self, idproducto):
+        """Recarga un producto (alta, edición o baja) y su último pesaje."""
+        try:
+            filas = (
+                self._client.table("productos")
+                .select(_COLUMNAS_PRODUCTO)
+                .eq("idproducto", idproducto)
+                .execute()
+                .data or []
+            )
+            pesaje = (
+                self._client.table("pesajes")
+                .select("peso_unitario")
+                .eq("idproducto", idproducto)
+                .order("fecha_pesaje", desc=True)
+                .limit(1)
+                .execute()
+                .data or []
+            )
+        except Exception as e:
+            # Sin datos frescos: que la próxima consulta reconstruya todo
+            logger.warning(f"[PESO INDEX] No se pudo recargar el producto {idproducto}: {e}")
+            self.invalidate()
+            return
+
+        with self._lock:
+            if filas:
+                self._productos[idproducto] = filas[0]
+            else:
+                self._productos.pop(idproducto, None)
+            if pesaje:
+                self._pesajes[idproducto] = pesaje[0].get("peso_unitario")
+            self._reindexar()
+
+    def invalidate(self):
+        with self._lock:
+            self._construido_en = None
+
+    # ------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------
+    def _asegurar(self):
+        ahora = time.monotonic()
+        with self._lock:
+            construido, sincronizado = self._construido_en, self._sincronizado_en
+        if construido is None or ahora - construido >= self._rebuild_seconds:
+            self._reconstruir_una_vez(esperar=construido is None)
+        elif ahora - sincronizado >= self._ttl:
+            try:
+                self.sincronizar_pesajes()
+            except Exception as e:
+                # Un fallo transitorio no impide clasificar con el índice vigente
+                logger.warning(f"[PESO INDEX] Error sincronizando pesajes: {e}")
+
+    def _reconstruir_una_vez(self, esperar):
+        """``refresh`` con una sola reconstrucción en curso por proceso.
+
+        Quien llega mientras otro reconstruye espera solo si no hay índice
+        (``esperar``); con un índice vencido sigue usándolo. Si la
+        reconstrucción de un índice vencido falla, se conserva el anterior y se
+        reintenta tras ``PESO_INDEX_TTL`` segundos.
+        """
+        with self._lock:
+            en_curso = self._reconstruccion
+            if en_curso is None:
+                en_curso = self._reconstruccion = (threading.Event(), [])
+                propietario = True
+            else:
+                propietario = False
+
+        if not propietario:
+            listo, errores = en_curso
+            if esperar:
+                listo.wait()
+                if errores:
+                    raise errores[0]
+            return
+
+        listo, errores = en_curso
+        try:
+            self.refresh()
+        except Exception as e:
+            if esperar:
+                errores.append(e)
+                raise
+            logger.warning(f"[PESO INDEX] Error reconstruyendo índice, se usa el vigente: {e}")
+            with self._lock:
+                if self._construido_en is not None:
+                    # Próximo intento en un TTL, no en cada consulta
+                    self._construido_en = time.monotonic() - self._rebuild_seconds + self._ttl
+        finally:
+            with self._lock:
+                self._reconstruccion = None
+            listo.set()
+
+    def _reindexar(self):
+        # Se llama con self._lock tomado
+        pares_por_estante = {}
+        for idproducto, producto in self._productos.items():
+            id_estante = producto.get("id_estante")
+            if id_estante is None:
+                continue
+            peso_ref = peso_referencia(self._pesajes.get(idproducto), producto)
+            if peso_ref is None:
+                continue
+            pares_por_estante.setdefault(int(id_estante), []).append((peso_ref, idproducto))
+        self._estantes = {k: _Estante(v) for k, v in pares_por_estante.items()}
+        self._cestas = {}
+
+
+peso_index = PesoIndex()
@@ -0,0 +1,205 @@
+"""
+Registro de ventas.
+
+``registrar_venta`` llama al procedimiento ``registrar_venta`` de Postgres
+(``migrations/ventas_registrar_venta.sql``): en una sola transacción crea la
+venta, valida y descuenta el stock de todo el carrito, inserta los detalles y
+concilia los retiros pendientes. Es un viaje a la BD por venta, sin importar
+cuántos productos lleve, y dos ventas simultáneas no pueden sobrevender.
+
+Si la migración todavía no se aplicó se usa el registro por pasos anterior
+(sin atomicidad), con las lecturas de productos y retiros agrupadas.
+"""
+from datetime import datetime, timedelta
+import json
+import logging
+
+from api.conexion_supabase import supabase
+
+try:
+    from postgrest.exceptions import APIError
+except ImportError:  # pragma: no cover - versiones antiguas del cliente
+    APIError = Exception
+
+logger = logging.getLogger(__name__)
+
+RPC_REGISTRAR_VENTA = "registrar_venta"
+VENTANA_EMPAREJAMIENTO = timedelta(minutes=5)
+
+# PostgREST responde PGRST202 cuando la función no existe en el esquema
+_FUNCION_INEXISTENTE = "PGRST202"
+
+_rpc_disponible = True
+
+
+class VentaRechazada(Exception):
+    """La venta no se registró por un problema de los datos (respuesta 400)."""
+
+
+def normalizar_items(productos):
+    """Valida las líneas del carrito y las deja con tipos numéricos."""
+    if not productos:
+        raise VentaRechazada("Debe agregar al menos un producto")
+    items = []
+    for producto in productos:
+        try:
+            item = {
+                "idproducto": int(producto["idproducto"]),
+                "cantidad": int(producto["cantidad"]),
+                "precio_unitario": float(producto["precio_unitario"]),
+            }
+        except (KeyError, TypeError, ValueError):
+            raise VentaRechazada("Producto con datos incompletos o inválidos")
+        if item["cantidad"] <= 0:
+            raise VentaRechazada(f"Cantidad inválida para el producto ID {item['idproducto']}")
+        if item["precio_unitario"] < 0:
+            raise VentaRechazada(f"Precio inválido para el producto ID {item['idproducto']}")
+        items.append(item)
+    return items
+
+
+def _mensaje_rechazo(error):
+    """Traduce los errores de negocio del procedimiento; None si no es uno de ellos."""
+    try:
+        detalle = json.loads(getattr(error, "details", None) or "{}")
+    except (TypeError, ValueError):
+        detalle = {}
+    motivo = getattr(error, "message", "")
+    if motivo == "stock_insuficiente":
+        return (
+            f"Stock insuficiente para el producto ID {detalle.get('idproducto')}. "
+            f"Disponible: {detalle.get('disponible')}, Solicitado: {detalle.get('solicitado')}"
+        )
+    if motivo == "producto_inexistente":
+        return f"El producto ID {detalle.get('idproducto')} no existe"
+    if motivo == "venta_vacia":
+        return "Debe agregar al menos un producto"
+    return None
+
+
+def registrar_venta(rut_usuario, productos, fecha=None):
+    """
+    Registra la venta completa y devuelve
+    ``{"id_venta", "total", "retiros_emparejados", "ventas_pendientes"}``.
+
+    Lanza ``VentaRechazada`` si un producto no existe o no tiene stock; en ese
+    caso no se escribe nada.
+    """
+    global _rpc_disponible
+    items = normalizar_items(productos)
+    fecha = fecha or datetime.now()
+
+    if _rpc_disponible:
+        try:
+            respuesta = supabase.rpc(RPC_REGISTRAR_VENTA, {
+                "p_rut_usuario": rut_usuario,
+                "p_items": items,
+                "p_fecha": fecha.isoformat(),
+            }).execute()
+        except APIError as e:
+            mensaje = _mensaje_rechazo(e)
+            if mensaje:
+                raise VentaRechazada(mensaje)
+            if getattr(e, "code", None) != _FUNCION_INEXISTENTE:
+                raise
+            _rpc_disponible = False
+            logger.warning("[VENTAS] Falta la función registrar_venta; aplicar migrations/ventas_registrar_venta.sql")
+        else:
+            resultado = respuesta.data or {}
+            return {
+                "id_venta": resultado.get("idventa"),
+                "total": float(resultado.get("total") or 0),
+                "retiros_emparejados": resultado.get("retiros_emparejados", 0),
+                "ventas_pendientes": resultado.get("ventas_pendientes", 0),
+            }
+
+    return _registrar_venta_por_pasos(rut_usuario, items, fecha)
+
+
+def _registrar_venta_por_pasos(rut_usuario, items, fecha):
+    """Registro sin el procedimiento: una lectura de productos y una de retiros para todo el carrito."""
+    ids = sorted({item["idproducto"] for item in items})
+    productos = {
+        p["idproducto"]: p
+        for p in supabase.table("productos").select("idproducto, id_estante, stock, peso").in_("idproducto", ids).execute().data or []
+    }
+
+    solicitado = {}
+    for item in items:
+        solicitado[item["idproducto"]] = solicitado.get(item["idproducto"], 0) + item["cantidad"]
+    for idproducto in ids:
+        producto = productos.get(idproducto)
+        if producto is None:
+            raise VentaRechazada(f"El producto ID {idproducto} no existe")
+        disponible = producto.get("stock") or 0
+        if disponible < solicitado[idproducto]:
+            raise VentaRechazada(
+                f"Stock insuficiente para el producto ID {idproducto}. "
+                f"Disponible: {disponible}, Solicitado: {solicitado[idproducto]}"
+            )
+
+    total = sum(item["cantidad"] * item["precio_unitario"] for item in items)
+    venta = supabase.table("ventas").insert({
+        "rut_usuario": rut_usuario,
+        "fecha_venta": fecha.isoformat(),
+        "total": total,
+    }).execute().data
+    if not venta:
+        raise RuntimeError("Error al crear la venta")
+    id_venta = venta[0]["idventa"]
+
+    # Detalle de venta (sin subtotal, es columna generada automáticamente)
+    supabase.table("detalle_ventas").insert([
+        {"idventa": id_venta, **item} for item in items
+    ]).execute()
+
+    for idproducto in ids:
+        supabase.table("productos").update({
+            "stock": (productos[idproducto].get("stock") or 0) - solicitado[idproducto],
+            "fecha_modificacion": fecha.isoformat(),
+            "modificado_por": rut_usuario,
+        }).eq("idproducto", idproducto).execute()
+
+    retiros = supabase.table("movimientos_inventario").select("id_movimiento, idproducto").in_(
+        "idproducto", ids
+    ).eq("tipo_evento", "Retirar").eq("es_venta_validada", False).gte(
+        "timestamp", (fecha - VENTANA_EMPAREJAMIENTO).isoformat()
+    ).lte("timestamp", (fecha + VENTANA_EMPAREJAMIENTO).isoformat()).execute().data or []
+
+    if retiros:
+        supabase.table("movimientos_inventario").update({
+            "es_venta_validada": True,
+            "motivo_sospecha": None,
+            "observacion": f"Emparejado con venta #{id_venta}",
+        }).in_("id_movimiento", [r["id_movimiento"] for r in retiros]).execute()
+
+    con_retiro = {r["idproducto"] for r in retiros}
+    pendientes = []
+    for idproducto in ids:
+        if idproducto in con_retiro:
+            continue
+        producto = productos[idproducto]
+        peso_kg = (producto.get("peso") or 0) / 1000  # Peso en GRAMOS desde BD
+        pendientes.append({
+            "tipo_evento": "VentaPendiente",
+            "idproducto": idproducto,
+            "id_estante": producto.get("id_estante"),
+            "cantidad": solicitado[idproducto],
+            "peso_por_unidad": peso_kg,
+            "peso_total": solicitado[idproducto] * peso_kg,
+            "rut_usuario": rut_usuario,
+            "timestamp": fecha.isoformat(),
+            "observacion": f"Venta #{id_venta} pendiente de retiro",
+        })
+    if pendientes:
+        try:
+            supabase.table("movimientos_inventario").insert(pendientes).execute()
+        except Exception as e:
+            logger.warning(f"[VENTAS] No se registraron ventas pendientes de retiro: {e}")  # No crítico
+
+    return {
+        "id_venta": id_venta,
+        "total": total,
+        "retiros_emparejados": len(retiros),
+        "ventas_pendientes": len(pendientes),
+    }
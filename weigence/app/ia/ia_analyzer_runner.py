@@ -0,0 +1,217 @@
+"""Concurrent runner with per-analyzer TTL cache for the advanced ML insights."""
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import contextvars
+from dataclasses import dataclass, field
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_WORKERS = int(os.getenv("IA_ANALYZER_WORKERS", "6"))
+_TIMEOUT_SECONDS = float(os.getenv("IA_ANALYZER_TIMEOUT", "4"))
+
+# TTL por analizador (segundos): las ventanas largas no cambian en pocos segundos
+ANALYZER_TTLS: Dict[str, float] = {
+    "dashboard_rankings": float(os.getenv("IA_ANALYZER_TTL_RANKINGS", "300")),
+    "inventory_capacity": float(os.getenv("IA_ANALYZER_TTL_INVENTARIO", "60")),
+    "unjustified_movements": float(os.getenv("IA_ANALYZER_TTL_MOVIMIENTOS", "60")),
+    "sales_comparison_48h": float(os.getenv("IA_ANALYZER_TTL_VENTAS", "300")),
+    "critical_alerts_resolution": float(os.getenv("IA_ANALYZER_TTL_ALERTAS", "30")),
+    "audit_anomalies": float(os.getenv("IA_ANALYZER_TTL_AUDITORIA", "120")),
+}
+
+
+class AnalizadorSinResultado(KeyError):
+    """El analizador no respondió a tiempo y no hay un valor previo en caché."""
+
+
+@dataclass
+class _Analyzer:
+    """Analizador registrado, su último resultado y la ejecución en curso."""
+
+    nombre: str
+    funcion: Callable[[], Any]
+    ttl: float
+    valor: Any = None
+    calculado_en: Optional[float] = None
+    en_curso: Optional[Future] = None
+    ejecuciones: int = 0
+    aciertos: int = 0
+    timeouts: int = 0
+    errores: int = 0
+    ultima_duracion_ms: Optional[float] = None
+
+    def vigente(self, ahora: float) -> bool:
+        return self.calculado_en is not None and ahora - self.calculado_en < self.ttl
+
+
+@dataclass
+class AnalyzerResults:
+    """Resultados de una vuelta.
+
+    Los analizadores que fallaron sin valor previo quedan en ``errores`` con su
+    excepción; los que no alcanzaron a responder, en ``faltantes``.
+    """
+
+    valores: Dict[str, Any] = field(default_factory=dict)
+    faltantes: List[str] = field(default_factory=list)
+    vencidos: List[str] = field(default_factory=list)
+    errores: Dict[str, BaseException] = field(default_factory=dict)
+    duracion_ms: float = 0.0
+
+    def get(self, nombre: str) -> Any:
+        """Valor del analizador; relanza su error o ``AnalizadorSinResultado`` si no alcanzó a responder."""
+
+        if nombre in self.errores:
+            raise self.errores[nombre]
+        if nombre not in self.valores:
+            raise AnalizadorSinResultado(nombre)
+        return self.valores[nombre]
+
+
+class AnalyzerRunner:
+    """Runs registered analyzers concurrently, each cached with its own TTL.
+
+    A cache miss launches the analyzer on the pool and waits at most
+    ``timeout`` seconds for the whole round. An analyzer that misses the
+    deadline keeps running and stores its result for the next round; meanwhile
+    its previous (expired) value is returned if there is one. The same applies
+    to an analyzer that raised; without a previous value its exception is
+    handed back through ``AnalyzerResults.get``. At most one run per analyzer
+    is in flight at any time.
+    """
+
+    def __init__(self, *, workers: int = _WORKERS, timeout: float = _TIMEOUT_SECONDS) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ia-analyzer")
+        self._timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._analyzers: Dict[str, _Analyzer] = {}
+
+    def register(self, nombre: str, funcion: Callable[[], Any], ttl: float) -> None:
+        """Registra (o reemplaza) un analizador; descarta su valor cacheado."""
+
+        with self._lock:
+            self._analyzers[nombre] = _Analyzer(nombre=nombre, funcion=funcion, ttl=float(ttl))
+
+    def run(self, nombres: Optional[Iterable[str]] = None, *, timeout: Optional[float] = None) -> AnalyzerResults:
+        """Resultados de ``nombres`` (todos por defecto) en a lo sumo ``timeout`` segundos."""
+
+        inicio = time.perf_counter()
+        timeout = self._timeout if timeout is None else float(timeout)
+        resultado = AnalyzerResults()
+        pendientes: Dict[str, Future] = {}
+
+        with self._lock:
+            ahora = time.monotonic()
+            seleccion = list(self._analyzers) if nombres is None else list(nombres)
+            for nombre in seleccion:
+                analyzer = self._analyzers[nombre]
+                if analyzer.vigente(ahora):
+                    analyzer.aciertos += 1
+                    resultado.valores[nombre] = analyzer.valor
+                    continue
+                if analyzer.en_curso is None:
+                    # copy_context: las consultas cuentan en el perfil del request que las lanzó
+                    analyzer.en_curso = self._pool.submit(
+                        contextvars.copy_context().run, self._ejecutar, analyzer
+                    )
+                pendientes[nombre] = analyzer.en_curso
+
+        if pendientes:
+            wait(pendientes.values(), timeout=timeout)
+
+        with self._lock:
+            for nombre, future in pendientes.items():
+                analyzer = self._analyzers[nombre]
+                if future.done() and future.exception() is None:
+                    resultado.valores[nombre] = future.result()
+                    continue
+                if not future.done():
+                    analyzer.timeouts += 1
+                    logger.warning("[IA] Analizador %s sin respuesta en %.1fs", nombre, timeout)
+                if analyzer.calculado_en is not None:
+                    resultado.valores[nombre] = analyzer.valor
+                    resultado.vencidos.append(nombre)
+                elif future.done():
+                    resultado.errores[nombre] = future.exception()
+                else:
+                    resultado.faltantes.append(nombre)
+
+        resultado.duracion_ms = (time.perf_counter() - inicio) * 1000.0
+        return resultado
+
+    def invalidate(self, nombre: Optional[str] = None) -> None:
+        """Descarta el valor de un analizador (o de todos); se recalcula en la próxima vuelta."""
+
+        with self._lock:
+            for analyzer in self._analyzers.values():
+                if nombre is None or analyzer.nombre == nombre:
+                    analyzer.calculado_en = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ahora = time.monotonic()
+            return {
+                "timeout_seconds": self._timeout,
+                "analizadores": [
+                    {
+                        "nombre": a.nombre,
+                        "ttl_seconds": a.ttl,
+                        "age_seconds": round(ahora - a.calculado_en, 3) if a.calculado_en is not None else None,
+                        "vigente": a.vigente(ahora),
+                        "en_curso": a.en_curso is not None,
+                        "ejecuciones": a.ejecuciones,
+                        "aciertos": a.aciertos,
+                        "timeouts": a.timeouts,
+                        "errores": a.errores,
+                        "ultima_duracion_ms": a.ultima_duracion_ms,
+                    }
+                    for a in self._analyzers.values()
+                ],
+            }
+
+    def _ejecutar(self, analyzer: _Analyzer) -> Any:
+        inicio = time.perf_counter()
+        try:
+            valor = analyzer.funcion()
+        except Exception:
+            logger.exception("[IA] Error en analizador %s", analyzer.nombre)
+            with self._lock:
+                analyzer.errores += 1
+                analyzer.en_curso = None
+            raise
+        with self._lock:
+            analyzer.valor = valor
+            analyzer.calculado_en = time.monotonic()
+            analyzer.ejecuciones += 1
+            analyzer.ultima_duracion_ms = round((time.perf_counter() - inicio) * 1000.0, 1)
+            analyzer.en_curso = None
+        return valor
+
+
+_runner: Optional[AnalyzerRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_analyzer_runner() -> AnalyzerRunner:
+    """Runner con los seis analizadores de ``AdvancedMLInsights`` registrados."""
+
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            from .ia_ml_insights_advanced import get_advanced_insights
+
+            insights = get_advanced_insights()
+            runner = AnalyzerRunner()
+            for nombre, ttl in ANALYZER_TTLS.items():
+                runner.register(nombre, getattr(insights, f"analyze_{nombre}"), ttl)
+            _runner = runner
+        return _runner
+
+
+__all__ = ["ANALYZER_TTLS", "AnalizadorSinResultado", "AnalyzerResults", "AnalyzerRunner", "get_analyzer_runner"]
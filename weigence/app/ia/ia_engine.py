@@ -1,12 +1,21 @@
 """Modular IA engine with configurable rules and scoring."""
 from __future__ import annotations
 
+from datetime import datetime
+import hashlib
 import json
 import logging
+import os
+import tempfile
+import threading
+import time
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional
 
+import numpy as np
+
+from .ia_rule_plan import METRIC_NAMES, CompiledProfile, PlanResult, compile_profile
 from .ia_snapshots import IASnapshot
 
 logger = logging.getLogger(__name__)
@@ -68,58 +77,387 @@ class ConfigLoader:
         return json.loads(contenido)
 
 
+_WATCH_ENABLED = os.getenv("IA_ENGINE_WATCH", "1").lower() not in ("0", "false", "no")
+_CHECK_INTERVAL_SECONDS = float(os.getenv("IA_ENGINE_CHECK_INTERVAL", "5"))
+_DIRECTIONS = {"above", "below", "between"}
+
+
+class ConfigInvalida(ValueError):
+    """La configuración no pasó la validación; la vigente sigue activa."""
+
+
+@dataclass(frozen=True)
+class EngineConfig:
+    """Validated and compiled ``ia_engine.json``; replaced as a whole on reload."""
+
+    profiles: Dict[str, dict]
+    templates: Dict[str, dict]
+    thresholds: Dict[str, float]
+    plans: Dict[str, CompiledProfile]
+    source: str
+    sha256: str
+    loaded_at: str
+    warnings: List[str] = field(default_factory=list)
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "source": self.source,
+            "sha256": self.sha256[:12],
+            "loaded_at": self.loaded_at,
+            "profiles": {nombre: len(plan.rules) for nombre, plan in self.plans.items()},
+            "warnings": list(self.warnings),
+        }
+
+
+@dataclass
+class ShadowStats:
+    """Score differences of the shadow config against the live one for a context."""
+
+    evaluaciones: int = 0
+    suma_delta: float = 0.0
+    suma_abs_delta: float = 0.0
+    max_abs_delta: float = 0.0
+    cambios_regla: int = 0
+    cambios_severidad: int = 0
+
+    def registrar(self, delta: float, cambia_regla: bool, cambia_severidad: bool) -> None:
+        self.evaluaciones += 1
+        self.suma_delta += delta
+        self.suma_abs_delta += abs(delta)
+        self.max_abs_delta = max(self.max_abs_delta, abs(delta))
+        self.cambios_regla += int(cambia_regla)
+        self.cambios_severidad += int(cambia_severidad)
+
+    def to_dict(self) -> Dict[str, object]:
+        n = max(self.evaluaciones, 1)
+        return {
+            "evaluaciones": self.evaluaciones,
+            "delta_promedio": round(self.suma_delta / n, 4),
+            "delta_abs_promedio": round(self.suma_abs_delta / n, 4),
+            "max_abs_delta": round(self.max_abs_delta, 4),
+            "cambios_regla": self.cambios_regla,
+            "cambios_severidad": self.cambios_severidad,
+        }
+
+
+def _escribir_atomico(path: Path, contenido: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(contenido)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
 class IAEngine:
-    """Evaluates configurable rules against IASnapshot metrics."""
+    """Evaluates configurable rules against IASnapshot metrics.
+
+    Everything ``evaluate`` reads comes from a single :class:`EngineConfig`, so
+    a reload is one reference swap: in-flight evaluations finish with the old
+    config and never see a half-loaded one. The JSON file is polled (at most
+    every ``check_interval`` seconds) and reloaded in every worker when it
+    changes. An ``<nombre>.shadow.json`` next to it is evaluated alongside the
+    live config, recording score deltas per context without affecting results.
+    """
 
     _DEFAULT_THRESHOLDS = {"warning": 0.45, "critical": 0.7}
 
-    def __init__(self, config_path: Optional[Path] = None) -> None:
+    def __init__(
+        self,
+        config_path: Optional[Path] = None,
+        *,
+        watch: bool = _WATCH_ENABLED,
+        check_interval: float = _CHECK_INTERVAL_SECONDS,
+    ) -> None:
         base_path = Path(__file__).resolve().parent / "config" / "ia_engine.json"
-        self._config_path = config_path or base_path
-        raw_config = ConfigLoader(self._config_path).load()
-        self._profiles: Dict[str, dict] = raw_config.get("profiles", {})  # type: ignore[assignment]
-        self._templates: Dict[str, dict] = raw_config.get("templates", {})  # type: ignore[assignment]
-        self._thresholds = {
-            **self._DEFAULT_THRESHOLDS,
-            **raw_config.get("score_thresholds", {}),  # type: ignore[arg-type]
-        }
-
-        if not self._profiles:
-            raise ValueError("La configuración del motor IA no define perfiles.")
+        self._config_path = Path(config_path or base_path)
+        self._shadow_path = self._config_path.with_name(f"{self._config_path.stem}.shadow.json")
+        self._watch = watch
+        self._check_interval = float(check_interval)
+        self._reload_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._last_check = time.monotonic()
+
+        self._firma_config = self._firma(self._config_path)
+        self._config: EngineConfig = self._cargar(self._config_path)
+
+        self._shadow: Optional[EngineConfig] = None
+        self._shadow_stats: Dict[str, ShadowStats] = {}
+        self._firma_shadow = self._firma(self._shadow_path)
+        if self._firma_shadow is not None:
+            self._recargar_shadow()
 
     @property
     def templates(self) -> Dict[str, dict]:
-        return self._templates
+        return self._config.templates
+
+    @property
+    def profiles(self) -> Dict[str, CompiledProfile]:
+        return self._config.plans
+
+    def evaluate(self, snapshot: IASnapshot, *, profile: str, contexto: Optional[str] = None) -> EngineInsight:
+        self.maybe_reload()
+        plan = self._resolver_plan(self._config, profile)
+        profile = plan.name
+
+        metricas = self._extraer_metricas(snapshot)
+        mejor, totales, scores, severidad = plan.evaluate_one(metricas)
+
+        if mejor < 0:
+            insight = self._fallback(plan.config, metricas, snapshot, profile)
+        else:
+            insight = self._armar_insight(plan, mejor, totales[mejor], scores, severidad, metricas, snapshot)
+
+        shadow = self._shadow
+        if shadow is not None:
+            self._evaluar_shadow(shadow, profile, metricas, insight, contexto or profile)
+        return insight
+
+    def evaluate_batch(self, matriz: np.ndarray, *, profile: str) -> PlanResult:
+        """Evalúa un perfil sobre N filas de métricas (ver ``metric_matrix_from_records``).
+
+        Sirve para reproducir cambios de reglas sobre el histórico de snapshots.
+        """
+
+        return self._resolver_plan(self._config, profile).evaluate_matrix(matriz)
 
-    def evaluate(self, snapshot: IASnapshot, *, profile: str) -> EngineInsight:
-        perfil_cfg = self._profiles.get(profile)
-        if not perfil_cfg:
+    def _resolver_plan(self, config: EngineConfig, profile: str) -> CompiledProfile:
+        plan = config.plans.get(profile)
+        if plan is None:
             logger.warning(
                 "[IAEngine] Perfil '%s' no encontrado, usando perfil_operativo por defecto",
                 profile,
             )
-            perfil_cfg = self._profiles.get("perfil_operativo", next(iter(self._profiles.values())))
-            profile = "perfil_operativo"
+            plan = config.plans.get("perfil_operativo", next(iter(config.plans.values())))
+        return plan
 
-        metricas = self._extraer_metricas(snapshot)
-        reglas = [self._parse_regla(item) for item in perfil_cfg.get("rules", [])]
-
-        mejor: Optional[EngineInsight] = None
-        for regla in reglas:
-            evaluacion = self._evaluar_regla(regla, metricas, snapshot, profile)
-            if not evaluacion:
-                continue
-            if mejor is None or evaluacion.score > mejor.score:
-                mejor = evaluacion
-
-        if mejor is None:
-            return self._fallback(perfil_cfg, metricas, snapshot, profile)
+    # ------------------------------------------------------------------
+    # Recarga y modo sombra
+    # ------------------------------------------------------------------
+    def maybe_reload(self) -> None:
+        """Recarga la configuración (y la sombra) si su archivo cambió desde la última revisión."""
+
+        if not self._watch or time.monotonic() - self._last_check < self._check_interval:
+            return
+        # Un solo request por worker revisa los archivos; el resto sigue con la config vigente
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            firma = self._firma(self._config_path)
+            if firma != self._firma_config:
+                self._firma_config = firma  # Un archivo inválido no se reintenta hasta que vuelva a cambiar
+                try:
+                    self._activar(self._cargar(self._config_path))
+                except (ConfigInvalida, OSError) as exc:
+                    logger.error("[IAEngine] Configuración rechazada, se mantiene la vigente: %s", exc)
+            firma = self._firma(self._shadow_path)
+            if firma != self._firma_shadow:
+                self._firma_shadow = firma
+                self._recargar_shadow()
+        finally:
+            self._reload_lock.release()
+
+    def reload(self) -> Dict[str, object]:
+        """Valida y activa el archivo de configuración; lanza ``ConfigInvalida`` sin tocar la vigente."""
+
+        with self._reload_lock:
+            firma = self._firma(self._config_path)
+            nueva = self._cargar(self._config_path)
+            self._firma_config = firma
+            anterior = self._activar(nueva)
+        return {**nueva.describe(), "anterior": anterior.sha256[:12]}
+
+    def set_shadow(self, raw: Dict[str, object]) -> Dict[str, object]:
+        """Valida ``raw`` y lo deja corriendo en sombra (en todos los workers, vía el archivo shadow)."""
+
+        shadow = self._compilar(raw, source=str(self._shadow_path))
+        with self._reload_lock:
+            _escribir_atomico(self._shadow_path, json.dumps(raw, ensure_ascii=False, indent=2))
+            self._firma_shadow = self._firma(self._shadow_path)
+            self._activar_shadow(shadow)
+        return shadow.describe()
+
+    def clear_shadow(self) -> None:
+        with self._reload_lock:
+            self._shadow_path.unlink(missing_ok=True)
+            self._firma_shadow = None
+            self._activar_shadow(None)
+
+    def promote_shadow(self) -> Dict[str, object]:
+        """Publica la configuración en sombra como la vigente y apaga la sombra."""
+
+        with self._reload_lock:
+            if self._shadow is None or not self._shadow_path.exists():
+                raise ConfigInvalida("No hay configuración en sombra para publicar.")
+            contenido = self._shadow_path.read_text(encoding="utf-8")
+            nueva = self._compilar(json.loads(contenido), source=str(self._config_path))
+            _escribir_atomico(self._config_path, contenido)
+            self._shadow_path.unlink(missing_ok=True)
+            self._firma_config = self._firma(self._config_path)
+            self._firma_shadow = None
+            anterior = self._activar(nueva)
+            self._activar_shadow(None)
+        return {**nueva.describe(), "anterior": anterior.sha256[:12]}
+
+    def status(self) -> Dict[str, object]:
+        shadow = self._shadow
+        with self._stats_lock:
+            contextos = {contexto: stats.to_dict() for contexto, stats in self._shadow_stats.items()}
+        return {
+            "config": self._config.describe(),
+            "watch": self._watch,
+            "check_interval_seconds": self._check_interval,
+            "shadow": {**shadow.describe(), "contextos": contextos} if shadow is not None else None,
+        }
 
-        return mejor
+    def _activar(self, nueva: EngineConfig) -> EngineConfig:
+        anterior, self._config = self._config, nueva
+        logger.info(
+            "[IAEngine] Configuración %s activa (antes %s)%s",
+            nueva.sha256[:12],
+            anterior.sha256[:12],
+            f" con {len(nueva.warnings)} avisos" if nueva.warnings else "",
+        )
+        return anterior
+
+    def _recargar_shadow(self) -> None:
+        if not self._shadow_path.exists():
+            self._activar_shadow(None)
+            return
+        try:
+            self._activar_shadow(self._cargar(self._shadow_path))
+        except (ConfigInvalida, OSError) as exc:
+            logger.error("[IAEngine] Configuración en sombra rechazada: %s", exc)
+
+    def _activar_shadow(self, shadow: Optional[EngineConfig]) -> None:
+        with self._stats_lock:
+            self._shadow = shadow
+            self._shadow_stats = {}
+        if shadow is not None:
+            logger.info("[IAEngine] Configuración %s en sombra", shadow.sha256[:12])
+
+    def _evaluar_shadow(
+        self,
+        shadow: EngineConfig,
+        profile: str,
+        metricas: Dict[str, float],
+        vigente: EngineInsight,
+        contexto: str,
+    ) -> None:
+        plan = shadow.plans.get(profile)
+        if plan is None:
+            return
+        try:
+            mejor, totales, _, severidad = plan.evaluate_one(metricas)
+        except Exception:  # pragma: no cover - la sombra nunca afecta la respuesta
+            logger.exception("[IAEngine] Error evaluando la configuración en sombra")
+            return
+        if mejor < 0:
+            clave = str(plan.config.get("fallback_key", "stable_outlook"))
+            score = metricas.get("signal_strength", 0.1)
+        else:
+            clave = plan.rules[mejor].key
+            score = totales[mejor]
+        with self._stats_lock:
+            if self._shadow is not shadow:
+                return  # La sombra cambió mientras se evaluaba
+            stats = self._shadow_stats.setdefault(contexto, ShadowStats())
+            stats.registrar(score - vigente.score, clave != vigente.key, severidad != vigente.severity)
+
+    @staticmethod
+    def _firma(path: Path) -> Optional[tuple]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
 
     # ------------------------------------------------------------------
-    # Regla y métrica
+    # Carga, validación y compilación
     # ------------------------------------------------------------------
+    def _cargar(self, path: Path) -> EngineConfig:
+        try:
+            raw = ConfigLoader(path).load()
+        except ValueError as exc:
+            raise ConfigInvalida(f"JSON inválido en {path}: {exc}") from exc
+        return self._compilar(raw, source=str(path))
+
+    def _compilar(self, raw: object, *, source: str) -> EngineConfig:
+        if not isinstance(raw, dict):
+            raise ConfigInvalida("La configuración del motor IA debe ser un objeto JSON.")
+        profiles = raw.get("profiles", {})
+        templates = raw.get("templates", {})
+        if not isinstance(profiles, dict) or not profiles:
+            raise ConfigInvalida("La configuración del motor IA no define perfiles.")
+        if not isinstance(templates, dict):
+            raise ConfigInvalida("'templates' debe ser un objeto.")
+        try:
+            thresholds = {
+                **self._DEFAULT_THRESHOLDS,
+                **{str(k): float(v) for k, v in raw.get("score_thresholds", {}).items()},
+            }
+        except (AttributeError, TypeError, ValueError) as exc:
+            raise ConfigInvalida(f"'score_thresholds' inválido: {exc}") from exc
+
+        # Reglas parseadas y compiladas una sola vez; evaluate solo opera sobre vectores
+        plans: Dict[str, CompiledProfile] = {}
+        avisos: List[str] = []
+        for nombre, perfil_cfg in profiles.items():
+            if not isinstance(perfil_cfg, dict) or not isinstance(perfil_cfg.get("rules", []), list):
+                raise ConfigInvalida(f"El perfil '{nombre}' debe ser un objeto con una lista 'rules'.")
+            plans[nombre] = self._compilar_perfil(nombre, perfil_cfg, thresholds)
+            avisos.extend(self._validar_perfil(plans[nombre], templates))
+
+        return EngineConfig(
+            profiles=profiles,
+            templates=templates,
+            thresholds=thresholds,
+            plans=plans,
+            source=source,
+            sha256=hashlib.sha256(json.dumps(raw, sort_keys=True).encode("utf-8")).hexdigest(),
+            loaded_at=datetime.now().isoformat(timespec="seconds"),
+            warnings=avisos,
+        )
+
+    def _compilar_perfil(self, nombre: str, perfil_cfg: dict, thresholds: Dict[str, float]) -> CompiledProfile:
+        try:
+            reglas = [self._parse_regla(item) for item in perfil_cfg.get("rules", [])]
+        except (AttributeError, KeyError, TypeError, ValueError) as exc:
+            raise ConfigInvalida(f"Regla inválida en el perfil '{nombre}': {exc}") from exc
+        return compile_profile(nombre, perfil_cfg, reglas, thresholds)
+
+    def _validar_perfil(self, plan: CompiledProfile, templates: Dict[str, dict]) -> List[str]:
+        """Lanza ``ConfigInvalida`` ante errores que romperían ``evaluate``; devuelve avisos."""
+
+        avisos: List[str] = []
+        for indice, regla in enumerate(plan.rules):
+            origen = f"{plan.name}/{regla.key}"
+            for metrica in regla.metrics:
+                if metrica.direction.lower() not in _DIRECTIONS:
+                    raise ConfigInvalida(f"[{origen}] Dirección desconocida '{metrica.direction}' en {metrica.name}")
+                if metrica.name not in METRIC_NAMES:
+                    avisos.append(f"[{origen}] La métrica '{metrica.name}' no existe y no aporta score")
+            _, warning_at, critical_at = plan.limits[indice]
+            if warning_at > critical_at:
+                raise ConfigInvalida(f"[{origen}] El umbral warning ({warning_at}) supera al critical ({critical_at})")
+            for modificador in regla.modifiers:
+                if not isinstance(modificador, dict):
+                    raise ConfigInvalida(f"[{origen}] Cada modificador debe ser un objeto, no {modificador!r}")
+            extras = [m.get("name") for m in regla.modifiers if isinstance(m.get("name"), str)]
+            try:
+                regla.summary.format(**dict.fromkeys([*METRIC_NAMES, *extras], 0.0))
+            except (AttributeError, KeyError, IndexError, TypeError, ValueError) as exc:
+                raise ConfigInvalida(f"[{origen}] El resumen usa un campo inválido: {exc}") from exc
+            if regla.template not in templates:
+                avisos.append(f"[{origen}] La plantilla '{regla.template}' no existe; se usará la de respaldo")
+        fallback = plan.config.get("fallback_template", "estado_estable")
+        if fallback not in templates:
+            avisos.append(f"[{plan.name}] La plantilla de respaldo '{fallback}' no existe")
+        return avisos
+
     def _parse_regla(self, data: dict) -> RuleConfig:
         metricas = [
             MetricRule(
@@ -144,41 +482,27 @@ class IAEngine:
             minimum_score=float(data.get("minimum_score", 0.0)),
         )
 
-    def _evaluar_regla(
+    def _armar_insight(
         self,
-        regla: RuleConfig,
+        plan: CompiledProfile,
+        indice: int,
+        score_total: float,
+        scores: List[float],
+        severidad: str,
         metricas: Dict[str, float],
         snapshot: IASnapshot,
-        profile: str,
-    ) -> Optional[EngineInsight]:
-        contributions: List[float] = []
+    ) -> EngineInsight:
+        regla: RuleConfig = plan.rules[indice]
         drivers: List[str] = []
-
-        for config in regla.metrics:
-            valor = metricas.get(config.name)
-            if valor is None:
-                continue
-
-            score = self._calcular_contribucion(valor, config)
-            if score <= 0:
+        for entrada in plan.entries_of(indice):
+            frase = plan.phrases[entrada]
+            if not frase or scores[entrada] <= 0:
                 continue
+            try:
+                drivers.append(frase.format(valor=metricas[METRIC_NAMES[plan.metric_idx[entrada]]]))
+            except Exception:  # pragma: no cover - defensa
+                drivers.append(frase)
 
-            contributions.append(score * config.weight)
-            if config.phrase:
-                try:
-                    drivers.append(config.phrase.format(valor=valor))
-                except Exception:  # pragma: no cover - defensa
-                    drivers.append(config.phrase)
-
-        if not contributions:
-            return None
-
-        score_total = sum(contributions)
-        if score_total < regla.minimum_score:
-            return None
-
-        severity = self._clasificar_severidad(score_total, regla.severity_thresholds)
-        confidence = min(1.0, max(0.0, score_total))
         data_points = {metric.name: metricas.get(metric.name, 0.0) for metric in regla.metrics}
 
         extra = self._aplicar_modificadores(regla.modifiers, metricas, snapshot)
@@ -187,43 +511,16 @@ class IAEngine:
         return EngineInsight(
             key=regla.key,
             template=regla.template,
-            severity=severity,
-            profile=profile,
+            severity=severidad,
+            profile=plan.name,
             score=score_total,
-            confidence=confidence,
+            confidence=min(1.0, max(0.0, score_total)),
             summary=summary,
             drivers=drivers,
             data_points=data_points,
             extra_context=extra,
         )
 
-    def _calcular_contribucion(self, valor: float, config: MetricRule) -> float:
-        direction = config.direction.lower()
-        threshold = config.threshold
-        delta = valor - threshold
-
-        if direction == "below":
-            delta = threshold - valor
-        elif direction == "between":
-            rango = abs(threshold - config.scale)
-            if rango == 0:
-                return 0.0
-            delta = max(0.0, 1 - abs(valor - threshold) / rango)
-        else:
-            delta = valor - threshold
-
-        score = max(0.0, delta / max(abs(threshold) or 1.0, 1.0))
-        score = min(score * config.scale, config.clamp)
-        return score
-
-    def _clasificar_severidad(self, score: float, custom: Dict[str, float]) -> str:
-        thresholds = {**self._thresholds, **custom}
-        if score >= thresholds.get("critical", 0.8):
-            return "critical"
-        if score >= thresholds.get("warning", 0.5):
-            return "warning"
-        return "info"
-
     def _aplicar_modificadores(
         self,
         modifiers: Iterable[Dict[str, object]],
@@ -6,22 +6,135 @@ from __future__ import annotations
 
 import logging
 import pickle
+import threading
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
 import numpy as np
+from numpy.lib import recfunctions as rfn
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 
 from app.utils.error_logger import registrar_error
 from .ia_snapshots import IASnapshot
-from .ia_ml_insights_advanced import get_advanced_insights
+from .ia_analyzer_runner import AnalizadorSinResultado, get_analyzer_runner
+from .ia_model_registry import ModelManifest, ModelWatcher, model_registry
 
 logger = logging.getLogger(__name__)
 
-# Ruta donde se guarda el modelo entrenado
+# Ruta del modelo legado (pickle); los modelos nuevos viven en el registro versionado
 MODEL_PATH = Path(__file__).parent.parent.parent / 'data' / 'ml_model.pkl'
 
+# Orden canónico de las features del modelo
+FEATURE_NAMES: Tuple[str, ...] = (
+    'sales_trend_percent',
+    'sales_anomaly_score',
+    'sales_volatility',
+    'weight_volatility',
+    'weight_change_rate',
+    'movements_per_hour',
+    'inactivity_hours',
+    'critical_alerts',
+    'warning_alerts',
+    'signal_strength',
+)
+
+FEATURE_DTYPE = np.dtype([(name, np.float64) for name in FEATURE_NAMES])
+
+
+def _snapshot_feature_row(snapshot: IASnapshot) -> Tuple[float, ...]:
+    return (
+        float(snapshot.sales_trend_percent or 0.0),
+        float(snapshot.sales_anomaly_score or 0.0),
+        float(snapshot.sales_volatility or 0.0),
+        float(snapshot.weight_volatility or 0.0),
+        float(snapshot.weight_change_rate or 0.0),
+        float(snapshot.movements_per_hour or 0.0),
+        float(snapshot.inactivity_hours or 0.0),
+        float(snapshot.critical_alerts or 0),
+        float(snapshot.warning_alerts or 0),
+        float(snapshot.signal_strength or 0.0),
+    )
+
+
+def _dict_feature_row(data: Mapping[str, Any]) -> Tuple[float, ...]:
+    alerts = data.get('alerts_summary') if isinstance(data.get('alerts_summary'), Mapping) else {}
+    fila = []
+    for name in FEATURE_NAMES:
+        if name in ('critical_alerts', 'warning_alerts'):
+            valor = data.get(name, alerts.get(name.split('_')[0]))
+        else:
+            valor = data.get(name)
+        try:
+            fila.append(float(valor or 0.0))
+        except (TypeError, ValueError):
+            fila.append(0.0)
+    return tuple(fila)
+
+
+@dataclass
+class SnapshotBatch:
+    """
+    Representación columnar de muchos snapshots (structured array de NumPy).
+
+    Cada campo de ``features`` es una columna con el nombre de la feature, de
+    modo que ``batch.features['critical_alerts']`` devuelve un vector.
+    """
+
+    features: np.ndarray
+    generated_at: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.features.shape[0])
+
+    @classmethod
+    def from_snapshots(cls, snapshots: Iterable[IASnapshot]) -> "SnapshotBatch":
+        snapshots = list(snapshots)
+        features = np.array([_snapshot_feature_row(s) for s in snapshots], dtype=FEATURE_DTYPE)
+        generated_at = np.array(
+            [np.datetime64(s.generated_at.replace(tzinfo=None), 's') for s in snapshots],
+            dtype='datetime64[s]',
+        )
+        return cls(features=features, generated_at=generated_at)
+
+    @classmethod
+    def from_dicts(cls, rows: Iterable[Mapping[str, Any]]) -> "SnapshotBatch":
+        """Construye el batch desde ``IASnapshot.to_dict()`` u otros registros planos."""
+        rows = list(rows)
+        features = np.array([_dict_feature_row(r) for r in rows], dtype=FEATURE_DTYPE)
+        generated_at = np.array(
+            [np.datetime64(str(r.get('generated_at') or 'NaT')[:19], 's') for r in rows],
+            dtype='datetime64[s]',
+        )
+        return cls(features=features, generated_at=generated_at)
+
+    @classmethod
+    def from_records(cls, records: np.ndarray) -> "SnapshotBatch":
+        """Construye el batch desde registros de ``SnapshotStore.read()``."""
+        features = rfn.repack_fields(records[list(FEATURE_NAMES)]).astype(FEATURE_DTYPE)
+        return cls(features=features, generated_at=np.asarray(records['generated_at']))
+
+    def matrix(self) -> np.ndarray:
+        """Vista 2D (n_snapshots, n_features) lista para sklearn."""
+        return rfn.structured_to_unstructured(self.features, dtype=np.float64)
+
+
+@dataclass
+class BatchPrediction:
+    """Resultado vectorizado de ``AnomalyDetector.predict_batch``."""
+
+    is_anomaly: np.ndarray
+    model_anomaly: np.ndarray
+    critical_override: np.ndarray
+    scores: np.ndarray
+    severity: np.ndarray
+    contributions: np.ndarray
+    feature_names: Tuple[str, ...]
+
+    def anomaly_rate(self) -> float:
+        return float(self.is_anomaly.mean()) if self.is_anomaly.size else 0.0
+
 
 class AnomalyDetector:
     """
@@ -62,36 +175,25 @@ class AnomalyDetector:
         Returns:
             Array numpy con shape (1, n_features)
         """
-        features = [
-            float(snapshot.sales_trend_percent or 0.0),
-            float(snapshot.sales_anomaly_score or 0.0),
-            float(snapshot.sales_volatility or 0.0),
-            float(snapshot.weight_volatility or 0.0),
-            float(snapshot.weight_change_rate or 0.0),
-            float(snapshot.movements_per_hour or 0.0),
-            float(snapshot.inactivity_hours or 0.0),
-            float(snapshot.critical_alerts or 0),
-            float(snapshot.warning_alerts or 0),
-            float(snapshot.signal_strength or 0.0),
-        ]
-        
         if not self._feature_names:
-            self._feature_names = [
-                'sales_trend_percent',
-                'sales_anomaly_score',
-                'sales_volatility',
-                'weight_volatility',
-                'weight_change_rate',
-                'movements_per_hour',
-                'inactivity_hours',
-                'critical_alerts',
-                'warning_alerts',
-                'signal_strength',
-            ]
+            self._feature_names = list(FEATURE_NAMES)
+        
+        return np.array(_snapshot_feature_row(snapshot), dtype=np.float64).reshape(1, -1)
+    
+    def extract_features_batch(self, batch: SnapshotBatch | Iterable[IASnapshot]) -> np.ndarray:
+        """
+        Extrae la matriz de features de muchos snapshots de una sola vez.
         
-        return np.array(features).reshape(1, -1)
+        Returns:
+            Array numpy con shape (n_snapshots, n_features)
+        """
+        if not isinstance(batch, SnapshotBatch):
+            batch = SnapshotBatch.from_snapshots(batch)
+        if not self._feature_names:
+            self._feature_names = list(FEATURE_NAMES)
+        return batch.matrix()
     
-    def fit_from_snapshots(self, snapshots: List[IASnapshot]) -> bool:
+    def fit_from_snapshots(self, snapshots: List[IASnapshot] | SnapshotBatch) -> bool:
         """
         Entrena el modelo con un conjunto de snapshots históricos.
         
@@ -110,7 +212,7 @@ class AnomalyDetector:
         
         try:
             # Extraer features de todos los snapshots
-            X = np.vstack([self.extract_features(s) for s in snapshots])
+            X = self.extract_features_batch(snapshots)
             
             # Normalizar features
             X_scaled = self._scaler.fit_transform(X)
@@ -134,22 +236,29 @@ class AnomalyDetector:
             logger.exception("[ML] Error entrenando modelo: %s", exc)
             return False
     
+    def to_artifact(self) -> Dict[str, Any]:
+        """Estado serializable del detector (modelo, scaler y features)."""
+        return {
+            'model': self._model,
+            'scaler': self._scaler,
+            'feature_names': self._feature_names,
+            'fitted': self._fitted,
+        }
+    
+    def apply_artifact(self, artifact: Mapping[str, Any]) -> None:
+        self._model = artifact['model']
+        self._scaler = artifact['scaler']
+        self._feature_names = list(artifact['feature_names'])
+        self._fitted = bool(artifact['fitted'])
+    
     def save_model(self) -> bool:
-        """Guarda el modelo entrenado en disco."""
+        """Publica el modelo entrenado como nueva versión del registro."""
         try:
-            MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
-            
-            model_data = {
-                'model': self._model,
-                'scaler': self._scaler,
-                'feature_names': self._feature_names,
-                'fitted': self._fitted,
-            }
-            
-            with open(MODEL_PATH, 'wb') as f:
-                pickle.dump(model_data, f)
-            
-            logger.info(f"[ML] Modelo guardado en {MODEL_PATH}")
+            manifest = model_registry.publish(
+                self.to_artifact(),
+                extra={'contamination': float(getattr(self._model, 'contamination', 0.0) or 0.0)},
+            )
+            logger.info(f"[ML] Modelo guardado en {model_registry.root / manifest.version}")
             return True
             
         except Exception as exc:
@@ -157,7 +266,20 @@ class AnomalyDetector:
             return False
     
     def load_model(self) -> bool:
-        """Carga el modelo desde disco."""
+        """Carga la versión vigente del registro o, si no existe, el pickle legado."""
+        if model_registry.current_version():
+            try:
+                artifact, manifest = model_registry.load(expected_features=FEATURE_NAMES)
+                self.apply_artifact(artifact)
+                logger.info(f"[ML] Modelo {manifest.version} cargado desde {model_registry.root}")
+                return True
+            except Exception as exc:
+                logger.exception(f"[ML] Error cargando modelo del registro: {exc}")
+        
+        return self._load_legacy_model()
+    
+    def _load_legacy_model(self) -> bool:
+        """Carga ``ml_model.pkl`` de instalaciones anteriores al registro."""
         if not MODEL_PATH.exists():
             logger.debug(f"[ML] No existe modelo guardado en {MODEL_PATH}")
             return False
@@ -166,12 +288,9 @@ class AnomalyDetector:
             with open(MODEL_PATH, 'rb') as f:
                 model_data = pickle.load(f)
             
-            self._model = model_data['model']
-            self._scaler = model_data['scaler']
-            self._feature_names = model_data['feature_names']
-            self._fitted = model_data['fitted']
+            self.apply_artifact(model_data)
             
-            logger.info(f"[ML] Modelo cargado desde {MODEL_PATH}")
+            logger.info(f"[ML] Modelo legado cargado desde {MODEL_PATH}")
             return True
             
         except Exception as exc:
@@ -208,12 +327,7 @@ class AnomalyDetector:
             
             # 🔥 REGLAS CRÍTICAS: Override si hay condiciones extremas
             # Estas reglas detectan anomalías incluso si el modelo falla
-            is_critical_anomaly = (
-                snapshot.critical_alerts >= 3 or  # 3+ alertas críticas
-                snapshot.sales_trend_percent < -50 or  # Caída >50% en ventas
-                (snapshot.critical_alerts >= 2 and snapshot.sales_trend_percent < -30) or
-                snapshot.inactivity_hours >= 4  # 4+ horas sin actividad
-            )
+            is_critical_anomaly = bool(self._critical_override(X)[0])
             
             # Calcular contribución de cada feature
             feature_contributions = self._calculate_feature_contributions(X[0])
@@ -240,6 +354,69 @@ class AnomalyDetector:
             logger.exception("[ML] Error en predicción: %s", exc)
             return False, 0.0, {}
     
+    def predict_batch(self, batch: SnapshotBatch | Iterable[IASnapshot]) -> BatchPrediction:
+        """
+        Evalúa muchos snapshots en una sola llamada (backtesting).
+        
+        Aplica el modelo, las mismas reglas críticas que ``predict`` y la
+        clasificación de severidad de ``get_anomaly_insights``, todo vectorizado.
+        """
+        X = self.extract_features_batch(batch)
+        n = X.shape[0]
+        names = tuple(self._feature_names or FEATURE_NAMES)
+        
+        if not self._fitted or n == 0:
+            if not self._fitted:
+                logger.warning("[ML] Modelo no entrenado. Retornando resultado neutro.")
+            vacio = np.zeros(n, dtype=bool)
+            return BatchPrediction(
+                is_anomaly=vacio,
+                model_anomaly=vacio.copy(),
+                critical_override=vacio.copy(),
+                scores=np.zeros(n),
+                severity=np.full(n, 'low', dtype='<U6'),
+                contributions=np.zeros((n, len(names))),
+                feature_names=names,
+            )
+        
+        X_scaled = self._scaler.transform(X)
+        model_anomaly = self._model.predict(X_scaled) == -1
+        scores = self._model.score_samples(X_scaled)
+        critical = self._critical_override(X)
+        severity = np.where(scores > -0.3, 'low', np.where(scores > -0.5, 'medium', 'high'))
+        
+        return BatchPrediction(
+            is_anomaly=model_anomaly | critical,
+            model_anomaly=model_anomaly,
+            critical_override=critical,
+            scores=scores,
+            severity=severity,
+            contributions=self._feature_contributions_batch(X),
+            feature_names=names,
+        )
+    
+    @staticmethod
+    def _critical_override(X: np.ndarray) -> np.ndarray:
+        """Reglas críticas de ``predict`` aplicadas a una matriz de features."""
+        idx = {name: i for i, name in enumerate(FEATURE_NAMES)}
+        criticas = X[:, idx['critical_alerts']]
+        tendencia = X[:, idx['sales_trend_percent']]
+        inactividad = X[:, idx['inactivity_hours']]
+        return (
+            (criticas >= 3)  # 3+ alertas críticas
+            | (tendencia < -50)  # Caída >50% en ventas
+            | ((criticas >= 2) & (tendencia < -30))
+            | (inactividad >= 4)  # 4+ horas sin actividad
+        )
+    
+    @staticmethod
+    def _feature_contributions_batch(X: np.ndarray) -> np.ndarray:
+        """Contribución normalizada por fila: |valor| / suma(|valores|)."""
+        magnitudes = np.abs(X)
+        totales = magnitudes.sum(axis=1, keepdims=True)
+        totales[totales == 0] = 1.0
+        return magnitudes / totales
+    
     def _calculate_feature_contributions(self, features: np.ndarray) -> Dict[str, float]:
         """
         Calcula qué features contribuyen más a la anomalía.
@@ -247,21 +424,10 @@ class AnomalyDetector:
         Returns:
             Dict con feature_name -> contribution_score
         """
-        contributions = {}
-        
-        for i, feature_name in enumerate(self._feature_names):
-            # Valor normalizado
-            value = float(features[i])
-            
-            # Contribución basada en desviación de la media
-            # (simplificado, en producción usarías SHAP values)
-            contributions[feature_name] = abs(value)
-        
-        # Normalizar contribuciones
-        total = sum(contributions.values()) or 1.0
-        contributions = {k: v / total for k, v in contributions.items()}
-        
-        return contributions
+        # Contribución basada en la magnitud de cada feature
+        # (simplificado, en producción usarías SHAP values)
+        fila = self._feature_contributions_batch(np.asarray(features, dtype=np.float64).reshape(1, -1))[0]
+        return {name: float(fila[i]) for i, name in enumerate(self._feature_names)}
     
     def get_anomaly_insights(
         self,
@@ -435,11 +601,15 @@ class AnomalyDetector:
                        Cada módulo puede tener 1 o más hallazgos dependiendo de problemas detectados.
         """
         findings = []
-        insights = get_advanced_insights()
+        # Los seis analizadores corren en paralelo (con caché por analizador); si
+        # alguno no responde a tiempo, su módulo queda sin hallazgos en esta vuelta
+        analisis = get_analyzer_runner().run()
+        if analisis.faltantes:
+            logger.info(f"[IA] Hallazgos parciales: sin resultado de {', '.join(analisis.faltantes)}")
         
         # 1️⃣ DASHBOARD - Rankings y top productos (MÚLTIPLES HALLAZGOS)
         try:
-            rankings = insights.analyze_dashboard_rankings()
+            rankings = analisis.get('dashboard_rankings')
             has_dashboard_findings = False
             
             # Top productos (puede haber múltiples destacados)
@@ -602,6 +772,8 @@ class AnomalyDetector:
                     'ml_severity': 'low',
                     'plan_accion': 'Continuar con estrategia actual. El sistema monitorea en tiempo real.'
                 })
+        except AnalizadorSinResultado:
+            pass
         except Exception as e:
             logger.error(f"Error en análisis dashboard: {e}")
             registrar_error("Error en análisis ML dashboard", "ia_ml", e)
@@ -616,7 +788,7 @@ class AnomalyDetector:
         
         # 2️⃣ INVENTARIO - Capacidad y stock (MÚLTIPLES HALLAZGOS)
         try:
-            inventory = insights.analyze_inventory_capacity()
+            inventory = analisis.get('inventory_capacity')
             has_inventory_findings = False
             
             # Productos agotados (CRÍTICO - cada uno es un hallazgo)
@@ -730,6 +902,8 @@ class AnomalyDetector:
                     'ml_severity': 'low',
                     'plan_accion': 'Mantener monitoreo continuo. El algoritmo ajustará alertas automáticamente según patrones de demanda.'
                 })
+        except AnalizadorSinResultado:
+            pass
         except Exception as e:
             logger.error(f"Error en análisis inventario: {e}")
             findings.append({
@@ -743,7 +917,7 @@ class AnomalyDetector:
         
         # 3️⃣ MOVIMIENTOS - Retiros no justificados (MÚLTIPLES HALLAZGOS)
         try:
-            movements = insights.analyze_unjustified_movements()
+            movements = analisis.get('unjustified_movements')
             has_movements_findings = False
             
             # Retiros sin justificar (cada uno es crítico)
@@ -803,6 +977,8 @@ class AnomalyDetector:
                     'ml_severity': 'low',
                     'plan_accion': 'Continuar con flujo normal de operaciones.'
                 })
+        except AnalizadorSinResultado:
+            pass
         except Exception as e:
             logger.error(f"Error en análisis movimientos: {e}")
             findings.append({
@@ -816,7 +992,7 @@ class AnomalyDetector:
         
         # 4️⃣ VENTAS - Comparación 48h (MÚLTIPLES HALLAZGOS)
         try:
-            sales = insights.analyze_sales_comparison_48h()
+            sales = analisis.get('sales_comparison_48h')
             change = sales.get('change_percent', 0)
             recent_total = sales.get('recent_total', 0)
             previous_total = sales.get('previous_total', 0)
@@ -895,6 +1071,8 @@ class AnomalyDetector:
                     'ml_severity': 'low',
                     'plan_accion': 'Estrategia actual efectiva. El algoritmo continúa monitoreando patrones.'
                 })
+        except AnalizadorSinResultado:
+            pass
         except Exception as e:
             logger.error(f"Error en análisis ventas: {e}")
             findings.append({
@@ -908,7 +1086,7 @@ class AnomalyDetector:
         
         # 5️⃣ ALERTAS - Críticas con resoluciones (MÚLTIPLES HALLAZGOS)
         try:
-            alerts = insights.analyze_critical_alerts_resolution()
+            alerts = analisis.get('critical_alerts_resolution')
             has_alerts_findings = False
             
             # Alertas críticas individuales (hasta 3)
@@ -947,6 +1125,8 @@ class AnomalyDetector:
                     'ml_severity': 'low',
                     'plan_accion': 'El sistema de monitoreo inteligente continúa vigilando. Umbrales auto-calibrados según patrones históricos.'
                 })
+        except AnalizadorSinResultado:
+            pass
         except Exception as e:
             logger.error(f"Error en análisis alertas: {e}")
             findings.append({
@@ -960,7 +1140,7 @@ class AnomalyDetector:
         
         # 6️⃣ AUDITORÍA - Anomalías de usuarios (MÚLTIPLES HALLAZGOS CON DATOS ENRIQUECIDOS)
         try:
-            audit = insights.analyze_audit_anomalies()
+            audit = analisis.get('audit_anomalies')
             has_audit_findings = False
             
             # Usuarios con patrones sospechosos (hasta 3)
@@ -1116,6 +1296,8 @@ class AnomalyDetector:
                         {'orden': 1, 'texto': 'Sistema operando normalmente, no requiere acción', 'urgencia': 'baja'}
                     ]
                 })
+        except AnalizadorSinResultado:
+            pass
         except Exception as e:
             logger.error(f"Error en análisis auditoría: {e}")
             findings.append({
@@ -1133,20 +1315,45 @@ class AnomalyDetector:
         return findings
 
 
-# Instancia global (caché en memoria)
+# Instancia global (caché en memoria); se reemplaza completa al publicar un modelo nuevo
 _detector: AnomalyDetector | None = None
+_detector_lock = threading.Lock()
+
+
+def _activar_modelo(artifact: Dict[str, Any], manifest: ModelManifest) -> None:
+    """Construye un detector con el artefacto y lo intercambia de forma atómica."""
+    global _detector
+    detector = AnomalyDetector()
+    detector.apply_artifact(artifact)
+    _detector = detector
+
+
+_watcher = ModelWatcher(model_registry, _activar_modelo, expected_features=FEATURE_NAMES)
 
 
 def get_detector() -> AnomalyDetector:
     """Retorna la instancia singleton del detector y carga modelo si existe."""
     global _detector
     if _detector is None:
-        _detector = AnomalyDetector()
-        # Intentar cargar modelo guardado
-        _detector.load_model()
+        with _detector_lock:
+            if _detector is None and not _watcher.load_now():
+                detector = AnomalyDetector()
+                # Sin registro: intentar el pickle legado
+                detector.load_model()
+                _detector = detector
+    else:
+        # Hot reload: si otro proceso publicó una versión nueva, se carga en segundo plano
+        _watcher.maybe_reload()
     return _detector
 
 
+def preload_detector() -> threading.Thread:
+    """Carga el modelo en segundo plano al iniciar la app."""
+    hilo = threading.Thread(target=get_detector, name="ia-model-preload", daemon=True)
+    hilo.start()
+    return hilo
+
+
 def detect_anomalies(snapshot: IASnapshot) -> Dict[str, any]:
     """
     Función conveniente para detectar anomalías en un snapshot.
@@ -0,0 +1,255 @@
+"""Scheduled, gated retraining of the anomaly model over a sliding window."""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+import logging
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+
+from app.utils.scheduler import scheduler
+from .ia_model_registry import ModelRegistry, model_registry
+from .ia_snapshot_store import SnapshotStore, snapshot_store
+
+logger = logging.getLogger(__name__)
+
+_ENABLED = os.getenv("IA_RETRAIN_ENABLED", "1").lower() not in ("0", "false", "no")
+_INTERVAL_SECONDS = float(os.getenv("IA_RETRAIN_INTERVAL", "21600"))
+# Ventana deslizante: últimos N días, como máximo M snapshots (los más recientes)
+_VENTANA_DIAS = float(os.getenv("IA_RETRAIN_VENTANA_DIAS", "14"))
+_MAX_MUESTRAS = int(os.getenv("IA_RETRAIN_MAX_MUESTRAS", "20000"))
+_MIN_MUESTRAS = int(os.getenv("IA_RETRAIN_MIN_MUESTRAS", "50"))
+# Fracción más reciente de la ventana que no se usa para entrenar sino para evaluar
+_HOLDOUT = float(os.getenv("IA_RETRAIN_HOLDOUT", "0.2"))
+_TIMEOUT_SECONDS = float(os.getenv("IA_RETRAIN_TIMEOUT", "300"))
+# Warm start: árboles agregados por vuelta hasta MAX_ARBOLES; al llegar al tope se reentrena desde cero
+_WARM_START = os.getenv("IA_RETRAIN_WARM_START", "1").lower() not in ("0", "false", "no")
+_ARBOLES_NUEVOS = int(os.getenv("IA_RETRAIN_ARBOLES_NUEVOS", "25"))
+_MAX_ARBOLES = int(os.getenv("IA_RETRAIN_MAX_ARBOLES", "200"))
+# Criterios para publicar el candidato
+_TASA_MAX = float(os.getenv("IA_RETRAIN_TASA_MAX", "0.35"))
+_TOLERANCIA_RECALL = float(os.getenv("IA_RETRAIN_TOLERANCIA_RECALL", "0.05"))
+
+_WORKER_PATH = Path(__file__).with_name('ia_ml_retrain_worker.py')
+
+JOB_NAME = "ia_reentrenamiento"
+
+
+@dataclass
+class RetrainRun:
+    """Resumen de una vuelta de reentrenamiento."""
+
+    inicio: str
+    estado: str = "en_curso"
+    muestras_entrenamiento: int = 0
+    muestras_holdout: int = 0
+    modo: Optional[str] = None
+    version_base: Optional[str] = None
+    version_publicada: Optional[str] = None
+    candidato: Optional[Dict[str, Any]] = None
+    actual: Optional[Dict[str, Any]] = None
+    motivos: List[str] = field(default_factory=list)
+    duracion_entrenamiento_ms: Optional[float] = None
+    duracion_ms: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def evaluar_candidato(
+    candidato: Optional[Dict[str, Any]],
+    actual: Optional[Dict[str, Any]],
+    *,
+    tasa_max: float = _TASA_MAX,
+    tolerancia_recall: float = _TOLERANCIA_RECALL,
+) -> Tuple[bool, List[str]]:
+    """Decide si el candidato puede reemplazar al vigente según sus métricas en el holdout.
+
+    Returns:
+        Tupla (aprobado, motivos de rechazo)
+    """
+    if not candidato:
+        return False, ["el candidato no produjo métricas"]
+
+    motivos = []
+    if not candidato.get('scores_finitos', False):
+        motivos.append("scores no finitos en el holdout")
+    if candidato['tasa_anomalias'] > tasa_max:
+        motivos.append(
+            f"marca {candidato['tasa_anomalias']:.1%} del holdout como anómalo (máximo {tasa_max:.0%})"
+        )
+    # No perder casos que las reglas críticas ya consideran anómalos
+    recall_nuevo = candidato.get('recall_criticas')
+    recall_actual = (actual or {}).get('recall_criticas')
+    if recall_nuevo is not None and recall_actual is not None and recall_nuevo < recall_actual - tolerancia_recall:
+        motivos.append(
+            f"recall sobre reglas críticas {recall_nuevo:.1%} < vigente {recall_actual:.1%}"
+        )
+    return not motivos, motivos
+
+
+class ModelRetrainer:
+    """Refits the anomaly model periodically in a child process and publishes it if it passes.
+
+    Each run reads only the tail of the snapshot store (``read_recent``), so
+    time and memory are bounded by ``max_muestras`` no matter how large the
+    history grows. The newest ``holdout`` fraction is kept out of training and
+    used to compare the candidate with the current model. Training happens in
+    a separate interpreter with a hard timeout; web workers only notice the
+    result when their ``ModelWatcher`` picks up the new ``CURRENT`` version.
+    """
+
+    def __init__(
+        self,
+        *,
+        store: SnapshotStore = snapshot_store,
+        registry: ModelRegistry = model_registry,
+        ventana_dias: float = _VENTANA_DIAS,
+        max_muestras: int = _MAX_MUESTRAS,
+        min_muestras: int = _MIN_MUESTRAS,
+        holdout: float = _HOLDOUT,
+        timeout: float = _TIMEOUT_SECONDS,
+    ) -> None:
+        self._store = store
+        self._registry = registry
+        self._ventana_dias = float(ventana_dias)
+        self._max_muestras = int(max_muestras)
+        self._min_muestras = max(int(min_muestras), 5)
+        self._holdout = min(max(float(holdout), 0.05), 0.5)
+        self._timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._ultima: Optional[RetrainRun] = None
+        self._publicados = 0
+        self._rechazados = 0
+
+    def run(self) -> int:
+        """Una vuelta completa; devuelve las filas usadas para entrenar (0 si se omitió)."""
+        from .ia_ml_anomalies import FEATURE_NAMES, AnomalyDetector, SnapshotBatch
+
+        inicio = time.perf_counter()
+        corrida = RetrainRun(inicio=datetime.now().isoformat())
+        try:
+            desde = datetime.utcnow() - timedelta(days=self._ventana_dias)
+            registros = self._store.read_recent(self._max_muestras, desde=desde)
+            if len(registros) < self._min_muestras:
+                corrida.estado = "omitido"
+                corrida.motivos = [f"{len(registros)} snapshots en la ventana (mínimo {self._min_muestras})"]
+                return 0
+
+            X = SnapshotBatch.from_records(registros).matrix()
+            n_holdout = max(1, int(len(X) * self._holdout))
+            X_train, X_holdout = X[:-n_holdout], X[-n_holdout:]
+            corrida.muestras_entrenamiento, corrida.muestras_holdout = len(X_train), len(X_holdout)
+
+            actual = None
+            corrida.version_base = self._registry.current_version()
+            if corrida.version_base:
+                artifact, _ = self._registry.load(corrida.version_base)
+                # Un modelo con otras features no sirve ni de base ni de referencia
+                if list(artifact.get('feature_names') or []) == list(FEATURE_NAMES):
+                    actual = artifact
+
+            plantilla = AnomalyDetector()
+            payload = {
+                'X_train': X_train,
+                'X_holdout': X_holdout,
+                'criticas_holdout': AnomalyDetector._critical_override(X_holdout),
+                'actual': actual,
+                'params': {
+                    'modelo': plantilla.to_artifact()['model'].get_params(),
+                    'feature_names': list(FEATURE_NAMES),
+                    'warm_start': _WARM_START,
+                    'arboles_nuevos': _ARBOLES_NUEVOS,
+                    'max_arboles': _MAX_ARBOLES,
+                },
+            }
+            resultado = self._entrenar_en_proceso(payload)
+            corrida.modo = resultado['modo']
+            corrida.duracion_entrenamiento_ms = resultado['duracion_entrenamiento_ms']
+            corrida.candidato, corrida.actual = resultado['candidato'], resultado['actual']
+
+            aprobado, corrida.motivos = evaluar_candidato(corrida.candidato, corrida.actual)
+            if not aprobado:
+                corrida.estado = "rechazado"
+                logger.warning("[ML] Candidato rechazado: %s", "; ".join(corrida.motivos))
+                return len(X_train)
+
+            manifest = self._registry.publish(
+                resultado['artifact'],
+                extra={
+                    'contamination': float(payload['params']['modelo'].get('contamination') or 0.0),
+                    'reentrenamiento': {
+                        'modo': corrida.modo,
+                        'version_base': corrida.version_base,
+                        'muestras_entrenamiento': corrida.muestras_entrenamiento,
+                        'muestras_holdout': corrida.muestras_holdout,
+                        'holdout': corrida.candidato,
+                    },
+                },
+            )
+            corrida.estado = "publicado"
+            corrida.version_publicada = manifest.version
+            return len(X_train)
+        except Exception:
+            corrida.estado = "error"
+            raise
+        finally:
+            corrida.duracion_ms = round((time.perf_counter() - inicio) * 1000.0, 1)
+            with self._lock:
+                self._ultima = corrida
+                if corrida.estado == "publicado":
+                    self._publicados += 1
+                elif corrida.estado == "rechazado":
+                    self._rechazados += 1
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "habilitado": _ENABLED,
+                "version_vigente": self._registry.current_version(),
+                "ventana_dias": self._ventana_dias,
+                "max_muestras": self._max_muestras,
+                "holdout": self._holdout,
+                "publicados": self._publicados,
+                "rechazados": self._rechazados,
+                "ultima": self._ultima.to_dict() if self._ultima else None,
+            }
+
+    def _entrenar_en_proceso(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Ejecuta ``ia_ml_retrain_worker.py`` en otro intérprete y lee su resultado."""
+        with tempfile.TemporaryDirectory(prefix='weigence-retrain-') as carpeta:
+            entrada = Path(carpeta) / 'entrada.joblib'
+            salida = Path(carpeta) / 'salida.joblib'
+            joblib.dump(payload, entrada, compress=0)
+            try:
+                proceso = subprocess.run(
+                    [sys.executable, str(_WORKER_PATH), str(entrada), str(salida)],
+                    capture_output=True,
+                    text=True,
+                    timeout=self._timeout,
+                )
+            except subprocess.TimeoutExpired:
+                # subprocess.run ya terminó el proceso hijo
+                raise RuntimeError(f"El reentrenamiento superó {self._timeout:.0f}s y fue cancelado")
+            if proceso.returncode != 0 or not salida.exists():
+                detalle = (proceso.stderr or "").strip().splitlines()[-1:] or ["sin salida"]
+                raise RuntimeError(f"El proceso de reentrenamiento falló ({proceso.returncode}): {detalle[0]}")
+            return joblib.load(salida)
+
+
+model_retrainer = ModelRetrainer()
+
+# Tarea periódica (el scheduler se inicia en create_app)
+if _ENABLED:
+    scheduler.register(JOB_NAME, model_retrainer.run, _INTERVAL_SECONDS, retraso_inicial=600.0)
+
+
+__all__ = ["JOB_NAME", "ModelRetrainer", "RetrainRun", "evaluar_candidato", "model_retrainer"]
@@ -0,0 +1,96 @@
+"""Child process that fits and scores a candidate anomaly model.
+
+Run by path (``python ia_ml_retrain_worker.py entrada.joblib salida.joblib``)
+so it only imports NumPy/scikit-learn: neither the ``app`` package, nor
+Supabase, nor the Flask entry point (``app.py`` builds the app on import).
+Communication goes through two joblib files written by ``ia_ml_retrain``.
+"""
+from __future__ import annotations
+
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+
+def _metricas(artifact: Optional[Dict[str, Any]], X: np.ndarray, criticas: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Tasa de anomalías, score medio y recall sobre las reglas críticas en el holdout."""
+    if not artifact or not artifact.get('fitted'):
+        return None
+    X_scaled = artifact['scaler'].transform(X)
+    modelo = artifact['model']
+    anomalias = modelo.predict(X_scaled) == -1
+    scores = modelo.score_samples(X_scaled)
+    return {
+        'tasa_anomalias': float(anomalias.mean()) if anomalias.size else 0.0,
+        'score_medio': float(scores.mean()) if scores.size else 0.0,
+        'scores_finitos': bool(np.isfinite(scores).all()),
+        # Fracción de los casos que disparan las reglas críticas que el modelo también marca
+        'recall_criticas': float(anomalias[criticas].mean()) if criticas.any() else None,
+        'arboles': len(modelo.estimators_),
+    }
+
+
+def entrenar(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Ajusta el candidato (desde cero o agregando árboles) y lo evalúa junto al vigente."""
+    params = payload['params']
+    X_train = np.asarray(payload['X_train'], dtype=np.float64)
+    X_holdout = np.asarray(payload['X_holdout'], dtype=np.float64)
+    criticas = np.asarray(payload['criticas_holdout'], dtype=bool)
+    actual = payload.get('actual')
+    # Medir el vigente antes de un posible warm start, que lo modifica en este proceso
+    metricas_actual = _metricas(actual, X_holdout, criticas)
+
+    inicio = time.perf_counter()
+    base = None
+    if params['warm_start'] and actual and actual.get('fitted'):
+        arboles = len(actual['model'].estimators_)
+        if arboles + params['arboles_nuevos'] <= params['max_arboles']:
+            base = actual
+
+    if base is not None:
+        # Warm start: se conservan el scaler y los árboles vigentes y se agregan
+        # árboles nuevos ajustados solo con la ventana reciente
+        modelo = base['model']
+        modelo.set_params(warm_start=True, n_estimators=len(modelo.estimators_) + params['arboles_nuevos'])
+        scaler = base['scaler']
+        modelo.fit(scaler.transform(X_train))
+        modo = 'warm_start'
+    else:
+        scaler = StandardScaler()
+        # Mismos hiperparámetros que AnomalyDetector (max_samples='auto' acota cada árbol a 256 filas)
+        modelo = IsolationForest(**params['modelo'])
+        modelo.fit(scaler.fit_transform(X_train))
+        modo = 'refit'
+    # El modelo publicado no sigue creciendo si luego se carga sin pasar por aquí
+    modelo.set_params(warm_start=False)
+
+    candidato = {
+        'model': modelo,
+        'scaler': scaler,
+        'feature_names': list(params['feature_names']),
+        'fitted': True,
+    }
+    return {
+        'artifact': candidato,
+        'modo': modo,
+        'duracion_entrenamiento_ms': round((time.perf_counter() - inicio) * 1000.0, 1),
+        'candidato': _metricas(candidato, X_holdout, criticas),
+        'actual': metricas_actual,
+    }
+
+
+def main(argv) -> int:
+    if len(argv) != 3:
+        print("Uso: ia_ml_retrain_worker.py entrada.joblib salida.joblib", file=sys.stderr)
+        return 2
+    joblib.dump(entrenar(joblib.load(argv[1])), argv[2], compress=0)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
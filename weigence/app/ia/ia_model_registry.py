@@ -0,0 +1,239 @@
+"""Versioned on-disk registry for the anomaly model artifacts."""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = Path(__file__).parent.parent.parent / 'data' / 'models'
+
+_CHECK_INTERVAL_SECONDS = float(os.getenv("IA_MODEL_CHECK_INTERVAL", "30"))
+
+_ARTIFACT_NAME = 'model.joblib'
+_MANIFEST_NAME = 'manifest.json'
+_CURRENT_NAME = 'CURRENT'
+
+
+class ModelIntegrityError(RuntimeError):
+    """El artefacto no coincide con el checksum de su manifiesto o con las features esperadas."""
+
+
+@dataclass
+class ModelManifest:
+    """Metadatos de una versión publicada del modelo."""
+
+    version: str
+    created_at: str
+    feature_names: List[str]
+    sha256: str
+    sklearn_version: str = ""
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for bloque in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, contenido: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(contenido)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class ModelRegistry:
+    """Stores each trained model in its own version directory.
+
+    ``CURRENT`` points to the active version and is swapped atomically, so
+    readers never observe a half-written artifact. Artifacts are saved
+    uncompressed so the tree arrays can be memory-mapped on load. Verified
+    checksums are cached by file mtime and size, so reloading an unchanged
+    artifact does not read it whole again.
+    """
+
+    def __init__(self, root: Path | None = None) -> None:
+        self._root = Path(root or REGISTRY_PATH)
+        self._checksums: Dict[Path, Tuple[int, int, str]] = {}
+        self._checksums_lock = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def current_version(self) -> Optional[str]:
+        puntero = self._root / _CURRENT_NAME
+        try:
+            return puntero.read_text(encoding='utf-8').strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, artifact: Dict[str, Any], *, extra: Dict[str, Any] | None = None) -> ModelManifest:
+        """Guarda ``artifact`` como nueva versión y la marca como vigente."""
+
+        try:
+            import sklearn
+            sklearn_version = sklearn.__version__
+        except ImportError:  # pragma: no cover - sklearn es dependencia del proyecto
+            sklearn_version = ""
+
+        version = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        destino = self._root / version
+        destino.mkdir(parents=True, exist_ok=False)
+
+        ruta_artefacto = destino / _ARTIFACT_NAME
+        joblib.dump(artifact, ruta_artefacto, compress=0)
+
+        manifest = ModelManifest(
+            version=version,
+            created_at=datetime.utcnow().isoformat(),
+            feature_names=list(artifact.get('feature_names') or []),
+            sha256=self._checksum(ruta_artefacto),
+            sklearn_version=sklearn_version,
+            extra=dict(extra or {}),
+        )
+        _write_atomic(destino / _MANIFEST_NAME, json.dumps(asdict(manifest), indent=2))
+        _write_atomic(self._root / _CURRENT_NAME, version)
+        logger.info("[ML] Modelo publicado como versión %s", version)
+        return manifest
+
+    def load(
+        self, version: Optional[str] = None, *, expected_features: Optional[Sequence[str]] = None
+    ) -> tuple[Dict[str, Any], ModelManifest]:
+        """Carga una versión (la vigente por defecto) verificando su checksum.
+
+        Con ``expected_features`` también se rechaza un manifiesto cuyas
+        features no coinciden (mismo orden) con las del detector.
+        """
+
+        version = version or self.current_version()
+        if not version:
+            raise FileNotFoundError(f"No hay modelo publicado en {self._root}")
+
+        carpeta = self._root / version
+        manifest = ModelManifest(**json.loads((carpeta / _MANIFEST_NAME).read_text(encoding='utf-8')))
+        if expected_features is not None and list(manifest.feature_names) != list(expected_features):
+            raise ModelIntegrityError(
+                f"El modelo {version} usa features distintas a las esperadas: {manifest.feature_names}"
+            )
+        ruta_artefacto = carpeta / _ARTIFACT_NAME
+        if self._checksum(ruta_artefacto) != manifest.sha256:
+            raise ModelIntegrityError(f"Checksum inválido para el modelo {version}")
+
+        try:
+            artifact = joblib.load(ruta_artefacto, mmap_mode='r')
+        except (ValueError, TypeError):
+            # Algunas versiones de sklearn no aceptan arrays de solo lectura al reconstruir árboles
+            artifact = joblib.load(ruta_artefacto)
+        return artifact, manifest
+
+    def _checksum(self, path: Path) -> str:
+        """sha256 del archivo, recalculado solo si cambió su mtime o tamaño."""
+
+        stat = path.stat()
+        with self._checksums_lock:
+            previo = self._checksums.get(path)
+        if previo and previo[:2] == (stat.st_mtime_ns, stat.st_size):
+            return previo[2]
+        digest = _sha256(path)
+        with self._checksums_lock:
+            self._checksums[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+
+class ModelWatcher:
+    """Polls ``CURRENT`` and hot-swaps the loaded model when it changes.
+
+    Checks are rate limited and the reload runs on a background thread, so
+    callers never wait on disk I/O after the first load.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        on_load: Callable[[Dict[str, Any], ModelManifest], None],
+        *,
+        expected_features: Optional[Sequence[str]] = None,
+        check_interval: float = _CHECK_INTERVAL_SECONDS,
+    ) -> None:
+        self._registry = registry
+        self._on_load = on_load
+        self._expected_features = list(expected_features) if expected_features is not None else None
+        self._check_interval = float(check_interval)
+        self._lock = threading.Lock()
+        self._loaded_version: Optional[str] = None
+        self._last_check = 0.0
+        self._reloading = False
+
+    @property
+    def loaded_version(self) -> Optional[str]:
+        return self._loaded_version
+
+    def load_now(self) -> bool:
+        """Carga síncrona de la versión vigente (usada en el primer acceso)."""
+
+        return self._reload(self._registry.current_version())
+
+    def maybe_reload(self) -> None:
+        """Dispara una recarga en segundo plano si cambió la versión vigente."""
+
+        ahora = time.monotonic()
+        with self._lock:
+            if self._reloading or ahora - self._last_check < self._check_interval:
+                return
+            self._last_check = ahora
+            version = self._registry.current_version()
+            if not version or version == self._loaded_version:
+                return
+            self._reloading = True
+
+        threading.Thread(
+            target=self._reload, args=(version,), name="ia-model-reload", daemon=True
+        ).start()
+
+    def _reload(self, version: Optional[str]) -> bool:
+        try:
+            if not version:
+                return False
+            artifact, manifest = self._registry.load(version, expected_features=self._expected_features)
+            self._on_load(artifact, manifest)
+            self._loaded_version = version
+            logger.info("[ML] Modelo %s activo", version)
+            return True
+        except Exception as exc:
+            logger.exception("[ML] Error cargando modelo %s: %s", version, exc)
+            return False
+        finally:
+            with self._lock:
+                self._reloading = False
+
+
+model_registry = ModelRegistry()
+
+
+__all__ = [
+    "ModelIntegrityError",
+    "ModelManifest",
+    "ModelRegistry",
+    "ModelWatcher",
+    "model_registry",
+]
@@ -0,0 +1,208 @@
+"""Incremental aggregation of movimientos_inventario for IA snapshots."""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from .ia_repository import IARepository, repository
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_RESYNC_SECONDS = float(os.getenv("IA_MOVEMENTS_RESYNC_SECONDS", "3600"))
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parsea timestamps de Supabase asegurando zona horaria UTC."""
+
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    else:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+@dataclass
+class MovementSummary:
+    """Resumen acumulado de movimientos usado por el snapshot."""
+
+    movimientos_sin_producto: int
+    movimientos_huerfanos: int
+    ultimo_movimiento: Optional[datetime]
+    high_water_mark: int
+
+    @property
+    def productos_no_encontrados(self) -> int:
+        return self.movimientos_sin_producto + self.movimientos_huerfanos
+
+    def horas_desde_ultimo(self, ahora: Optional[datetime] = None) -> float:
+        if self.ultimo_movimiento is None:
+            return 0.0
+        ahora = ahora or datetime.now(timezone.utc)
+        return (ahora - self.ultimo_movimiento).total_seconds() / 3600.0
+
+
+class MovementAggregator:
+    """Keeps running movement counters updated from an ``id_movimiento`` high-water mark.
+
+    Each refresh only reads rows newer than the last one seen. Counts are kept
+    per product so that orphan detection needs no re-read of movements. The
+    product id set is loaded once per resync; in between, only ids seen for the
+    first time in new movements are looked up. Edits or deletions of old
+    movements and deleted products are picked up by a periodic full resync.
+    """
+
+    _PAGE_SIZE = 1000
+
+    def __init__(
+        self,
+        repo: IARepository | None = None,
+        *,
+        resync_seconds: float = _DEFAULT_RESYNC_SECONDS,
+    ) -> None:
+        self._repo = repo or repository
+        self._resync_seconds = float(resync_seconds)
+        self._lock = threading.Lock()
+        # Último resumen completo; se conserva entre resincronizaciones
+        self._ultimo_resumen: Optional[MovementSummary] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._high_water_mark = 0
+        self._sin_producto = 0
+        self._por_producto: Counter = Counter()
+        self._ultimo_movimiento: Optional[datetime] = None
+        self._productos_existentes: Set[Any] = set()
+        self._productos_cargados = False
+        # Ids de movimientos nuevos que no están en el conjunto cargado
+        self._por_verificar: Set[Any] = set()
+        self._synced_at = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def refresh(self) -> MovementSummary:
+        """Incorpora los movimientos nuevos y devuelve el resumen vigente.
+
+        Si la lectura falla se devuelve el último resumen completo (o se
+        propaga el error si aún no hay uno); las páginas ya leídas quedan
+        acumuladas y el próximo refresh continúa desde el high-water mark.
+        """
+
+        with self._lock:
+            if time.monotonic() - self._synced_at >= self._resync_seconds:
+                logger.debug("[IA] Resincronización completa de movimientos")
+                self._reset()
+
+            try:
+                nuevos = self._consumir_nuevos()
+            except Exception:
+                if self._ultimo_resumen is None:
+                    raise
+                logger.warning("[IA] Error leyendo movimientos nuevos, se mantiene el último resumen")
+                return self._ultimo_resumen
+            self._actualizar_productos()
+            if nuevos:
+                logger.debug(
+                    "[IA] %s movimientos nuevos agregados (high-water mark=%s)",
+                    nuevos,
+                    self._high_water_mark,
+                )
+            self._ultimo_resumen = self._resumen()
+            return self._ultimo_resumen
+
+    def invalidate(self) -> None:
+        """Fuerza una resincronización completa en el próximo refresh."""
+
+        with self._lock:
+            self._reset()
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+    def _consumir_nuevos(self) -> int:
+        total = 0
+        while True:
+            filas = self._repo.obtener_movimientos_posteriores(
+                self._high_water_mark, limite=self._PAGE_SIZE, propagar=True
+            )
+            if not filas:
+                break
+            self._acumular(filas)
+            total += len(filas)
+            if len(filas) < self._PAGE_SIZE:
+                break
+        return total
+
+    def _acumular(self, filas: Iterable[Dict[str, Any]]) -> None:
+        for fila in filas:
+            try:
+                id_mov = int(fila.get("id_movimiento") or 0)
+            except (TypeError, ValueError):
+                id_mov = 0
+            self._high_water_mark = max(self._high_water_mark, id_mov)
+
+            idproducto = fila.get("idproducto")
+            if idproducto:
+                self._por_producto[idproducto] += 1
+                if self._productos_cargados and idproducto not in self._productos_existentes:
+                    self._por_verificar.add(idproducto)
+            else:
+                self._sin_producto += 1
+
+            fecha = _parse_timestamp(fila.get("timestamp"))
+            if fecha and (self._ultimo_movimiento is None or fecha > self._ultimo_movimiento):
+                self._ultimo_movimiento = fecha
+
+    def _actualizar_productos(self) -> None:
+        if not self._productos_cargados:
+            filas = self._repo.obtener_ids_productos()
+            # Una respuesta vacía suele ser un error de red: reintentar en el próximo refresh
+            if filas:
+                self._productos_existentes = {f.get("idproducto") for f in filas}
+                self._productos_cargados = True
+                self._por_verificar.clear()
+            return
+
+        if not self._por_verificar:
+            return
+        try:
+            filas = self._repo.obtener_ids_productos(sorted(self._por_verificar, key=str), propagar=True)
+        except Exception:
+            # Se reintenta en el próximo refresh; mientras tanto cuentan como huérfanos
+            return
+        self._productos_existentes.update(f.get("idproducto") for f in filas)
+        self._por_verificar.clear()
+
+    def _resumen(self) -> MovementSummary:
+        huerfanos = 0
+        if self._productos_existentes:
+            huerfanos = sum(
+                cantidad
+                for idproducto, cantidad in self._por_producto.items()
+                if idproducto not in self._productos_existentes
+            )
+        return MovementSummary(
+            movimientos_sin_producto=self._sin_producto,
+            movimientos_huerfanos=huerfanos,
+            ultimo_movimiento=self._ultimo_movimiento,
+            high_water_mark=self._high_water_mark,
+        )
+
+
+movement_aggregator = MovementAggregator()
+
+
+__all__ = ["MovementAggregator", "MovementSummary", "movement_aggregator"]
@@ -0,0 +1,447 @@
+"""Online rolling-window statistics for the IA snapshot metrics."""
+from __future__ import annotations
+
+from bisect import insort
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .ia_repository import IARepository, repository
+
+logger = logging.getLogger(__name__)
+
+IA_ONLINE_STATS = os.getenv("IA_ONLINE_STATS", "1").lower() not in ("0", "false", "no")
+_BUCKET_SECONDS = float(os.getenv("IA_STATS_BUCKET_SECONDS", "300"))
+_HORIZON_HOURS = float(os.getenv("IA_STATS_HORIZON_HOURS", "72"))
+_REFRESH_SECONDS = float(os.getenv("IA_STATS_REFRESH_SECONDS", "5"))
+_RESYNC_SECONDS = float(os.getenv("IA_STATS_RESYNC_SECONDS", "900"))
+
+# Valores más antiguos/recientes que guarda cada bucket (cambio relativo de 3 contra 3)
+_EXTREMOS = 3
+# Filas con fecha más allá de esto (reloj desfasado) no se agregan: desplazarían buckets vigentes
+_FUTURO_MAX_SECONDS = 3600.0
+
+
+def _epoch(value: Any) -> Optional[float]:
+    """Segundos UTC; las fechas sin zona horaria se asumen UTC, igual que en el snapshot."""
+
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def es_pesaje_sin_stock(pesaje: Mapping[str, Any]) -> bool:
+    """Criterio de ``productos_sin_stock`` (peso o stock en cero)."""
+
+    return float(pesaje.get("peso_unitario", 0) or 0) == 0 or int(pesaje.get("stock", 0) or 0) == 0
+
+
+def es_movimiento_no_justificado(movimiento: Mapping[str, Any]) -> bool:
+    """Ajuste manual sin motivo registrado."""
+
+    return movimiento.get("tipo") == "ajuste_manual" and not movimiento.get("motivo")
+
+
+@dataclass
+class RunningStats:
+    """Welford accumulator; two accumulators merge exactly (Chan et al.)."""
+
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def add(self, valor: float) -> None:
+        self.n += 1
+        delta = valor - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (valor - self.mean)
+
+    def merge(self, otro: "RunningStats") -> None:
+        if otro.n == 0:
+            return
+        if self.n == 0:
+            self.n, self.mean, self.m2 = otro.n, otro.mean, otro.m2
+            return
+        n = self.n + otro.n
+        delta = otro.mean - self.mean
+        self.mean += delta * otro.n / n
+        self.m2 += otro.m2 + delta * delta * self.n * otro.n / n
+        self.n = n
+
+    @property
+    def pstdev(self) -> float:
+        return math.sqrt(max(self.m2, 0.0) / self.n) if self.n else 0.0
+
+
+@dataclass
+class _Bucket:
+    """Agregados de las filas de un intervalo de ``bucket_seconds``."""
+
+    indice: int
+    stats: RunningStats = field(default_factory=RunningStats)
+    suma: float = 0.0
+    marcados: int = 0
+    ultimo_ts: float = -math.inf
+    primeros: List[Tuple[float, float]] = field(default_factory=list)
+    ultimos: List[Tuple[float, float]] = field(default_factory=list)
+    valores: Optional[List[Tuple[float, float]]] = None  # Solo en series que calculan tercios
+
+    def add(self, ts: float, valor: float, marcado: bool) -> None:
+        self.stats.add(valor)
+        self.suma += valor
+        self.marcados += int(marcado)
+        self.ultimo_ts = max(self.ultimo_ts, ts)
+        par = (ts, valor)
+        insort(self.primeros, par)
+        del self.primeros[_EXTREMOS:]
+        insort(self.ultimos, par)
+        del self.ultimos[:-_EXTREMOS]
+        if self.valores is not None:
+            insort(self.valores, par)
+
+
+def _suma_extremos(buckets: Sequence[_Bucket], k: int, *, desde_el_final: bool) -> float:
+    """Suma de los ``k`` valores más antiguos (o más recientes) de la ventana."""
+
+    total = 0.0
+    for bucket in (reversed(buckets) if desde_el_final else buckets):
+        if k <= 0:
+            break
+        if bucket.stats.n <= k:
+            total += bucket.suma
+            k -= bucket.stats.n
+            continue
+        fuente = bucket.valores if bucket.valores is not None else (
+            bucket.ultimos if desde_el_final else bucket.primeros
+        )
+        if k > len(fuente):
+            raise ValueError("La serie no guarda valores suficientes para este cálculo")
+        parte = fuente[-k:] if desde_el_final else fuente[:k]
+        total += sum(valor for _, valor in parte)
+        k = 0
+    return total
+
+
+@dataclass(frozen=True)
+class WindowStats:
+    """Aggregates of one series over a window, merged from its buckets.
+
+    Mirrors ``SnapshotBuilder._calcular_*`` on the raw rows of the window.
+    """
+
+    n: int = 0
+    suma: float = 0.0
+    mean: float = 0.0
+    pstdev: float = 0.0
+    ultimo: Optional[float] = None
+    ultimo_ts: Optional[float] = None
+    marcados: int = 0
+    suma_tercio_inicial: float = 0.0
+    suma_tercio_final: float = 0.0
+    suma_primeros: float = 0.0
+    suma_ultimos: float = 0.0
+
+    @classmethod
+    def from_buckets(cls, buckets: Sequence[_Bucket], *, con_tercios: bool) -> "WindowStats":
+        if not buckets:
+            return cls()
+        stats = RunningStats()
+        for bucket in buckets:
+            stats.merge(bucket.stats)
+        tercio = max(1, stats.n // 3)
+        extremos = min(_EXTREMOS, stats.n)
+        return cls(
+            n=stats.n,
+            suma=sum(bucket.suma for bucket in buckets),
+            mean=stats.mean,
+            pstdev=stats.pstdev,
+            ultimo=buckets[-1].ultimos[-1][1],
+            ultimo_ts=max(bucket.ultimo_ts for bucket in buckets),
+            marcados=sum(bucket.marcados for bucket in buckets),
+            suma_tercio_inicial=_suma_extremos(buckets, tercio, desde_el_final=False) if con_tercios else 0.0,
+            suma_tercio_final=_suma_extremos(buckets, tercio, desde_el_final=True) if con_tercios else 0.0,
+            suma_primeros=_suma_extremos(buckets, extremos, desde_el_final=False),
+            suma_ultimos=_suma_extremos(buckets, extremos, desde_el_final=True),
+        )
+
+    @property
+    def baseline(self) -> Optional[float]:
+        """Promedio sin el último valor (o el único valor)."""
+
+        if self.n > 1:
+            return (self.suma - self.ultimo) / (self.n - 1)
+        return self.ultimo
+
+    def volatilidad(self) -> float:
+        if self.n < 2 or self.mean == 0:
+            return 0.0
+        return self.pstdev / abs(self.mean)
+
+    def z_score(self) -> float:
+        if self.n < 2 or self.pstdev == 0:
+            return 0.0
+        promedio = self.baseline if self.n > 2 else self.mean
+        return (self.ultimo - promedio) / self.pstdev
+
+    def tendencia(self) -> float:
+        """Promedio del último tercio contra el del primero."""
+
+        if self.n < 3:
+            return 0.0
+        tercio = max(1, self.n // 3)
+        anterior = self.suma_tercio_inicial / tercio
+        if anterior == 0:
+            return 0.0
+        return (self.suma_tercio_final / tercio - anterior) / abs(anterior)
+
+    def cambio_relativo(self) -> float:
+        """Promedio de los 3 valores más recientes contra los 3 más antiguos."""
+
+        if self.n < 3:
+            return 0.0
+        anterior = self.suma_primeros / _EXTREMOS
+        if anterior == 0:
+            return 0.0
+        return (self.suma_ultimos / _EXTREMOS - anterior) / abs(anterior)
+
+
+class RollingSeries:
+    """Ring buffer of time buckets covering ``horizon_seconds``.
+
+    A slot is reused when its bucket falls out of the horizon, so memory is
+    bounded by the number of buckets (plus the raw values of the horizon for
+    series that keep them), not by the history length.
+    """
+
+    def __init__(self, *, bucket_seconds: float, horizon_seconds: float, guardar_valores: bool = False) -> None:
+        self._ancho = float(bucket_seconds)
+        self._slots: List[Optional[_Bucket]] = [None] * (int(math.ceil(horizon_seconds / self._ancho)) + 1)
+        self._guardar_valores = guardar_valores
+
+    def add(self, ts: float, valor: float, marcado: bool = False) -> bool:
+        indice = int(ts // self._ancho)
+        posicion = indice % len(self._slots)
+        bucket = self._slots[posicion]
+        if bucket is None or bucket.indice < indice:
+            bucket = _Bucket(indice, valores=[] if self._guardar_valores else None)
+            self._slots[posicion] = bucket
+        elif bucket.indice > indice:
+            return False  # Más antigua que el horizonte
+        bucket.add(ts, valor, marcado)
+        return True
+
+    def window(self, desde_ts: float) -> WindowStats:
+        """Agregados desde el bucket que contiene ``desde_ts`` (resolución de un bucket)."""
+
+        inicio = int(desde_ts // self._ancho)
+        buckets = sorted(
+            (bucket for bucket in self._slots if bucket is not None and bucket.indice >= inicio),
+            key=lambda bucket: bucket.indice,
+        )
+        return WindowStats.from_buckets(buckets, con_tercios=self._guardar_valores)
+
+    def filas(self) -> int:
+        return sum(bucket.stats.n for bucket in self._slots if bucket is not None)
+
+
+@dataclass(frozen=True)
+class _Fuente:
+    """Tabla que alimenta una serie: columnas, valor agregado y criterio de conteo."""
+
+    tabla: str
+    id_campo: str
+    fecha_campo: str
+    columnas: str
+    valor: Callable[[Mapping[str, Any]], float]
+    marcado: Callable[[Mapping[str, Any]], bool] = lambda fila: False
+    guardar_valores: bool = False
+
+
+# Mismas columnas y criterios que las lecturas por ventana de SnapshotBuilder
+FUENTES: Dict[str, _Fuente] = {
+    "ventas": _Fuente(
+        tabla="ventas", id_campo="idventa", fecha_campo="fecha_venta",
+        columnas="idventa,total,fecha_venta",
+        valor=lambda fila: float(fila.get("total") or 0.0),
+        guardar_valores=True,  # La tendencia compara tercios de la ventana
+    ),
+    "detalles": _Fuente(
+        tabla="detalle_ventas", id_campo="iddetalle", fecha_campo="fecha_detalle",
+        columnas="iddetalle,idproducto,cantidad,fecha_detalle",
+        valor=lambda fila: float(fila.get("cantidad") or 0.0),
+        marcado=lambda fila: float(fila.get("cantidad") or 0.0) > 0,
+    ),
+    "pesajes": _Fuente(
+        tabla="pesajes", id_campo="idpesaje", fecha_campo="fecha_pesaje",
+        columnas="idpesaje,peso_unitario,fecha_pesaje",
+        valor=lambda fila: float(fila.get("peso_unitario") or 0.0),
+        marcado=es_pesaje_sin_stock,
+    ),
+    "movimientos": _Fuente(
+        tabla="movimientos_inventario", id_campo="id_movimiento", fecha_campo="timestamp",
+        columnas="id_movimiento,tipo_evento,rut_usuario,timestamp,observacion",
+        valor=lambda fila: 1.0,
+        marcado=es_movimiento_no_justificado,
+    ),
+}
+
+
+class OnlineSnapshotStats:
+    """Rolling-window aggregates of the snapshot tables, fed incrementally.
+
+    Each refresh reads only rows whose id is above the last one seen (the first
+    read is bounded to the horizon) and adds them to per-table bucket rings, so
+    a snapshot merges a fixed number of buckets instead of re-reading and
+    re-scanning 24-72 h of rows. Window edges have bucket resolution. Edits or
+    deletions of old rows are picked up by a periodic full resync.
+    """
+
+    _PAGE_SIZE = 1000
+
+    def __init__(
+        self,
+        repo: IARepository | None = None,
+        *,
+        bucket_seconds: float = _BUCKET_SECONDS,
+        horizon_hours: float = _HORIZON_HOURS,
+        refresh_seconds: float = _REFRESH_SECONDS,
+        resync_seconds: float = _RESYNC_SECONDS,
+        fuentes: Mapping[str, _Fuente] = FUENTES,
+    ) -> None:
+        self._repo = repo or repository
+        self._bucket_seconds = float(bucket_seconds)
+        self._horizon_hours = float(horizon_hours)
+        self._refresh_seconds = float(refresh_seconds)
+        self._resync_seconds = float(resync_seconds)
+        self._fuentes = dict(fuentes)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._series = {
+            nombre: RollingSeries(
+                bucket_seconds=self._bucket_seconds,
+                horizon_seconds=self._horizon_hours * 3600.0,
+                guardar_valores=fuente.guardar_valores,
+            )
+            for nombre, fuente in self._fuentes.items()
+        }
+        self._high_water_marks = {nombre: 0 for nombre in self._fuentes}
+        self._synced_at = time.monotonic()
+        self._refreshed_at: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    @property
+    def horizon_hours(self) -> float:
+        return self._horizon_hours
+
+    def refresh(self) -> None:
+        """Incorpora las filas nuevas (a lo sumo cada ``refresh_seconds``)."""
+
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora - self._synced_at >= self._resync_seconds:
+                logger.debug("[IA] Resincronización completa de las estadísticas del snapshot")
+                self._reset()
+            elif self._refreshed_at is not None and ahora - self._refreshed_at < self._refresh_seconds:
+                return
+
+            for nombre in self._fuentes:
+                nuevas = self._consumir_nuevas(nombre)
+                if nuevas:
+                    logger.debug(
+                        "[IA] %s filas nuevas de %s (high-water mark=%s)",
+                        nuevas, nombre, self._high_water_marks[nombre],
+                    )
+            self._refreshed_at = time.monotonic()
+
+    def window(self, serie: str, desde: datetime) -> WindowStats:
+        with self._lock:
+            return self._series[serie].window(_epoch(desde))
+
+    def invalidate(self) -> None:
+        """Fuerza una resincronización completa en el próximo refresh."""
+
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bucket_seconds": self._bucket_seconds,
+                "horizon_hours": self._horizon_hours,
+                "age_seconds": round(time.monotonic() - self._refreshed_at, 3) if self._refreshed_at else None,
+                "synced_seconds_ago": round(time.monotonic() - self._synced_at, 3),
+                "series": {
+                    nombre: {"filas": serie.filas(), "high_water_mark": self._high_water_marks[nombre]}
+                    for nombre, serie in self._series.items()
+                },
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+    def _consumir_nuevas(self, nombre: str) -> int:
+        fuente = self._fuentes[nombre]
+        serie = self._series[nombre]
+        desde = datetime.utcnow() - timedelta(hours=self._horizon_hours)
+        limite_futuro = time.time() + _FUTURO_MAX_SECONDS
+        total = 0
+        while True:
+            anterior = self._high_water_marks[nombre]
+            filas = self._repo.obtener_filas_posteriores(
+                table=fuente.tabla,
+                columns=fuente.columnas,
+                id_field=fuente.id_campo,
+                id_desde=anterior,
+                date_field=fuente.fecha_campo,
+                desde=desde,
+                limite=self._PAGE_SIZE,
+            )
+            for fila in filas:
+                try:
+                    id_fila = int(fila.get(fuente.id_campo) or 0)
+                except (TypeError, ValueError):
+                    id_fila = 0
+                self._high_water_marks[nombre] = max(self._high_water_marks[nombre], id_fila)
+
+                ts = _epoch(fila.get(fuente.fecha_campo))
+                if ts is None or ts > limite_futuro:
+                    continue
+                try:
+                    serie.add(ts, fuente.valor(fila), fuente.marcado(fila))
+                except (TypeError, ValueError):
+                    continue
+            total += len(filas)
+            # Sin avance del high-water mark otra página repetiría las mismas filas
+            if len(filas) < self._PAGE_SIZE or self._high_water_marks[nombre] == anterior:
+                return total
+
+
+online_stats = OnlineSnapshotStats()
+
+
+__all__ = [
+    "IA_ONLINE_STATS",
+    "OnlineSnapshotStats",
+    "RollingSeries",
+    "RunningStats",
+    "WindowStats",
+    "es_movimiento_no_justificado",
+    "es_pesaje_sin_stock",
+    "online_stats",
+]
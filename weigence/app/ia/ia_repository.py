@@ -1,15 +1,26 @@
 """Data access layer for the IA engine."""
 from __future__ import annotations
 
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+from dataclasses import dataclass, field
 from datetime import datetime
 import logging
-from typing import Any, Dict, List
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
 
 from api.conexion_supabase import supabase
 
 logger = logging.getLogger(__name__)
 
+# Pool compartido para las lecturas concurrentes del snapshot (acotado por proceso)
+_FETCH_WORKERS = int(os.getenv("IA_FETCH_WORKERS", "5"))
+_FETCH_TIMEOUT_SECONDS = float(os.getenv("IA_FETCH_TIMEOUT", "8"))
+_fetch_pool = ThreadPoolExecutor(max_workers=_FETCH_WORKERS, thread_name_prefix="ia-fetch")
+# Las lecturas masivas del histórico (backfill) van aparte para no ocupar el pool del snapshot
+_historico_pool = ThreadPoolExecutor(max_workers=5, thread_name_prefix="ia-historico")
+
 
 @dataclass
 class AuditLogPayload:
@@ -51,6 +62,23 @@ class AuditLogPayload:
         }
 
 
+@dataclass
+class SnapshotWindows:
+    """Resultado de las lecturas por ventana que alimentan un snapshot."""
+
+    ventas: List[Dict[str, Any]] = field(default_factory=list)
+    detalles: List[Dict[str, Any]] = field(default_factory=list)
+    pesajes: List[Dict[str, Any]] = field(default_factory=list)
+    alertas: List[Dict[str, Any]] = field(default_factory=list)
+    movimientos: List[Dict[str, Any]] = field(default_factory=list)
+    fallidas: List[str] = field(default_factory=list)
+    duracion_ms: float = 0.0
+
+    @property
+    def completo(self) -> bool:
+        return not self.fallidas
+
+
 class IARepository:
     """Wrapper around Supabase queries used by the IA engine."""
 
@@ -60,14 +88,22 @@ class IARepository:
     # ------------------------------------------------------------------
     # Utilidades internas
     # ------------------------------------------------------------------
-    def _execute(self, query: Any, *, table: str, operation: str) -> List[Dict[str, Any]]:
-        """Ejecuta consultas SELECT asegurando logs consistentes."""
+    def _execute(
+        self, query: Any, *, table: str, operation: str, propagar: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Ejecuta consultas SELECT asegurando logs consistentes.
+
+        Con ``propagar=True`` el error se relanza en vez de devolver ``[]``,
+        para que quien llama distinga una consulta fallida de "sin datos".
+        """
 
         try:
             response = query.execute()
             return response.data or []
         except Exception:  # pragma: no cover - logging defensivo
             logger.exception("[IA] Error en %s sobre %s", operation, table)
+            if propagar:
+                raise
             return []
 
     def _insert(self, table: str, payload: Dict[str, Any]) -> bool:
@@ -81,7 +117,7 @@ class IARepository:
             return False
 
     def _fetch_since(
-        self, *, table: str, columns: str, date_field: str, desde: datetime
+        self, *, table: str, columns: str, date_field: str, desde: datetime, propagar: bool = False
     ) -> List[Dict[str, Any]]:
         """Obtiene registros filtrados por fecha usando una plantilla común."""
 
@@ -91,12 +127,44 @@ class IARepository:
             .gte(date_field, desde.isoformat())
             .order(date_field, desc=True)
         )
-        return self._execute(query, table=table, operation="select")
+        return self._execute(query, table=table, operation="select", propagar=propagar)
+
+    def _fetch_between(
+        self,
+        *,
+        table: str,
+        columns: str,
+        date_field: str,
+        desde: datetime,
+        hasta: datetime,
+        page_size: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """Lectura masiva paginada de un rango de fechas, en orden ascendente.
+
+        Lanza si falla cualquier página: un histórico truncado no debe pasar por completo.
+        """
+
+        filas: List[Dict[str, Any]] = []
+        inicio = 0
+        while True:
+            query = (
+                self._client.table(table)
+                .select(columns)
+                .gte(date_field, desde.isoformat())
+                .lte(date_field, hasta.isoformat())
+                .order(date_field)
+                .range(inicio, inicio + page_size - 1)
+            )
+            pagina = self._execute(query, table=table, operation="select", propagar=True)
+            filas.extend(pagina)
+            if len(pagina) < page_size:
+                return filas
+            inicio += page_size
 
     # ------------------------------------------------------------------
     # Fetch helpers
     # ------------------------------------------------------------------
-    def obtener_ventas_desde(self, desde: datetime) -> List[Dict[str, Any]]:
+    def obtener_ventas_desde(self, desde: datetime, *, propagar: bool = False) -> List[Dict[str, Any]]:
         """Devuelve ventas registradas desde la fecha indicada."""
 
         return self._fetch_since(
@@ -104,9 +172,10 @@ class IARepository:
             columns="total,fecha_venta",
             date_field="fecha_venta",
             desde=desde,
+            propagar=propagar,
         )
 
-    def obtener_detalle_ventas_desde(self, desde: datetime) -> List[Dict[str, Any]]:
+    def obtener_detalle_ventas_desde(self, desde: datetime, *, propagar: bool = False) -> List[Dict[str, Any]]:
         """Obtiene el detalle de ventas respetando el timestamp ya existente."""
 
         return self._fetch_since(
@@ -114,9 +183,10 @@ class IARepository:
             columns="idproducto,cantidad,fecha_detalle",
             date_field="fecha_detalle",
             desde=desde,
+            propagar=propagar,
         )
 
-    def obtener_pesajes_desde(self, desde: datetime) -> List[Dict[str, Any]]:
+    def obtener_pesajes_desde(self, desde: datetime, *, propagar: bool = False) -> List[Dict[str, Any]]:
         """Recupera pesajes registrados en la ventana solicitada."""
 
         return self._fetch_since(
@@ -124,9 +194,10 @@ class IARepository:
             columns="peso_unitario,fecha_pesaje",
             date_field="fecha_pesaje",
             desde=desde,
+            propagar=propagar,
         )
 
-    def obtener_alertas_desde(self, desde: datetime) -> List[Dict[str, Any]]:
+    def obtener_alertas_desde(self, desde: datetime, *, propagar: bool = False) -> List[Dict[str, Any]]:
         """Lista las alertas activas/pendientes desde la fecha de referencia."""
 
         query = (
@@ -136,9 +207,9 @@ class IARepository:
             .in_("estado", ["pendiente", "activo"])
             .order("fecha_creacion", desc=True)
         )
-        return self._execute(query, table="alertas", operation="select")
+        return self._execute(query, table="alertas", operation="select", propagar=propagar)
 
-    def obtener_movimientos_desde(self, desde: datetime) -> List[Dict[str, Any]]:
+    def obtener_movimientos_desde(self, desde: datetime, *, propagar: bool = False) -> List[Dict[str, Any]]:
         """Entrega los movimientos de inventario ordenados por timestamp."""
 
         return self._fetch_since(
@@ -146,7 +217,163 @@ class IARepository:
             columns="tipo_evento,rut_usuario,timestamp,observacion",
             date_field="timestamp",
             desde=desde,
+            propagar=propagar,
+        )
+
+    def obtener_ventanas_snapshot(
+        self,
+        *,
+        ventas_desde: datetime,
+        pesajes_desde: datetime,
+        movimientos_desde: datetime,
+        timeout: float = _FETCH_TIMEOUT_SECONDS,
+    ) -> SnapshotWindows:
+        """Lanza en paralelo las cinco lecturas por ventana del snapshot.
+
+        Cada consulta comparte el mismo plazo ``timeout``; las que lanzan error
+        o no terminan a tiempo se devuelven vacías y quedan listadas en
+        ``fallidas``. Una consulta vencida que ya empezó no se puede cancelar:
+        sigue ocupando su hilo del pool hasta que responda o venza el timeout
+        del cliente HTTP, y su resultado se descarta.
+        """
+
+        consultas: Dict[str, Callable[[], List[Dict[str, Any]]]] = {
+            "ventas": lambda: self.obtener_ventas_desde(ventas_desde, propagar=True),
+            "detalles": lambda: self.obtener_detalle_ventas_desde(ventas_desde, propagar=True),
+            "pesajes": lambda: self.obtener_pesajes_desde(pesajes_desde, propagar=True),
+            "alertas": lambda: self.obtener_alertas_desde(movimientos_desde, propagar=True),
+            "movimientos": lambda: self.obtener_movimientos_desde(movimientos_desde, propagar=True),
+        }
+
+        inicio = time.perf_counter()
+        # copy_context: las consultas del pool cuentan en el perfil del request que las lanzó
+        futures = {
+            nombre: _fetch_pool.submit(contextvars.copy_context().run, fn)
+            for nombre, fn in consultas.items()
+        }
+        wait(futures.values(), timeout=timeout)
+
+        resultado = SnapshotWindows()
+        for nombre, future in futures.items():
+            if not future.done():
+                # Solo evita que arranque si seguía en cola
+                future.cancel()
+                logger.warning("[IA] Timeout (%.1fs) leyendo %s para el snapshot", timeout, nombre)
+                resultado.fallidas.append(nombre)
+                continue
+            try:
+                setattr(resultado, nombre, future.result())
+            except Exception:  # pragma: no cover - logging defensivo
+                # El detalle ya quedó en el log de _execute
+                logger.warning("[IA] Error leyendo %s para el snapshot", nombre)
+                resultado.fallidas.append(nombre)
+
+        resultado.duracion_ms = (time.perf_counter() - inicio) * 1000.0
+        logger.debug(
+            "[IA] Lecturas del snapshot en %.1f ms (fallidas=%s)",
+            resultado.duracion_ms,
+            resultado.fallidas or "ninguna",
+        )
+        return resultado
+
+    def obtener_historico(self, desde: datetime, hasta: datetime) -> SnapshotWindows:
+        """Lectura masiva de las cinco tablas del snapshot para reconstruir histórico.
+
+        A diferencia de ``obtener_alertas_desde`` no filtra por estado: el estado
+        histórico de una alerta no se conserva, así que se usan todas las creadas.
+        Las tablas cuya lectura falla quedan vacías y listadas en ``fallidas``.
+        """
+
+        consultas: Dict[str, Callable[[], List[Dict[str, Any]]]] = {
+            "ventas": lambda: self._fetch_between(
+                table="ventas", columns="total,fecha_venta",
+                date_field="fecha_venta", desde=desde, hasta=hasta,
+            ),
+            "detalles": lambda: self._fetch_between(
+                table="detalle_ventas", columns="idproducto,cantidad,fecha_detalle",
+                date_field="fecha_detalle", desde=desde, hasta=hasta,
+            ),
+            "pesajes": lambda: self._fetch_between(
+                table="pesajes", columns="peso_unitario,fecha_pesaje",
+                date_field="fecha_pesaje", desde=desde, hasta=hasta,
+            ),
+            "alertas": lambda: self._fetch_between(
+                table="alertas", columns="id,tipo_color,titulo,estado,fecha_creacion",
+                date_field="fecha_creacion", desde=desde, hasta=hasta,
+            ),
+            "movimientos": lambda: self._fetch_between(
+                table="movimientos_inventario", columns="tipo_evento,rut_usuario,timestamp,observacion",
+                date_field="timestamp", desde=desde, hasta=hasta,
+            ),
+        }
+
+        inicio = time.perf_counter()
+        futures = {
+            nombre: _historico_pool.submit(contextvars.copy_context().run, fn)
+            for nombre, fn in consultas.items()
+        }
+        resultado = SnapshotWindows()
+        for nombre, future in futures.items():
+            try:
+                setattr(resultado, nombre, future.result())
+            except Exception:  # pragma: no cover - logging defensivo
+                logger.exception("[IA] Error leyendo histórico de %s", nombre)
+                resultado.fallidas.append(nombre)
+        resultado.duracion_ms = (time.perf_counter() - inicio) * 1000.0
+        return resultado
+
+    def obtener_movimientos_posteriores(
+        self, id_desde: int, *, limite: int = 1000, propagar: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Movimientos con ``id_movimiento`` mayor al indicado, en orden ascendente."""
+
+        query = (
+            self._client.table("movimientos_inventario")
+            .select("id_movimiento,idproducto,timestamp")
+            .gt("id_movimiento", id_desde)
+            .order("id_movimiento")
+            .limit(limite)
+        )
+        return self._execute(
+            query, table="movimientos_inventario", operation="select", propagar=propagar
+        )
+
+    def obtener_filas_posteriores(
+        self,
+        *,
+        table: str,
+        columns: str,
+        id_field: str,
+        id_desde: int,
+        date_field: str,
+        desde: datetime,
+        limite: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """Filas con ``id_field`` mayor al indicado y fecha desde ``desde``, en orden de id.
+
+        El filtro de fecha acota la primera lectura (``id_desde=0``) a la ventana
+        útil en vez de recorrer toda la tabla.
+        """
+
+        query = (
+            self._client.table(table)
+            .select(columns)
+            .gt(id_field, id_desde)
+            .gte(date_field, desde.isoformat())
+            .order(id_field)
+            .limit(limite)
         )
+        return self._execute(query, table=table, operation="select")
+
+    def obtener_ids_productos(
+        self, ids: Optional[List[Any]] = None, *, propagar: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Lista solo los identificadores de la tabla productos (o cuáles de ``ids`` existen)."""
+
+        query = self._client.table("productos").select("idproducto")
+        if ids is not None:
+            query = query.in_("idproducto", list(ids))
+        return self._execute(query, table="productos", operation="select", propagar=propagar)
 
     # ------------------------------------------------------------------
     # Persistence helpers
@@ -0,0 +1,278 @@
+"""Vectorized evaluation plan for the rule profiles of ``ia_engine.json``."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Orden de las columnas de la matriz de métricas (mismas claves que IAEngine._extraer_metricas)
+METRIC_NAMES: Tuple[str, ...] = (
+    "trend_percent",
+    "sales_anomaly_score",
+    "sales_volatility",
+    "last_sale_total",
+    "baseline_sale",
+    "weight_volatility",
+    "weight_change_rate",
+    "last_weight",
+    "critical_alerts",
+    "warning_alerts",
+    "info_alerts",
+    "alerts_total",
+    "movements_per_hour",
+    "inactivity_hours",
+    "signal_strength",
+)
+METRIC_INDEX: Dict[str, int] = {name: i for i, name in enumerate(METRIC_NAMES)}
+
+# Columna del store de snapshots (data/snapshots) para cada métrica
+_STORE_FIELDS: Dict[str, str] = {
+    "trend_percent": "sales_trend_percent",
+    "sales_anomaly_score": "sales_anomaly_score",
+    "sales_volatility": "sales_volatility",
+    "last_sale_total": "last_sale_total",
+    "baseline_sale": "baseline_sale",
+    "weight_volatility": "weight_volatility",
+    "weight_change_rate": "weight_change_rate",
+    "last_weight": "last_weight",
+    "critical_alerts": "critical_alerts",
+    "warning_alerts": "warning_alerts",
+    "info_alerts": "info_alerts",
+    "movements_per_hour": "movements_per_hour",
+    "inactivity_hours": "inactivity_hours",
+    "signal_strength": "signal_strength",
+}
+
+_ABOVE, _BELOW, _BETWEEN = 0, 1, 2
+_SEVERITIES = np.array(["info", "warning", "critical"], dtype=object)
+
+
+def metric_vector(metricas: Mapping[str, float]) -> np.ndarray:
+    """Fila de la matriz de métricas a partir del dict de ``_extraer_metricas``."""
+
+    return np.array([float(metricas.get(name, 0.0)) for name in METRIC_NAMES], dtype=np.float64)
+
+
+def metric_matrix_from_records(records: np.ndarray) -> np.ndarray:
+    """Matriz (N, M) desde registros del ``SnapshotStore``; los NaN cuentan como 0."""
+
+    matriz = np.zeros((len(records), len(METRIC_NAMES)), dtype=np.float64)
+    for name, campo in _STORE_FIELDS.items():
+        matriz[:, METRIC_INDEX[name]] = records[campo]
+    matriz = np.nan_to_num(matriz, nan=0.0)
+    matriz[:, METRIC_INDEX["alerts_total"]] = (
+        matriz[:, METRIC_INDEX["critical_alerts"]]
+        + matriz[:, METRIC_INDEX["warning_alerts"]]
+        + matriz[:, METRIC_INDEX["info_alerts"]]
+    )
+    return matriz
+
+
+@dataclass
+class PlanResult:
+    """Resultado de evaluar un perfil sobre N filas de métricas."""
+
+    best: np.ndarray          # (N,) índice de la regla ganadora, -1 si ninguna aplica
+    totals: np.ndarray        # (N, R) score total de cada regla
+    valid: np.ndarray         # (N, R) la regla supera su minimum_score
+    scores: np.ndarray        # (N, K) contribución (sin peso) de cada métrica del plan
+    severity: np.ndarray      # (N,) severidad de la regla ganadora ("info" si ninguna)
+
+    @property
+    def best_scores(self) -> np.ndarray:
+        filas = np.arange(len(self.best))
+        return np.where(self.best >= 0, self.totals[filas, np.maximum(self.best, 0)], np.nan)
+
+
+@dataclass
+class CompiledProfile:
+    """Reglas de un perfil como vectores: una entrada por (regla, métrica) evaluable.
+
+    ``rules`` conserva las ``RuleConfig`` parseadas para armar el insight de la
+    regla ganadora (resumen, drivers, data points).
+    """
+
+    name: str
+    config: Dict[str, Any]
+    rules: List[Any]
+    metric_idx: np.ndarray
+    direction: np.ndarray
+    threshold: np.ndarray
+    scale: np.ndarray
+    clamp: np.ndarray
+    weight: np.ndarray
+    denom: np.ndarray
+    rango: np.ndarray
+    rule_of: np.ndarray
+    assign: np.ndarray
+    minimum_score: np.ndarray
+    warning_at: np.ndarray
+    critical_at: np.ndarray
+    phrases: List[Optional[str]] = field(default_factory=list)
+    # Mismo plan en tuplas de Python: para una sola fila es más rápido que NumPy
+    entries: List[Tuple[str, int, float, float, float, float, float, float, int]] = field(default_factory=list)
+    limits: List[Tuple[float, float, float]] = field(default_factory=list)  # (mínimo, warning, critical)
+
+    def evaluate_one(self, metricas: Mapping[str, float]) -> Tuple[int, List[float], List[float], str]:
+        """Evalúa una fila: ``(regla ganadora o -1, totales por regla, score por entrada, severidad)``."""
+
+        totals = [0.0] * len(self.rules)
+        con_aporte = [False] * len(self.rules)
+        scores: List[float] = []
+        for nombre, codigo, threshold, scale, clamp, weight, denom, rango, regla in self.entries:
+            valor = metricas[nombre]
+            if codigo == _BELOW:
+                delta = threshold - valor
+            elif codigo == _BETWEEN:
+                delta = max(0.0, 1 - abs(valor - threshold) / rango)
+            else:
+                delta = valor - threshold
+            score = min(max(0.0, delta / denom) * scale, clamp)
+            scores.append(score)
+            if score > 0:
+                totals[regla] += score * weight
+                con_aporte[regla] = True
+
+        mejor = -1
+        for regla, total in enumerate(totals):
+            if con_aporte[regla] and total >= self.limits[regla][0] and (mejor < 0 or total > totals[mejor]):
+                mejor = regla
+        if mejor < 0:
+            return mejor, totals, scores, "info"
+        _, warning_at, critical_at = self.limits[mejor]
+        if totals[mejor] >= critical_at:
+            return mejor, totals, scores, "critical"
+        if totals[mejor] >= warning_at:
+            return mejor, totals, scores, "warning"
+        return mejor, totals, scores, "info"
+
+    def evaluate_matrix(self, matriz: np.ndarray) -> PlanResult:
+        """Evalúa todas las reglas del perfil sobre ``matriz`` (N, len(METRIC_NAMES))."""
+
+        matriz = np.atleast_2d(np.asarray(matriz, dtype=np.float64))
+        valores = matriz[:, self.metric_idx]
+
+        delta = np.where(self.direction == _BELOW, self.threshold - valores, valores - self.threshold)
+        con_rango = self.direction == _BETWEEN
+        if con_rango.any():
+            entre = np.maximum(0.0, 1.0 - np.abs(valores - self.threshold) / self.rango)
+            delta = np.where(con_rango, entre, delta)
+
+        scores = np.minimum(np.maximum(0.0, delta / self.denom) * self.scale, self.clamp)
+        positivos = scores > 0
+        totals = np.where(positivos, scores * self.weight, 0.0) @ self.assign
+        con_aporte = (positivos.astype(np.float64) @ self.assign) > 0
+        valid = con_aporte & (totals >= self.minimum_score)
+
+        if not self.rules:
+            best = np.full(len(matriz), -1)
+            return PlanResult(best=best, totals=totals, valid=valid, scores=scores, severity=_SEVERITIES[best + 1])
+
+        # argmax devuelve la primera regla en caso de empate, igual que el recorrido en orden
+        best = np.argmax(np.where(valid, totals, -np.inf), axis=1)
+        best = np.where(valid.any(axis=1), best, -1)
+
+        ganador = np.maximum(best, 0)
+        score_ganador = totals[np.arange(len(best)), ganador]
+        nivel = np.where(
+            score_ganador >= self.critical_at[ganador], 2,
+            np.where(score_ganador >= self.warning_at[ganador], 1, 0),
+        )
+        nivel = np.where(best >= 0, nivel, 0)
+        return PlanResult(best=best, totals=totals, valid=valid, scores=scores, severity=_SEVERITIES[nivel])
+
+    def entries_of(self, regla: int) -> np.ndarray:
+        """Índices (en orden de configuración) de las entradas del plan de una regla."""
+
+        return np.flatnonzero(self.rule_of == regla)
+
+
+def compile_profile(
+    name: str,
+    perfil_cfg: Mapping[str, Any],
+    rules: Sequence[Any],
+    thresholds: Mapping[str, float],
+) -> CompiledProfile:
+    """Compila las ``RuleConfig`` ya parseadas de un perfil.
+
+    Las métricas que el motor no calcula se omiten del plan (nunca aportan
+    score), igual que en la evaluación regla a regla.
+    """
+
+    idx: List[int] = []
+    direction: List[int] = []
+    threshold: List[float] = []
+    scale: List[float] = []
+    clamp: List[float] = []
+    weight: List[float] = []
+    rule_of: List[int] = []
+    phrases: List[Optional[str]] = []
+
+    for r, regla in enumerate(rules):
+        for metrica in regla.metrics:
+            columna = METRIC_INDEX.get(metrica.name)
+            if columna is None:
+                continue
+            sentido = metrica.direction.lower()
+            codigo = _BELOW if sentido == "below" else _BETWEEN if sentido == "between" else _ABOVE
+            if codigo == _BETWEEN and abs(metrica.threshold - metrica.scale) == 0:
+                continue  # Rango vacío: la contribución siempre es 0
+            idx.append(columna)
+            direction.append(codigo)
+            threshold.append(metrica.threshold)
+            scale.append(metrica.scale)
+            clamp.append(metrica.clamp)
+            weight.append(metrica.weight)
+            rule_of.append(r)
+            phrases.append(metrica.phrase)
+
+    threshold_arr = np.array(threshold, dtype=np.float64)
+    scale_arr = np.array(scale, dtype=np.float64)
+    rule_of_arr = np.array(rule_of, dtype=np.int64)
+    assign = np.zeros((len(rule_of), len(rules)), dtype=np.float64)
+    assign[np.arange(len(rule_of)), rule_of_arr] = 1.0
+    denom = np.maximum(np.abs(threshold_arr), 1.0)
+    rango = np.abs(threshold_arr - scale_arr)
+    rango = np.where(rango > 0, rango, 1.0)
+
+    niveles = [{**thresholds, **regla.severity_thresholds} for regla in rules]
+    limits = [
+        (float(regla.minimum_score), float(n.get("warning", 0.5)), float(n.get("critical", 0.8)))
+        for regla, n in zip(rules, niveles)
+    ]
+
+    return CompiledProfile(
+        name=name,
+        config=dict(perfil_cfg),
+        rules=list(rules),
+        metric_idx=np.array(idx, dtype=np.int64),
+        direction=np.array(direction, dtype=np.int64),
+        threshold=threshold_arr,
+        scale=scale_arr,
+        clamp=np.array(clamp, dtype=np.float64),
+        weight=np.array(weight, dtype=np.float64),
+        denom=denom,
+        rango=rango,
+        rule_of=rule_of_arr,
+        assign=assign,
+        minimum_score=np.array([l[0] for l in limits], dtype=np.float64),
+        warning_at=np.array([l[1] for l in limits], dtype=np.float64),
+        critical_at=np.array([l[2] for l in limits], dtype=np.float64),
+        phrases=phrases,
+        entries=[
+            (METRIC_NAMES[c], d, float(t), float(sc), float(cl), float(w), float(dn), float(rg), int(r))
+            for c, d, t, sc, cl, w, dn, rg, r in zip(idx, direction, threshold, scale, clamp, weight, denom, rango, rule_of)
+        ],
+        limits=limits,
+    )
+
+
+__all__ = [
+    "METRIC_NAMES",
+    "CompiledProfile",
+    "PlanResult",
+    "compile_profile",
+    "metric_matrix_from_records",
+    "metric_vector",
+]
@@ -60,7 +60,7 @@ class IAService:
             "[IAService] Generando snapshot para contexto=%s perfil=%s", contexto_key, perfil_ia
         )
 
-        base_snapshot = self._builder.build(contexto=contexto_key)
+        base_snapshot = self._builder.build_cached(contexto=contexto_key)
         merged_snapshot = base_snapshot.merge(data)
         context_data = self._context_builder.get_context_data(contexto_key, merged_snapshot)
         final_snapshot = merged_snapshot.merge(context_data)
@@ -74,7 +74,7 @@ class IAService:
             ml_insights.get('severity')
         )
 
-        insight = self._engine.evaluate(final_snapshot, profile=perfil_ia)
+        insight = self._engine.evaluate(final_snapshot, profile=perfil_ia, contexto=contexto_key)
         logger.debug(
             "[IAService] Insight calculado: key=%s severity=%s score=%.3f",
             insight.key,
@@ -0,0 +1,148 @@
+"""Process-wide TTL cache for IA snapshots with single-flight builds."""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_DEFAULT_TTL_SECONDS = float(os.getenv("IA_SNAPSHOT_CACHE_TTL", "30"))
+
+
+@dataclass
+class _CacheEntry:
+    """Valor cacheado junto a su instante de construcción."""
+
+    value: Any
+    created_at: float
+
+    def age(self, now: float) -> float:
+        return max(0.0, now - self.created_at)
+
+
+@dataclass
+class _InFlight:
+    """Construcción en curso compartida por todos los solicitantes de una clave."""
+
+    done: threading.Event = field(default_factory=threading.Event)
+    value: Any = None
+    error: Optional[BaseException] = None
+
+
+class SnapshotCache:
+    """TTL cache keyed by context and window sizes.
+
+    Concurrent misses for the same key are coalesced: the first caller builds
+    the value while the rest wait on the same in-flight build.
+    """
+
+    def __init__(self, ttl_seconds: float = _DEFAULT_TTL_SECONDS) -> None:
+        self._ttl = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _CacheEntry] = {}
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._errors = 0
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl
+
+    def set_ttl(self, ttl_seconds: float) -> None:
+        """Actualiza el TTL; un valor <= 0 desactiva el caché."""
+
+        with self._lock:
+            self._ttl = float(ttl_seconds)
+
+    def get_or_build(self, key: Hashable, factory: Callable[[], T]) -> T:
+        """Devuelve el valor vigente para ``key`` o lo construye una sola vez."""
+
+        if self._ttl <= 0:
+            return factory()
+
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and entry.age(now) < self._ttl:
+                self._hits += 1
+                return entry.value
+
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = _InFlight()
+                self._in_flight[key] = pending
+                self._misses += 1
+                owner = True
+            else:
+                self._waits += 1
+                owner = False
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            value = factory()
+        except BaseException as exc:
+            pending.error = exc
+            with self._lock:
+                self._errors += 1
+                self._in_flight.pop(key, None)
+            pending.done.set()
+            raise
+
+        pending.value = value
+        with self._lock:
+            self._entries[key] = _CacheEntry(value=value, created_at=time.monotonic())
+            self._in_flight.pop(key, None)
+        pending.done.set()
+        return value
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """Descarta una clave concreta o todo el caché."""
+
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso y edad de cada entrada, en segundos."""
+
+        with self._lock:
+            now = time.monotonic()
+            total = self._hits + self._misses + self._waits
+            return {
+                "ttl_seconds": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced_waits": self._waits,
+                "errors": self._errors,
+                "hit_ratio": round((self._hits + self._waits) / total, 3) if total else 0.0,
+                "in_flight": len(self._in_flight),
+                "entries": [
+                    {
+                        "key": list(key) if isinstance(key, tuple) else key,
+                        "age_seconds": round(entry.age(now), 3),
+                        "expired": entry.age(now) >= self._ttl,
+                    }
+                    for key, entry in self._entries.items()
+                ],
+            }
+
+
+snapshot_cache = SnapshotCache()
+
+
+__all__ = ["SnapshotCache", "snapshot_cache"]
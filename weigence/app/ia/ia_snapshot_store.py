@@ -0,0 +1,241 @@
+"""Append-only on-disk store of IA snapshots for ML training."""
+from __future__ import annotations
+
+from datetime import datetime
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Any, Iterable, Mapping, Optional
+
+import numpy as np
+
+from .ia_snapshot_utils import safe_float
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = Path(__file__).parent.parent.parent / 'data' / 'snapshots' / 'ia_snapshots_v1.bin'
+
+_STORE_ENABLED = os.getenv("IA_SNAPSHOT_STORE_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Campos escalares de IASnapshot.to_dict(); las listas (totales, pesos, patrones) no se guardan.
+NUMERIC_FIELDS = (
+    'sales_window_hours',
+    'weight_window_hours',
+    'movement_window_hours',
+    'sales_trend_percent',
+    'sales_anomaly_score',
+    'sales_volatility',
+    'last_sale_total',
+    'baseline_sale',
+    'weight_volatility',
+    'weight_change_rate',
+    'last_weight',
+    'critical_alerts',
+    'warning_alerts',
+    'info_alerts',
+    'movements_per_hour',
+    'inactivity_hours',
+    'signal_strength',
+    'total_productos',
+    'productos_sin_stock',
+    'ventas_ultimas_24h',
+    'movimientos_no_justificados',
+    'usuarios_sospechosos',
+    'audit_events_count',
+    'estantes_sobrecargados',
+    'productos_no_encontrados_movimientos',
+    'tiempo_ultimo_movimiento',
+)
+
+# Registro de ancho fijo: cambiar el layout exige un nuevo archivo (_v2)
+RECORD_DTYPE = np.dtype(
+    [('generated_at', 'datetime64[s]'), ('contexto', 'S16')]
+    + [(name, np.float64) for name in NUMERIC_FIELDS]
+)
+
+_OPTIONAL_FIELDS = {'last_sale_total', 'baseline_sale', 'last_weight'}
+_ALERT_FIELDS = {'critical_alerts': 'critical', 'warning_alerts': 'warning', 'info_alerts': 'info'}
+
+
+def _as_datetime64(value: Any) -> np.datetime64:
+    if isinstance(value, datetime):
+        return np.datetime64(value.replace(tzinfo=None), 's')
+    if isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return np.datetime64(parsed.replace(tzinfo=None), 's')
+        except ValueError:
+            pass
+    return np.datetime64('NaT', 's')
+
+
+def snapshot_record(data: Mapping[str, Any], contexto: str = "") -> np.ndarray:
+    """Convierte ``IASnapshot.to_dict()`` en un registro de ancho fijo."""
+
+    record = np.zeros(1, dtype=RECORD_DTYPE)
+    record['generated_at'] = _as_datetime64(data.get('generated_at'))
+    record['contexto'] = (contexto or "").encode('utf-8')[:16]
+    alerts = data.get('alerts_summary') if isinstance(data.get('alerts_summary'), Mapping) else {}
+    for name in NUMERIC_FIELDS:
+        if name in _ALERT_FIELDS:
+            valor = data.get(name, alerts.get(_ALERT_FIELDS[name]))
+        else:
+            valor = data.get(name)
+        default = np.nan if name in _OPTIONAL_FIELDS else 0.0
+        record[name] = safe_float(valor, default)
+    return record
+
+
+def _filtrar(
+    registros: np.ndarray,
+    desde: Optional[datetime],
+    hasta: Optional[datetime],
+    contexto: Optional[str],
+) -> np.ndarray:
+    mascara = np.ones(len(registros), dtype=bool)
+    if desde is not None:
+        mascara &= registros['generated_at'] >= _as_datetime64(desde)
+    if hasta is not None:
+        mascara &= registros['generated_at'] <= _as_datetime64(hasta)
+    if contexto:
+        mascara &= registros['contexto'] == contexto.encode('utf-8')[:16]
+    return np.array(registros[mascara])
+
+
+class SnapshotStore:
+    """Fixed-width append-only snapshot log readable through a NumPy memmap.
+
+    Records are appended with a single ``write`` on a file opened in append
+    mode, so several workers can share the same file. A trailing partial
+    record (crash mid-write) is ignored on read.
+    """
+
+    def __init__(self, path: Path | None = None, *, enabled: bool = _STORE_ENABLED) -> None:
+        self._path = Path(path or STORE_PATH)
+        self._enabled = enabled
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def append(self, snapshot: Any, contexto: str = "") -> bool:
+        """Agrega un snapshot (``IASnapshot`` o su ``to_dict()``)."""
+
+        return self.append_many([snapshot], contexto=contexto) > 0
+
+    def append_many(self, snapshots: Iterable[Any], contexto: str = "") -> int:
+        if not self._enabled:
+            return 0
+        records = [
+            snapshot_record(s.to_dict() if hasattr(s, 'to_dict') else s, contexto)
+            for s in snapshots
+        ]
+        if not records:
+            return 0
+        return self._escribir(np.concatenate(records))
+
+    def _escribir(self, registros: np.ndarray) -> int:
+        try:
+            with self._lock:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self._path, 'ab') as fh:
+                    fh.write(registros.tobytes())
+            return len(registros)
+        except OSError:
+            logger.exception("[IA] No se pudo escribir en %s", self._path)
+            return 0
+
+    def append_missing(self, snapshots: Iterable[Any], contexto: str = "") -> int:
+        """Como ``append_many`` pero omite los ``(generated_at, contexto)`` ya guardados.
+
+        Pensado para backfills: repetirlos no duplica el histórico que usa el
+        entrenamiento.
+        """
+        if not self._enabled:
+            return 0
+        records = [
+            snapshot_record(s.to_dict() if hasattr(s, 'to_dict') else s, contexto)
+            for s in snapshots
+        ]
+        if not records:
+            return 0
+        nuevos = np.concatenate(records)
+        fechas = nuevos['generated_at']
+        validas = fechas[~np.isnat(fechas)]
+        existentes = set()
+        if validas.size:
+            guardados = self.read(
+                desde=validas.min().astype(datetime),
+                hasta=validas.max().astype(datetime),
+                contexto=contexto,
+            )
+            existentes = set(guardados['generated_at'].astype('int64').tolist())
+        vistos = set()
+        mascara = np.zeros(len(nuevos), dtype=bool)
+        for i, valor in enumerate(fechas.astype('int64').tolist()):
+            if valor not in existentes and valor not in vistos:
+                mascara[i] = True
+                vistos.add(valor)
+        if not mascara.any():
+            return 0
+        return self._escribir(nuevos[mascara])
+
+    def read(
+        self,
+        *,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        contexto: Optional[str] = None,
+    ) -> np.ndarray:
+        """Devuelve los registros (structured array) filtrados por fecha/contexto."""
+
+        if not self._path.exists():
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        total = self._path.stat().st_size // RECORD_DTYPE.itemsize
+        if total == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+
+        registros = np.memmap(self._path, dtype=RECORD_DTYPE, mode='r', shape=(total,))
+        return _filtrar(registros, desde, hasta, contexto)
+
+    def read_recent(
+        self,
+        limite: int,
+        *,
+        desde: Optional[datetime] = None,
+        contexto: Optional[str] = None,
+    ) -> np.ndarray:
+        """Como ``read`` pero mirando solo los últimos ``limite`` registros del archivo.
+
+        El costo depende de ``limite`` y no del tamaño del histórico; el
+        resultado queda ordenado por ``generated_at``.
+        """
+
+        total = self.count()
+        limite = min(int(limite), total)
+        if limite <= 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+
+        registros = np.memmap(
+            self._path,
+            dtype=RECORD_DTYPE,
+            mode='r',
+            offset=(total - limite) * RECORD_DTYPE.itemsize,
+            shape=(limite,),
+        )
+        recientes = _filtrar(registros, desde, None, contexto)
+        # Los backfills agregan registros antiguos al final: ordenar por fecha
+        return recientes[np.argsort(recientes['generated_at'], kind='stable')]
+
+    def count(self) -> int:
+        if not self._path.exists():
+            return 0
+        return self._path.stat().st_size // RECORD_DTYPE.itemsize
+
+
+snapshot_store = SnapshotStore()
+
+
+__all__ = ["NUMERIC_FIELDS", "RECORD_DTYPE", "SnapshotStore", "snapshot_record", "snapshot_store"]
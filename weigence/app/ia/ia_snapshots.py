@@ -1,14 +1,29 @@
 """Snapshot builder that aggregates recent operational data."""
 from __future__ import annotations
 
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import logging
 from statistics import mean, pstdev
 from typing import Any, Dict, Iterable, List, Optional
 
+from .ia_movement_aggregator import MovementAggregator, movement_aggregator
+from .ia_online_stats import (
+    IA_ONLINE_STATS,
+    OnlineSnapshotStats,
+    WindowStats,
+    es_movimiento_no_justificado,
+    es_pesaje_sin_stock,
+    online_stats,
+)
 from .ia_repository import IARepository, repository
+from .ia_snapshot_cache import SnapshotCache, snapshot_cache
+from .ia_snapshot_store import SnapshotStore, snapshot_store
 from .ia_snapshot_utils import snapshot_to_dict
 
+logger = logging.getLogger(__name__)
+
 
 def _default_alerts() -> Dict[str, int]:
     return {"critical": 0, "warning": 0, "info": 0}
@@ -68,6 +83,29 @@ def _coerce_patterns(values: Any) -> List[str]:
     return [str(values)]
 
 
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class _SerieTemporal:
+    """Filas ordenadas por fecha con recorte de ventanas por bisección."""
+
+    def __init__(self, filas: Iterable[Dict[str, object]], campo: str) -> None:
+        pares = sorted(
+            ((_naive_utc(_parse_datetime(fila.get(campo))), fila) for fila in filas),
+            key=lambda par: par[0],
+        )
+        self._fechas = [fecha for fecha, _ in pares]
+        self._filas = [fila for _, fila in pares]
+
+    def ventana(self, hasta: datetime, horas: int) -> List[Dict[str, object]]:
+        inicio = bisect_left(self._fechas, hasta - timedelta(hours=horas))
+        fin = bisect_right(self._fechas, hasta)
+        return self._filas[inicio:fin]
+
+
 @dataclass
 class IASnapshot:
     """Aggregated metrics that describe the operational context."""
@@ -191,24 +229,119 @@ class IASnapshot:
 class SnapshotBuilder:
     """Coordinates data extraction and transformation into an IASnapshot."""
 
-    def __init__(self, repo: IARepository | None = None) -> None:
+    def __init__(
+        self,
+        repo: IARepository | None = None,
+        cache: SnapshotCache | None = None,
+        movimientos: MovementAggregator | None = None,
+        store: SnapshotStore | None = None,
+        estadisticas: OnlineSnapshotStats | None = None,
+    ) -> None:
         self._repo = repo or repository
+        self._cache = cache or snapshot_cache
+        self._movimientos = movimientos or movement_aggregator
+        self._store = store or snapshot_store
+        self._estadisticas = estadisticas or online_stats
 
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
+    def build_cached(self, contexto: str | None = None) -> IASnapshot:
+        """Devuelve el snapshot compartido del contexto mientras siga vigente.
+
+        El resultado se comparte entre requests: tratarlo como solo lectura
+        (``merge`` ya devuelve una copia).
+        """
+
+        ventanas = self._resolver_ventanas(contexto)
+        clave = (contexto or "", *ventanas)
+        return self._cache.get_or_build(clave, lambda: self._build_y_registrar(contexto))
+
+    def _build_y_registrar(self, contexto: str | None) -> IASnapshot:
+        snapshot = self.build(contexto)
+        # Histórico para entrenamiento ML: un registro por snapshot construido
+        self._store.append(snapshot, contexto=contexto or "")
+        return snapshot
+
+    def build_historico(
+        self,
+        desde: datetime,
+        hasta: datetime,
+        *,
+        paso_horas: int = 1,
+        contexto: str | None = "auditoria",
+    ) -> List[IASnapshot]:
+        """Reconstruye snapshots cada ``paso_horas`` entre ``desde`` y ``hasta``.
+
+        Usa una única lectura masiva y recorta cada ventana en memoria. Las
+        métricas que solo existen como estado actual (estantes, productos
+        huérfanos) quedan en cero.
+        """
+
+        sales_window, weight_window, movement_window = self._resolver_ventanas(contexto)
+        margen = timedelta(hours=max(sales_window, weight_window, movement_window))
+        datos = self._repo.obtener_historico(desde - margen, hasta)
+
+        series = {
+            "ventas": _SerieTemporal(datos.ventas, "fecha_venta"),
+            "detalles": _SerieTemporal(datos.detalles, "fecha_detalle"),
+            "pesajes": _SerieTemporal(datos.pesajes, "fecha_pesaje"),
+            "alertas": _SerieTemporal(datos.alertas, "fecha_creacion"),
+            "movimientos": _SerieTemporal(datos.movimientos, "timestamp"),
+        }
+
+        snapshots: List[IASnapshot] = []
+        instante = _naive_utc(desde)
+        fin = _naive_utc(hasta)
+        paso = timedelta(hours=max(1, paso_horas))
+        while instante <= fin:
+            ventas = series["ventas"].ventana(instante, sales_window)
+            detalles = series["detalles"].ventana(instante, sales_window)
+            pesajes = series["pesajes"].ventana(instante, weight_window)
+            alertas = series["alertas"].ventana(instante, movement_window)
+            movimientos = series["movimientos"].ventana(instante, movement_window)
+
+            snapshot = IASnapshot(
+                generated_at=instante,
+                sales_window_hours=sales_window,
+                weight_window_hours=weight_window,
+                movement_window_hours=movement_window,
+            )
+            self._enriquecer_ventas(snapshot, ventas)
+            self._enriquecer_pesajes(snapshot, pesajes)
+            self._enriquecer_alertas(snapshot, alertas)
+            self._enriquecer_movimientos(snapshot, movimientos)
+            snapshot.ventas_ultimas_24h = len(series["ventas"].ventana(instante, 24))
+            snapshot.audit_events_count = len(movimientos) + len(alertas)
+            self._inferir_patrones(snapshot, detalles)
+            snapshots.append(snapshot)
+            instante += paso
+
+        return snapshots
+
     def build(self, contexto: str | None = None) -> IASnapshot:
         ahora = datetime.utcnow()
-        sales_window = 48 if contexto != "inventario" else 72
-        weight_window = 24
-        movement_window = 24
+        sales_window, weight_window, movement_window = self._resolver_ventanas(contexto)
         print(f"[DEBUG BUILD] Construyendo snapshot para contexto: {contexto}, ventana movimientos: {movement_window}h")
 
-        ventas = self._repo.obtener_ventas_desde(ahora - timedelta(hours=sales_window))
-        detalles = self._repo.obtener_detalle_ventas_desde(ahora - timedelta(hours=sales_window))
-        pesajes = self._repo.obtener_pesajes_desde(ahora - timedelta(hours=weight_window))
-        alertas = self._repo.obtener_alertas_desde(ahora - timedelta(hours=movement_window))
-        movimientos = self._repo.obtener_movimientos_desde(ahora - timedelta(hours=movement_window))
+        if IA_ONLINE_STATS and max(sales_window, weight_window, movement_window) <= self._estadisticas.horizon_hours:
+            try:
+                return self._build_incremental(ahora, sales_window, weight_window, movement_window)
+            except Exception as e:
+                logger.debug("[IA] Estadísticas incrementales no disponibles (%s), leyendo ventanas completas", e)
+
+        ventanas = self._repo.obtener_ventanas_snapshot(
+            ventas_desde=ahora - timedelta(hours=sales_window),
+            pesajes_desde=ahora - timedelta(hours=weight_window),
+            movimientos_desde=ahora - timedelta(hours=movement_window),
+        )
+        if not ventanas.completo:
+            logger.debug("[IA] Snapshot parcial, lecturas sin datos: %s", ventanas.fallidas)
+        ventas = ventanas.ventas
+        detalles = ventanas.detalles
+        pesajes = ventanas.pesajes
+        alertas = ventanas.alertas
+        movimientos = ventanas.movimientos
 
         snapshot = IASnapshot(
             generated_at=ahora,
@@ -233,6 +366,81 @@ class SnapshotBuilder:
 
         return snapshot
     
+    def _build_incremental(
+        self, ahora: datetime, sales_window: int, weight_window: int, movement_window: int
+    ) -> IASnapshot:
+        """Snapshot a partir de los agregados incrementales: solo alertas y estado actual van a la BD."""
+
+        self._estadisticas.refresh()
+        ventas = self._estadisticas.window("ventas", ahora - timedelta(hours=sales_window))
+        detalles = self._estadisticas.window("detalles", ahora - timedelta(hours=sales_window))
+        pesajes = self._estadisticas.window("pesajes", ahora - timedelta(hours=weight_window))
+        movimientos = self._estadisticas.window("movimientos", ahora - timedelta(hours=movement_window))
+        alertas = self._repo.obtener_alertas_desde(ahora - timedelta(hours=movement_window))
+
+        # Las series crudas (sales_totals, weight_values) no se copian: quedan vacías
+        snapshot = IASnapshot(
+            generated_at=ahora,
+            sales_window_hours=sales_window,
+            weight_window_hours=weight_window,
+            movement_window_hours=movement_window,
+        )
+        self._aplicar_ventas(snapshot, ventas)
+        self._aplicar_pesajes(snapshot, pesajes)
+        self._enriquecer_alertas(snapshot, alertas)
+        self._aplicar_movimientos(snapshot, movimientos)
+
+        self._enriquecer_estado_actual(snapshot, [], [])
+        snapshot.productos_sin_stock = pesajes.marcados
+        snapshot.ventas_ultimas_24h = self._estadisticas.window("ventas", ahora - timedelta(hours=24)).n
+        snapshot.audit_events_count = movimientos.n + len(alertas)
+        snapshot.usuarios_sospechosos = 0
+
+        self._inferir_patrones(snapshot, [], productos_vendidos=detalles.marcados > 0)
+        logger.debug("[IA] Snapshot completado desde estadísticas incrementales")
+        return snapshot
+
+    def _aplicar_ventas(self, snapshot: IASnapshot, ventas: WindowStats) -> None:
+        snapshot.sales_totals = []
+        if not ventas.n:
+            snapshot.sales_volatility = 0.0
+            snapshot.sales_anomaly_score = 0.0
+            snapshot.sales_trend_percent = 0.0
+            return
+        snapshot.last_sale_total = ventas.ultimo
+        snapshot.baseline_sale = ventas.baseline
+        snapshot.sales_volatility = ventas.volatilidad()
+        snapshot.sales_anomaly_score = ventas.z_score()
+        snapshot.sales_trend_percent = ventas.tendencia()
+
+    def _aplicar_pesajes(self, snapshot: IASnapshot, pesajes: WindowStats) -> None:
+        snapshot.weight_values = []
+        if not pesajes.n:
+            snapshot.weight_volatility = 0.0
+            snapshot.weight_change_rate = 0.0
+            return
+        snapshot.last_weight = pesajes.ultimo
+        snapshot.weight_volatility = pesajes.volatilidad()
+        snapshot.weight_change_rate = pesajes.cambio_relativo()
+
+    def _aplicar_movimientos(self, snapshot: IASnapshot, movimientos: WindowStats) -> None:
+        snapshot.productos_no_encontrados_movimientos = 0
+        if not movimientos.n:
+            snapshot.movements_per_hour = 0.0
+            snapshot.inactivity_hours = float(snapshot.movement_window_hours)
+            snapshot.movimientos_no_justificados = 0
+            return
+        snapshot.movements_per_hour = movimientos.n / (snapshot.movement_window_hours or 1)
+        ultimo = datetime.fromtimestamp(movimientos.ultimo_ts, timezone.utc).replace(tzinfo=None)
+        snapshot.inactivity_hours = max(0.0, (snapshot.generated_at - ultimo).total_seconds() / 3600.0)
+        snapshot.movimientos_no_justificados = movimientos.marcados
+
+    def _resolver_ventanas(self, contexto: str | None) -> tuple[int, int, int]:
+        """Ventanas en horas (ventas, pesajes, movimientos) según el contexto."""
+
+        sales_window = 48 if contexto != "inventario" else 72
+        return sales_window, 24, 24
+
     def _enriquecer_metricas_adicionales(
         self,
         snapshot: IASnapshot,
@@ -243,32 +451,10 @@ class SnapshotBuilder:
         detalles: List[Dict[str, object]]
     ) -> None:
         """Calcula métricas adicionales para mensajes accionables del header."""
-        print(f"[DEBUG] 🚀 _enriquecer_metricas_adicionales EJECUTÁNDOSE...")
-        
-        # Total de productos únicos - consultar directamente la tabla productos
-        try:
-            from api.conexion_supabase import supabase
-            productos_response = supabase.table('productos').select('idproducto', count='exact').execute()
-            snapshot.total_productos = productos_response.count if productos_response.count else 0
-            print(f"[DEBUG] 📊 Total productos en BD: {snapshot.total_productos}")
-        except Exception as e:
-            print(f"[DEBUG] ⚠️ Error contando productos: {e}")
-            # Fallback al método anterior
-            productos_unicos = set()
-            for pesaje in pesajes:
-                if pesaje.get('idproducto'):
-                    productos_unicos.add(pesaje.get('idproducto'))
-            for detalle in detalles:
-                if detalle.get('idproducto'):
-                    productos_unicos.add(detalle.get('idproducto'))
-            snapshot.total_productos = len(productos_unicos) if productos_unicos else 0
-        
+        self._enriquecer_estado_actual(snapshot, pesajes, detalles)
+
         # Productos sin stock (peso = 0 o stock = 0)
-        productos_sin_stock = sum(
-            1 for pesaje in pesajes 
-            if float(pesaje.get('peso_unitario', 0)) == 0 or int(pesaje.get('stock', 0)) == 0
-        )
-        snapshot.productos_sin_stock = productos_sin_stock
+        snapshot.productos_sin_stock = sum(1 for pesaje in pesajes if es_pesaje_sin_stock(pesaje))
         
         # Ventas en las últimas 24 horas
         ahora = datetime.utcnow()
@@ -285,6 +471,32 @@ class SnapshotBuilder:
         # Usuarios con actividad sospechosa (múltiples ajustes manuales en poco tiempo)
         # Por ahora lo dejamos en 0, se puede calcular con datos de auditoría
         snapshot.usuarios_sospechosos = 0
+
+    def _enriquecer_estado_actual(
+        self,
+        snapshot: IASnapshot,
+        pesajes: List[Dict[str, object]],
+        detalles: List[Dict[str, object]],
+    ) -> None:
+        """Métricas del estado actual (productos, estantes, movimientos huérfanos), no de ventana."""
+
+        # Total de productos únicos - consultar directamente la tabla productos
+        try:
+            from api.conexion_supabase import supabase
+            productos_response = supabase.table('productos').select('idproducto', count='exact').execute()
+            snapshot.total_productos = productos_response.count if productos_response.count else 0
+            logger.debug("[IA] Total productos en BD: %s", snapshot.total_productos)
+        except Exception as e:
+            logger.debug("[IA] Error contando productos: %s", e)
+            # Fallback al método anterior
+            productos_unicos = set()
+            for pesaje in pesajes:
+                if pesaje.get('idproducto'):
+                    productos_unicos.add(pesaje.get('idproducto'))
+            for detalle in detalles:
+                if detalle.get('idproducto'):
+                    productos_unicos.add(detalle.get('idproducto'))
+            snapshot.total_productos = len(productos_unicos) if productos_unicos else 0
         
         # Calcular estantes sobrecargados
         try:
@@ -301,92 +513,24 @@ class SnapshotBuilder:
         except Exception:
             snapshot.estantes_sobrecargados = 0
         
-        # Contar productos no encontrados - Método más eficiente
-        print(f"[DEBUG] 🔍 Iniciando cálculo de productos no encontrados...")
+        # Productos no encontrados y último movimiento: agregado incremental por high-water mark
         try:
-            from api.conexion_supabase import supabase
-            
-            # Estrategia 1: Obtener todos los movimientos con todos los campos relevantes
-            todos_movimientos = supabase.table('movimientos_inventario') \
-                .select('*') \
-                .execute().data or []
-            
-            print(f"[DEBUG] 📦 Total movimientos en BD: {len(todos_movimientos)}")
-            
-            # Obtener IDs únicos de productos mencionados en movimientos (excluir None)
-            ids_productos_en_movimientos = {m['idproducto'] for m in todos_movimientos if m.get('idproducto')}
-            print(f"[DEBUG] 📊 IDs únicos en movimientos: {len(ids_productos_en_movimientos)}")
-            
-            # Contar movimientos con idproducto NULL
-            movimientos_sin_producto = sum(1 for m in todos_movimientos if not m.get('idproducto'))
-            print(f"[DEBUG] ⚠️ Movimientos con idproducto NULL: {movimientos_sin_producto}")
-            
-            # Obtener IDs de productos que SÍ existen en la tabla productos
-            productos_existentes = supabase.table('productos').select('idproducto').execute().data or []
-            ids_productos_existentes = {p['idproducto'] for p in productos_existentes}
-            print(f"[DEBUG] 📊 Productos en BD: {len(ids_productos_existentes)}")
-            
-            # Encontrar IDs de productos que NO existen
-            ids_faltantes = ids_productos_en_movimientos - ids_productos_existentes
-            
-            # Contar movimientos problemáticos
-            movimientos_problemáticos = movimientos_sin_producto  # Empezar con los NULL
-            
-            if ids_faltantes:
-                print(f"[DEBUG] ⚠️ Productos faltantes: {list(ids_faltantes)}")
-                
-                # Sumar movimientos con idproducto faltante
-                for m in todos_movimientos:
-                    if m.get('idproducto') in ids_faltantes:
-                        movimientos_problemáticos += 1
-
-            print(f"[DEBUG] ⚠️ Total movimientos con productos no encontrados: {movimientos_problemáticos}")
-            snapshot.productos_no_encontrados_movimientos = movimientos_problemáticos
-            
-            # Calcular tiempo desde el último movimiento (consulta separada)
-            ultimo_mov = supabase.table('movimientos_inventario') \
-                .select('timestamp') \
-                .order('timestamp', desc=True) \
-                .limit(1) \
-                .execute()
-            
-            if ultimo_mov.data and len(ultimo_mov.data) > 0:
-                timestamp_str = ultimo_mov.data[0].get('timestamp')
-                if timestamp_str:
-                    try:
-                        from datetime import timezone
-                        # Parsear el timestamp de Supabase asegurando que tenga timezone
-                        if timestamp_str.endswith('Z'):
-                            timestamp_str = timestamp_str.replace('Z', '+00:00')
-                        
-                        timestamp_dt = datetime.fromisoformat(timestamp_str)
-                        
-                        # Si el timestamp no tiene timezone, asignar UTC
-                        if timestamp_dt.tzinfo is None:
-                            timestamp_dt = timestamp_dt.replace(tzinfo=timezone.utc)
-                        
-                        # Usar UTC para el tiempo actual
-                        ahora_utc = datetime.now(timezone.utc)
-                        tiempo_transcurrido = (ahora_utc - timestamp_dt).total_seconds() / 3600.0
-                        snapshot.tiempo_ultimo_movimiento = tiempo_transcurrido
-                        print(f"[DEBUG] ⏱️ Último movimiento: {timestamp_str}")
-                        print(f"[DEBUG] ⏱️ Ahora UTC: {ahora_utc.isoformat()}")
-                        print(f"[DEBUG] ⏱️ Diferencia: {tiempo_transcurrido:.2f} horas ({tiempo_transcurrido * 60:.1f} minutos)")
-                    except Exception as e:
-                        print(f"[ERROR] Error al parsear timestamp: {e}")
-                        snapshot.tiempo_ultimo_movimiento = 0.0
-                else:
-                    snapshot.tiempo_ultimo_movimiento = 0.0
-            else:
-                snapshot.tiempo_ultimo_movimiento = 0.0
-                
+            resumen_mov = self._movimientos.refresh()
+            snapshot.productos_no_encontrados_movimientos = resumen_mov.productos_no_encontrados
+            snapshot.tiempo_ultimo_movimiento = resumen_mov.horas_desde_ultimo()
+            logger.debug(
+                "[IA] Movimientos con productos no encontrados: %s (NULL=%s, huérfanos=%s); "
+                "horas desde último movimiento: %.2f",
+                snapshot.productos_no_encontrados_movimientos,
+                resumen_mov.movimientos_sin_producto,
+                resumen_mov.movimientos_huerfanos,
+                snapshot.tiempo_ultimo_movimiento,
+            )
         except Exception as e:
-            print(f"[ERROR] Error al calcular productos no encontrados: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.warning("[IA] Error al calcular productos no encontrados: %s", e)
             snapshot.productos_no_encontrados_movimientos = 0
             snapshot.tiempo_ultimo_movimiento = 0.0
-    
+
     def _parse_fecha_venta(self, fecha: Any) -> datetime:
         """Parse fecha de venta a datetime."""
         if isinstance(fecha, datetime):
@@ -494,10 +638,7 @@ class SnapshotBuilder:
             )
             
             # Contar movimientos sin justificación (ajustes manuales sin motivo)
-            movimientos_no_justificados = sum(
-                1 for mov in movimientos 
-                if mov.get('tipo') == 'ajuste_manual' and not mov.get('motivo')
-            )
+            movimientos_no_justificados = sum(1 for mov in movimientos if es_movimiento_no_justificado(mov))
             snapshot.movimientos_no_justificados = movimientos_no_justificados
             
             # Contar movimientos de productos no encontrados
@@ -514,6 +655,8 @@ class SnapshotBuilder:
         self,
         snapshot: IASnapshot,
         detalles: List[Dict[str, object]],
+        *,
+        productos_vendidos: Optional[bool] = None,
     ) -> None:
         patrones: List[str] = []
         if snapshot.sales_trend_percent <= -0.2:
@@ -534,8 +677,10 @@ class SnapshotBuilder:
             patrones.append("positive_recovery")
 
         # Analizamos velocidad de venta de productos para detectar patrones complementarios
-        top_items = self._productos_con_mayor_variacion(detalles)
-        if top_items and top_items[0][1] > 0:
+        if productos_vendidos is None:
+            top_items = self._productos_con_mayor_variacion(detalles)
+            productos_vendidos = bool(top_items) and top_items[0][1] > 0
+        if productos_vendidos:
             patrones.append("fast_moving_items")
 
         snapshot.pattern_flags = patrones
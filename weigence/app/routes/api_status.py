@@ -5,8 +5,11 @@ from pathlib import Path
 from flask import jsonify, request
 
 from api.conexion_supabase import supabase
+from api.query_profiler import recent_profiles, route_summary
+from app.utils.auditoria_sink import estado_auditoria, registrar_auditoria
 
 from . import bp
+from .decorators import requiere_rol
 from .utils import requiere_login
 
 last_manual_update = datetime.now()
@@ -48,14 +51,14 @@ def api_log_error():
         usuario = session.get('usuario', {}).get('email', 'Sistema')
         
         # Registrar en auditoría usando los campos correctos
-        supabase.table('auditoria_eventos').insert({
+        registrado = registrar_auditoria({
             'fecha': datetime.now().isoformat(),
             'usuario': usuario,
             'accion': f'error_sistema_{level}',
             'detalle': f"{message}. {detail}" if detail else message
-        }).execute()
+        })
         
-        return jsonify({'success': True})
+        return jsonify({'success': registrado})
     except Exception as e:
         print(f"Error registrando en auditoría: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -119,3 +122,22 @@ def api_refresh():
     global last_manual_update
     last_manual_update = datetime.now()
     return jsonify({'success': True, 'timestamp': last_manual_update.isoformat()})
+
+
+@bp.route('/api/debug/query-profile')
+@requiere_rol('administrador')
+def api_query_profile():
+    """Consultas Supabase por request: resumen por ruta y últimos perfiles"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'success': True,
+        'rutas': route_summary(),
+        'recientes': recent_profiles(limit=max(1, min(limit, 200))),
+    })
+
+
+@bp.route('/api/debug/auditoria')
+@requiere_rol('administrador')
+def api_estado_auditoria():
+    """Cola de escritura diferida de auditoría: en cola, insertados, pendientes en disco"""
+    return jsonify({'success': True, **estado_auditoria()})
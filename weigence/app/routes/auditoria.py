@@ -1,5 +1,6 @@
 ﻿from __future__ import annotations
 
+import contextvars
 import csv
 import io
 import json
@@ -830,14 +831,18 @@ def _gather_audit_events(desde: datetime, horas: int = DEFAULT_HOURS) -> tuple[L
                     break
 
     # Ejecutar consultas en paralelo para reducir latencia
+    # copy_context: las consultas de cada hilo cuentan en el perfil del request
     with ThreadPoolExecutor(max_workers=6) as executor:
         futures = [
-            executor.submit(collect_movimientos),
-            executor.submit(collect_ventas),
-            executor.submit(collect_detalle_ventas),
-            executor.submit(collect_pesajes),
-            executor.submit(collect_alertas),
-            executor.submit(collect_auditoria_eventos),
+            executor.submit(contextvars.copy_context().run, collector)
+            for collector in (
+                collect_movimientos,
+                collect_ventas,
+                collect_detalle_ventas,
+                collect_pesajes,
+                collect_alertas,
+                collect_auditoria_eventos,
+            )
         ]
         # Esperar a que todas terminen
         for future in as_completed(futures):
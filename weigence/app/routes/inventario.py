@@ -5,6 +5,9 @@ from datetime import datetime, timedelta
 from .utils import requiere_login, safe_int, safe_float, asignar_estante, formatear_estante_codigo
 from .decorators import requiere_rol, requiere_autenticacion
 from app.utils.vencimiento_helper import VencimientoHelper
+from app.utils.scheduler import scheduler
+from app.data.alert_store import alert_store
+from app.data.peso_index import peso_index
 
 
 def obtener_catalogo_estantes():
@@ -101,6 +104,7 @@ def inventario():
                         .update({"id_estante": prod_update["id_estante"]}) \
                         .eq("idproducto", prod_update["idproducto"]) \
                         .execute()
+                peso_index.invalidate()
             except Exception as err:
                 print(f"Advertencia al sincronizar id_estante de productos: {err}")
 
@@ -176,8 +180,7 @@ def inventario():
 
         # === 4. Crear alertas automáticas en BD (stock y vencimiento) ===
         alertas_nuevas = []
-        existentes = supabase.table("alertas").select("titulo").eq("estado", "pendiente").execute().data or []
-        titulos_existentes = {a["titulo"].lower() for a in existentes}
+        titulos_existentes = {a["titulo"].lower() for a in alert_store.abiertas(estado="pendiente")}
 
         for p in productos:
             nombre = p.get("nombre", "Producto sin nombre")
@@ -234,7 +237,7 @@ def inventario():
                     })
 
         if alertas_nuevas:
-            supabase.table("alertas").insert(alertas_nuevas).execute()
+            alert_store.upsert_many(alertas_nuevas)
 
         # === 5. Crear alertas personalizadas para el panel de Inventario ===
         alertas_sugeridas = []
@@ -402,6 +405,7 @@ def agregar_producto():
                 "cambio_de_peso": nuevo_producto.get("peso"),
                 "realizado_por": session.get("usuario_id")
             }).execute()
+            peso_index.actualizar_producto(producto_id)
 
         return jsonify({"success": True, "mensaje": "Producto agregado correctamente"})
     except Exception as e:
@@ -420,6 +424,7 @@ def eliminar_producto(id):
         # Si falla (columna no existe), intentar eliminación física
         try:
             result = supabase.table("productos").delete().eq("idproducto", id).execute()
+            peso_index.actualizar_producto(id)
             return jsonify({"success": True, "result": result.data})
         except Exception as e2:
             error_msg = str(e2)
@@ -470,6 +475,9 @@ def editar_producto(id):
         if not result.data:
             return jsonify({"success": False, "error": "Producto no encontrado"}), 404
         
+        if 'peso' in producto_actualizado:
+            peso_index.actualizar_producto(id)
+        
         return jsonify({"success": True, "mensaje": "Producto actualizado correctamente", "data": result.data[0]})
     
     except Exception as e:
@@ -568,12 +576,11 @@ def actualizar_stock(id):
             "id_estante": producto.get("id_estante")
         }).execute()
 
-        # --- Generar alertas automáticamente ---
+        # --- Adelantar la generación de alertas (corre en el scheduler) ---
         try:
-            from .inventario import generar_alertas_basicas
-            generar_alertas_basicas()
+            scheduler.trigger("alertas_productos")
         except Exception as e:
-            print(f"Error generando alertas tras actualizar stock: {e}")
+            print(f"Error programando alertas tras actualizar stock: {e}")
 
         return jsonify({
             "message": "Stock actualizado",
@@ -593,6 +600,20 @@ def estantes_estado():
     try:
         # Consultar directamente la tabla estantes (limitado a 10 estantes, ordenados)
         estantes = supabase.table("estantes").select("*").order("id_estante").limit(10).execute().data or []
+
+        # Estantes 1-5 calculan su peso con los productos: una sola consulta para todos
+        ids_demo = [e.get('id_estante') for e in estantes if e.get('id_estante') is not None and e.get('id_estante') <= 5]
+        peso_productos = {}
+        if ids_demo:
+            productos = supabase.table("productos").select("id_estante, peso, stock").in_("id_estante", ids_demo).execute().data or []
+            for p in productos:
+                peso_productos[p.get('id_estante')] = peso_productos.get(p.get('id_estante'), 0) + (p.get('peso', 0) or 0) * (p.get('stock', 0) or 0)
+
+        # Alertas abiertas desde el índice del AlertStore (sin SELECT por estante)
+        abiertas = alert_store.abiertas()
+        a_resolver = set()
+        a_resolver_pesa = set()
+        nuevas = []
         
         # Calcular el estado y ocupación para cada estante
         resultado = []
@@ -604,9 +625,7 @@ def estantes_estado():
             # Para estantes 1-5: calcular peso basado en productos (sistema anterior)
             # Para estante 6+: usar peso_actual de lecturas en tiempo real
             if id_estante <= 5:
-                # Calcular peso de productos para demostración
-                productos = supabase.table("productos").select("peso, stock").eq("id_estante", id_estante).execute().data or []
-                peso_actual = sum(p.get('peso', 0) * p.get('stock', 0) for p in productos)
+                peso_actual = peso_productos.get(id_estante, 0)
             
             # Calcular porcentaje de ocupación
             ocupacion_pct = (peso_actual / peso_maximo * 100) if peso_maximo > 0 else 0
@@ -636,100 +655,66 @@ def estantes_estado():
                 'estado_pesa': estado_pesa
             })
             
-            # Si el estante está estable, resolver alertas previas
+            # Si el estante está estable, resolver alertas previas del estante
             if estado_calculado == 'estable':
-                try:
-                    # Resolver alertas de este estante que estén pendientes
-                    supabase.table("alertas").update({
-                        "estado": "resuelto"
-                    }).eq("id_estante", id_estante).in_("estado", ["pendiente", "activo"]).execute()
-                except Exception as resolve_err:
-                    print(f"[ERROR] Error al resolver alertas del estante {id_estante}: {resolve_err}")
+                a_resolver.update(a["id"] for a in abiertas if a.get("id_estante") == id_estante)
             
-            # Generar alertas para estantes críticos (>=90% ocupación)
-            if estado_calculado == 'critico':
-                try:
-                    titulo_alerta = f"Estante {id_estante} lleno"
-                    existentes = supabase.table("alertas").select("id").eq("titulo", titulo_alerta).in_("estado", ["pendiente", "activo"]).execute().data or []
-                    
-                    if not existentes:
-                        print(f"[ALERTA] Creando alerta crítica para estante {id_estante} ({round(ocupacion_pct, 1)}%)")
-                        resultado_insert = supabase.table("alertas").insert({
-                            "titulo": titulo_alerta,
-                            "descripcion": f"El estante {id_estante} está al {round(ocupacion_pct, 1)}% de su capacidad. Se requiere reorganización urgente.",
-                            "icono": "warning",
-                            "tipo_color": "rojo",
-                            "estado": "activo",
-                            "fecha_creacion": datetime.now().isoformat(),
-                            "id_estante": id_estante,
-                            "idusuario": None,
-                            "idproducto": None
-                        }).execute()
-                        print(f"[ALERTA] Alerta crítica creada: {resultado_insert.data}")
-                    else:
-                        print(f"[ALERTA] Ya existe alerta crítica para estante {id_estante}")
-                except Exception as alert_err:
-                    print(f"[ERROR] Error al crear alerta de estante lleno: {alert_err}")
+            # Alertas para estantes críticos (>=90% ocupación)
+            elif estado_calculado == 'critico':
+                nuevas.append({
+                    "titulo": f"Estante {id_estante} lleno",
+                    "descripcion": f"El estante {id_estante} está al {round(ocupacion_pct, 1)}% de su capacidad. Se requiere reorganización urgente.",
+                    "icono": "warning",
+                    "tipo_color": "rojo",
+                    "estado": "activo",
+                    "id_estante": id_estante,
+                    "idusuario": None,
+                    "idproducto": None
+                })
             
-            # Generar alertas para estantes en advertencia (>=70% ocupación)
+            # Alertas para estantes en advertencia (>=70% ocupación)
             elif estado_calculado == 'advertencia':
-                try:
-                    titulo_alerta = f"Estante {id_estante} por llenarse"
-                    existentes = supabase.table("alertas").select("id").eq("titulo", titulo_alerta).in_("estado", ["pendiente", "activo"]).execute().data or []
-                    
-                    if not existentes:
-                        print(f"[ALERTA] Creando alerta de advertencia para estante {id_estante} ({round(ocupacion_pct, 1)}%)")
-                        resultado_insert = supabase.table("alertas").insert({
-                            "titulo": titulo_alerta,
-                            "descripcion": f"El estante {id_estante} está al {round(ocupacion_pct, 1)}% de su capacidad. Considere reorganizar productos.",
-                            "icono": "info",
-                            "tipo_color": "amarilla",
-                            "estado": "activo",
-                            "fecha_creacion": datetime.now().isoformat(),
-                            "id_estante": id_estante,
-                            "idusuario": None,
-                            "idproducto": None
-                        }).execute()
-                        print(f"[ALERTA] Alerta de advertencia creada: {resultado_insert.data}")
-                    else:
-                        print(f"[ALERTA] Ya existe alerta de advertencia para estante {id_estante}")
-                except Exception as alert_err:
-                    print(f"[ERROR] Error al crear alerta de advertencia: {alert_err}")
+                nuevas.append({
+                    "titulo": f"Estante {id_estante} por llenarse",
+                    "descripcion": f"El estante {id_estante} está al {round(ocupacion_pct, 1)}% de su capacidad. Considere reorganizar productos.",
+                    "icono": "info",
+                    "tipo_color": "amarilla",
+                    "estado": "activo",
+                    "id_estante": id_estante,
+                    "idusuario": None,
+                    "idproducto": None
+                })
             
-            # Generar alerta si la pesa está inactiva (solo para estante 6+)
+            # Alerta si la pesa está inactiva (solo para estante 6+)
+            titulo_pesa = f"Sistema de peso inactivo: Estante {id_estante}"
             if id_estante >= 6 and estado_pesa == False:
-                try:
-                    # Verificar si ya existe una alerta pendiente para esta pesa
-                    titulo_alerta = f"Sistema de peso inactivo: Estante {id_estante}"
-                    existentes = supabase.table("alertas").select("id").eq("titulo", titulo_alerta).eq("estado", "pendiente").execute().data or []
-                    
-                    if not existentes:
-                        # Crear nueva alerta con todos los campos correctos
-                        supabase.table("alertas").insert({
-                            "titulo": titulo_alerta,
-                            "descripcion": f"El sistema de medición de peso del estante {id_estante} está inactivo. Verifique la conexión del sensor.",
-                            "icono": "sensors_off",
-                            "tipo_color": "rojo",
-                            "estado": "pendiente",
-                            "fecha_creacion": datetime.now().isoformat(),
-                            "idusuario": None,
-                            "id_estante": id_estante,
-                            "idproducto": None
-                        }).execute()
-                except Exception as alert_err:
-                    print(f"Error al crear alerta de pesa inactiva: {alert_err}")
+                nuevas.append({
+                    "titulo": titulo_pesa,
+                    "descripcion": f"El sistema de medición de peso del estante {id_estante} está inactivo. Verifique la conexión del sensor.",
+                    "icono": "sensors_off",
+                    "tipo_color": "rojo",
+                    "estado": "pendiente",
+                    "idusuario": None,
+                    "id_estante": id_estante,
+                    "idproducto": None
+                })
             
             # Si la pesa está activa, resolver alertas previas de inactividad
             elif id_estante >= 6 and estado_pesa == True:
-                try:
-                    titulo_alerta = f"Sistema de peso inactivo: Estante {id_estante}"
-                    # Resolver alertas pendientes de este estante
-                    supabase.table("alertas").update({
-                        "estado": "resuelto",
-                        "fecha_modificacion": datetime.now().isoformat()
-                    }).eq("titulo", titulo_alerta).eq("estado", "pendiente").execute()
-                except Exception as resolve_err:
-                    print(f"Error al resolver alerta de pesa: {resolve_err}")
+                a_resolver_pesa.update(
+                    a["id"] for a in abiertas
+                    if a.get("estado") == "pendiente" and a.get("titulo") == titulo_pesa
+                )
+
+        # Un UPDATE y un INSERT como máximo por consulta de estado
+        try:
+            alert_store.resolve_many(a_resolver)
+            alert_store.resolve_many(a_resolver_pesa - a_resolver, fecha_modificacion=datetime.now().isoformat())
+            creadas = alert_store.upsert_many(nuevas)
+            if creadas:
+                print(f"[ALERTA] {len(creadas)} alertas de estantes creadas")
+        except Exception as alert_err:
+            print(f"[ERROR] Error al sincronizar alertas de estantes: {alert_err}")
         
         return jsonify(resultado)
     except Exception as e:
@@ -788,17 +773,9 @@ def limpiar_alertas_huerfanas():
         # Obtener alertas con idproducto
         alertas = supabase.table("alertas").select("*").not_.is_("idproducto", "null").in_("estado", ["pendiente", "activo"]).execute().data or []
         
-        resueltas = 0
-        for alerta in alertas:
-            id_prod = alerta.get("idproducto")
-            titulo = alerta.get("titulo", "").lower()
-            
-            # Verificar si el producto existe
-            if id_prod not in ids_activos:
-                # Resolver alerta
-                supabase.table("alertas").update({"estado": "resuelto"}).eq("id", alerta["id"]).execute()
-                resueltas += 1
-                print(f"[LIMPIEZA] Resuelta: {alerta.get('titulo')}")
+        # Resolver en un solo UPDATE las alertas de productos inexistentes
+        huerfanas = [a["id"] for a in alertas if a.get("idproducto") not in ids_activos]
+        resueltas = alert_store.resolve_many(huerfanas)
         
         return jsonify({
             "success": True,
@@ -820,11 +797,12 @@ def actualizar_estado_alerta(id):
         if nuevo_estado not in ["pendiente", "resuelto", "ignorada"]:
             return jsonify({"error": "Estado inválido"}), 400
 
-        supabase.table("alertas").update({
-            "estado": nuevo_estado,
-            "fecha_modificacion": datetime.now().isoformat(),
-            "idusuario": session.get("usuario_id")
-        }).eq("id", id).execute()
+        alert_store.actualizar_estado(
+            id,
+            nuevo_estado,
+            fecha_modificacion=datetime.now().isoformat(),
+            idusuario=session.get("usuario_id"),
+        )
 
         return jsonify({"success": True, "mensaje": f"Alerta marcada como {nuevo_estado}"})
     except Exception as e:
@@ -2,7 +2,11 @@ from flask import render_template, jsonify, request, session, redirect, url_for,
 from . import bp
 from api.conexion_supabase import supabase
 from app.utils.email_utils import enviar_correo_recuperacion, verificar_token_valido, marcar_token_usado
-from app.utils.security import verify_password
+from app.utils.security import (
+    VerificacionSaturada, en_segundo_plano, es_hash_bcrypt, hash_password,
+    necesita_rehash, verify_password_pool,
+)
+from app.utils.auth_lookup import buscar_usuario, intento_rechazado, registrar_rechazo
 from app.utils.error_logger import registrar_error_critico, registrar_error_warning
 import logging
 
@@ -43,14 +47,8 @@ def login():
             flash("Por favor completa todos los campos", "error")
             return render_template("login.html")
 
-        usuarios = supabase.table("usuarios").select("*").execute().data
-
-        usuario_encontrado = next(
-            (u for u in usuarios if u.get("nombre") == usuario_input 
-             or u.get("correo") == usuario_input 
-             or u.get("rut_usuario") == usuario_input),
-            None
-        )
+        # Una sola consulta por RUT/correo/nombre (con caché de inexistentes)
+        usuario_encontrado = buscar_usuario(usuario_input)
 
         if usuario_encontrado:
             logger.info(f"[LOGIN] Intento de login para usuario: {usuario_encontrado.get('nombre')}")
@@ -59,14 +57,26 @@ def login():
             password_hash = usuario_encontrado.get("password_hash") or usuario_encontrado.get("Contraseña")
             
             # Compatibilidad: verificar si es hash o texto plano (temporal)
-            if password_hash and (password_hash.startswith('$2b$') or password_hash.startswith('$2a$')):
-                # Es un hash bcrypt, verificar correctamente
-                password_valida = verify_password(password_input, password_hash)
+            if intento_rechazado(usuario_encontrado, password_input, password_hash):
+                # Misma contraseña rechazada hace poco: no gastar bcrypt otra vez
+                password_valida = False
+            elif es_hash_bcrypt(password_hash):
+                # Es un hash bcrypt, verificar en el pool acotado (no en el hilo del request)
+                try:
+                    password_valida = verify_password_pool(password_input, password_hash)
+                except VerificacionSaturada as e:
+                    logger.warning(f"[LOGIN] Verificación rechazada por carga: {e}")
+                    flash("El servidor está ocupado, intenta nuevamente en unos segundos", "error")
+                    return render_template("login.html"), 503
             else:
                 # Contraseña en texto plano (backward compatibility)
                 logger.warning(f"[LOGIN] Usuario {usuario_encontrado.get('rut_usuario')} tiene contraseña sin hash")
                 password_valida = (password_hash == password_input)
             
+            if password_valida and necesita_rehash(password_hash):
+                # Hash con otro costo (o texto plano): regenerarlo sin demorar la respuesta
+                en_segundo_plano(_rehacer_hash, usuario_encontrado, password_input)
+            
             if password_valida:
                 # Crear sesión
                 session["usuario_logueado"] = True
@@ -109,6 +119,7 @@ def login():
                 
                 return redirect(url_for("main.dashboard"))
             else:
+                registrar_rechazo(usuario_encontrado, password_input, password_hash)
                 logger.warning(f"[LOGIN] ✗ Contraseña incorrecta para: {usuario_input}")
                 flash("Contraseña incorrecta", "error")
         else:
@@ -117,6 +128,19 @@ def login():
 
     return render_template("login.html")
 
+
+def _rehacer_hash(usuario, password):
+    """Guarda un hash con el costo actual de BCRYPT_ROUNDS (corre en el pool de bcrypt)."""
+    try:
+        nuevo_hash = hash_password(password)
+        cambios = {"Contraseña": nuevo_hash}
+        if "password_hash" in usuario:
+            cambios["password_hash"] = nuevo_hash
+        supabase.table("usuarios").update(cambios).eq("rut_usuario", usuario.get("rut_usuario")).execute()
+        logger.info(f"[LOGIN] Hash de contraseña actualizado para: {usuario.get('rut_usuario')}")
+    except Exception as e:
+        logger.warning(f"[LOGIN] No se pudo actualizar el hash de {usuario.get('rut_usuario')}: {e}")
+
 @bp.route("/password-reset", methods=["POST"])
 def password_reset():
     """
@@ -142,13 +166,7 @@ def password_reset():
         
         # Buscar usuario en Supabase
         logger.info(f"[PASSWORD-RESET] 🔍 Buscando usuario en Supabase con email: {email}")
-        usuarios = supabase.table("usuarios").select("*").execute().data
-        logger.info(f"[PASSWORD-RESET] Total usuarios encontrados: {len(usuarios)}")
-        
-        usuario = next(
-            (u for u in usuarios if u.get("correo") == email),
-            None
-        )
+        usuario = buscar_usuario(email, columnas=("correo",))
         
         if usuario:
             # Usuario encontrado: enviar correo
@@ -303,7 +321,6 @@ def reset_password_submit():
             }), 400
         
         # Hash de la nueva contraseña
-        from app.utils.security import hash_password
         password_hash = hash_password(new_password)
         
         # Actualizar contraseña en Supabase (la columna se llama "Contraseña")
@@ -1,6 +1,6 @@
 from app.data.movimiento_service import procesar_movimiento
 from flask import render_template
-from .utils import requiere_login
+from .utils import invalidar_notificaciones, requiere_login
 from . import bp
 from api.conexion_supabase import supabase
 from flask import request, jsonify, session
@@ -230,15 +230,24 @@ def estadisticas_producto(idproducto):
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)}), 500
 
+def _fecha_lectura(lectura):
+    """``timestamp`` de una lectura como datetime local sin zona (``datetime.min`` si no se entiende)."""
+    try:
+        fecha = datetime.fromisoformat(str(lectura.get("timestamp")).replace("Z", "+00:00"))
+    except ValueError:
+        return datetime.min
+    # Mismo criterio que la consulta a la BD, que compara con datetime.now()
+    return fecha.astimezone().replace(tzinfo=None) if fecha.tzinfo else fecha
+
+
 @bp.route("/api/lecturas_peso_recientes", methods=["POST"])
 @requiere_login
 def lecturas_peso_recientes():
-    """Obtiene lecturas de peso recientes para un estante con retry automático"""
-    import time
-    from httpx import ReadError
-    from httpcore import ReadError as HttpcoreReadError
-    
-    datos = request.json
+    """Obtiene lecturas de peso recientes para un estante (últimos 30 segundos)"""
+    from datetime import datetime, timedelta
+    from app.sensores.lecturas_stream import lecturas_stream
+
+    datos = request.json or {}
     id_estante = datos.get('id_estante')
     
     if not id_estante:
@@ -246,64 +255,74 @@ def lecturas_peso_recientes():
             "success": False,
             "error": "id_estante requerido"
         }), 400
+    try:
+        id_estante = int(id_estante)
+    except (TypeError, ValueError):
+        return jsonify({
+            "success": False,
+            "error": "id_estante inválido"
+        }), 400
+
+    limite = datetime.now() - timedelta(seconds=30)
+
+    # Con el lector en marcha las lecturas ya están en memoria
+    if lecturas_stream.activo:
+        lecturas, _ = lecturas_stream.recientes([id_estante])
+        lecturas = [l for l in lecturas if _fecha_lectura(l) >= limite][-10:]
+        lecturas.reverse()
+        return jsonify({
+            "success": True,
+            "data": lecturas
+        })
     
-    # Configuración de reintentos
-    max_intentos = 3
-    retraso_base = 0.5  # segundos
-    
-    for intento in range(max_intentos):
-        try:
-            if intento > 0:
-                retraso = retraso_base * (2 ** intento)  # Exponential backoff
-                print(f"🔄 [RETRY] Intento {intento + 1}/{max_intentos} tras {retraso}s...")
-                time.sleep(retraso)
-            
-            # Obtener lecturas recientes del estante (últimos 30 segundos)
-            from datetime import datetime, timedelta
-            tiempo_limite = (datetime.now() - timedelta(seconds=30)).isoformat()
-            
-            response = supabase.table("lecturas_peso").select("*").eq(
-                "id_estante", id_estante
-            ).gte("timestamp", tiempo_limite).execute()
-            
-            # Ordenar por timestamp descendente en Python
-            if response.data:
-                response.data.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-                response.data = response.data[:10]  # Solo las últimas 10
-            
-            # Éxito - retornar inmediatamente
-            return jsonify({
-                "success": True,
-                "data": response.data
-            })
-        
-        except (ReadError, HttpcoreReadError) as e:
-            # Error de socket - reintentar
-            if intento < max_intentos - 1:
-                print(f"⚠️ [SOCKET] Error WinError 10035 en intento {intento + 1}, reintentando...")
-                continue
-            else:
-                # Último intento fallido - retornar lista vacía en lugar de error
-                print(f"❌ [SOCKET] Todos los intentos fallaron para estante {id_estante}")
-                return jsonify({
-                    "success": True,
-                    "data": [],
-                    "warning": "Timeout de conexión, reintentando en próxima consulta"
-                })
-        
-        except Exception as e:
-            print(f"❌ [LECTURAS] Error inesperado: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({
-                "success": False,
-                "error": str(e)
-            }), 500
-    
-    # Fallback (no debería llegar aquí)
+    try:
+        tiempo_limite = limite.isoformat()
+        response = supabase.table("lecturas_peso").select("*").eq(
+            "id_estante", id_estante
+        ).gte("timestamp", tiempo_limite).order("timestamp", desc=True).limit(10).execute()
+        return jsonify({
+            "success": True,
+            "data": response.data or []
+        })
+    except Exception as e:
+        # Sin reintentos bloqueantes: el cliente vuelve a consultar en el próximo ciclo
+        print(f"❌ [LECTURAS] Error consultando lecturas del estante {id_estante}: {type(e).__name__}: {e}")
+        return jsonify({
+            "success": True,
+            "data": [],
+            "warning": "Error de conexión, reintentando en próxima consulta"
+        })
+
+
+@bp.route("/api/lecturas_peso/stream", methods=["GET"])
+@requiere_login
+def lecturas_peso_stream():
+    """
+    Catch-up para clientes del namespace /pesos que se reconectan.
+    Parámetros: estantes=1,2,3 y desde_id=<último id_lectura visto>.
+    """
+    from app.sensores.lecturas_stream import lecturas_stream
+
+    try:
+        estantes = [int(e) for e in request.args.get("estantes", "").split(",") if e.strip()]
+        desde_id = request.args.get("desde_id", type=int)
+    except ValueError:
+        return jsonify({"success": False, "error": "Parámetros inválidos"}), 400
+
+    if not estantes:
+        return jsonify({"success": False, "error": "estantes requerido"}), 400
+
+    lecturas, completo = lecturas_stream.recientes(estantes, desde_id=desde_id)
+    if not completo and desde_id is not None:
+        # El buffer no alcanza: traer el tramo completo desde la BD (una consulta)
+        lecturas = supabase.table("lecturas_peso").select("*").in_(
+            "id_estante", estantes
+        ).gt("id_lectura", desde_id).order("id_lectura").limit(1000).execute().data or []
+
     return jsonify({
         "success": True,
-        "data": []
+        "lecturas": lecturas,
+        "ultimo_id": lecturas[-1]["id_lectura"] if lecturas else desde_id,
     })
 
 @bp.route("/api/lecturas_peso_pendientes", methods=["POST"])
@@ -321,6 +340,16 @@ def lecturas_peso_pendientes():
                 "error": "estantes requerido"
             }), 400
         
+        from app.sensores.detector_peso import DETECTOR_ENABLED
+        from app.sensores.lecturas_stream import lecturas_stream
+        if DETECTOR_ENABLED and lecturas_stream.activo:
+            # El detector del servidor ya procesa todas las lecturas
+            return jsonify({
+                "success": True,
+                "lecturas": [],
+                "detector_servidor": True
+            })
+        
         from datetime import datetime, timedelta
         tiempo_limite = (datetime.now() - timedelta(minutes=minutos)).isoformat()
         
@@ -337,8 +366,9 @@ def lecturas_peso_pendientes():
                 "lecturas": []
             })
         
-        # Obtener IDs de movimientos grises ya registrados (buscar en últimos 30 días, no solo período actual)
-        tiempo_busqueda = (datetime.now() - timedelta(days=30)).isoformat()
+        # Obtener IDs de movimientos grises ya registrados; un movimiento nunca es
+        # anterior a su lectura, así que basta la misma ventana de tiempo
+        tiempo_busqueda = tiempo_limite
         movimientos_existentes = supabase.table("movimientos_inventario").select(
             "observacion"
         ).in_(
@@ -422,152 +452,15 @@ def ultimo_movimiento_estante(id_estante):
 def crear_movimiento_gris():
     """Crea un movimiento 'gris' automático del sistema"""
     try:
-        from datetime import datetime, timedelta
-        
         datos = request.json
         print("📝 [Movimiento Gris] Datos recibidos:", datos)
         
         # Validar campos requeridos
         if not datos.get('id_estante'):
             return jsonify({"success": False, "error": "id_estante requerido"}), 400
-        
-        id_estante = datos['id_estante']
-        peso_nuevo = datos.get('peso_total', 0)
-        timestamp_actual = datetime.now()
-        
-        # Intentar identificar producto por peso PRIMERO (necesario para buscar VentaPendiente)
-        from app.data.movimiento_service import procesar_movimiento
-        resultado_deteccion = procesar_movimiento(
-            id_estante,
-            peso_nuevo,
-            'gris',
-            timestamp_actual,
-            None
-        )
-        
-        # Enriquecer datos con detección de producto
-        datos_enriquecidos = datos.copy()
-        if resultado_deteccion.get('idproducto'):
-            datos_enriquecidos['idproducto'] = resultado_deteccion.get('idproducto')
-            datos_enriquecidos['idproducto_detectado'] = resultado_deteccion.get('idproducto_detectado')
-            print(f"🔍 [Movimiento Gris] Producto detectado: {resultado_deteccion.get('idproducto')}")
-        
-        # PRIMERO: Intentar actualizar un movimiento VentaPendiente existente
-        # Si se detecta un retiro de peso, puede corresponder a una venta pendiente
-        print(f"🔍 [Movimiento Gris] Buscando VentaPendiente antes de crear gris...")
-        movimiento_actualizado = actualizar_movimiento_pendiente_o_gris(
-            id_estante,
-            peso_nuevo,
-            timestamp_actual,
-            datos_enriquecidos,  # Usar datos enriquecidos con detección
-            es_desde_sensor=True  # Indica que viene del sensor
-        )
-        
-        if movimiento_actualizado:
-            print(f"✅ [Movimiento Gris] VentaPendiente encontrado y actualizado: {movimiento_actualizado.get('id_movimiento')}")
-            return jsonify({
-                "success": True,
-                "data": movimiento_actualizado,
-                "mensaje": "Venta pendiente confirmada con sensor"
-            })
-        
-        print(f"ℹ️ [Movimiento Gris] No hay VentaPendiente, creando movimiento gris...")
-        
-        # Extraer ID de lectura de la observación (si existe)
-        observacion = datos.get('observacion', '')
-        id_lectura_actual = None
-        if '[Lectura:' in observacion:
-            try:
-                id_lectura_actual = int(observacion.split('[Lectura:')[1].split(']')[0].strip())
-                print(f"🔍 [Movimiento Gris] ID Lectura extraído: {id_lectura_actual}")
-            except Exception as e:
-                print(f"⚠️ [Movimiento Gris] Error extrayendo ID lectura: {e}")
-                pass
-        else:
-            print(f"⚠️ [Movimiento Gris] Observación sin ID lectura: '{observacion}'")
-        
-        # Verificar si ya existe un movimiento con esta lectura
-        if id_lectura_actual:
-            # Buscar en los últimos 5 minutos de movimientos grises
-            tiempo_limite = (datetime.now() - timedelta(minutes=5)).isoformat()
-            
-            movimientos_existentes = supabase.table("movimientos_inventario").select(
-                "id_movimiento, observacion, timestamp"
-            ).eq("id_estante", id_estante).eq("tipo_evento", "gris").gte(
-                "timestamp", tiempo_limite
-            ).execute()
-            
-            print(f"🔍 [Movimiento Gris] Verificando {len(movimientos_existentes.data)} movimientos recientes")
-            
-            for mov in movimientos_existentes.data:
-                obs = mov.get('observacion', '')
-                if f'[Lectura: {id_lectura_actual}]' in obs:
-                    print(f"❌ [Movimiento Gris] DUPLICADO detectado - Lectura {id_lectura_actual} ya en movimiento {mov.get('id_movimiento')}")
-                    return jsonify({
-                        "success": True,
-                        "data": None,
-                        "mensaje": f"Movimiento ya registrado (lectura {id_lectura_actual} duplicada)"
-                    })
-            
-            print(f"✅ [Movimiento Gris] Lectura {id_lectura_actual} no encontrada en duplicados, procediendo...")
-        
-        # PRIORIZAR datos del frontend sobre detección automática
-        # La cantidad del frontend indica correctamente si es adición (+1) o retiro (-1)
-        cantidad = datos.get('cantidad', 1)
-        if cantidad is None:
-            cantidad = resultado_deteccion.get('cantidad', 1)
-            print(f"⚠️ [Movimiento Gris] Usando cantidad de detección: {cantidad}")
-        
-        # La observación del frontend incluye [Lectura: ID] para evitar duplicados
-        observacion_final = datos.get('observacion', '')
-        if not observacion_final or observacion_final == '':
-            observacion_final = resultado_deteccion.get('observacion', 'Detección automática: Peso estable sin identificación')
-        
-        movimiento_gris = {
-            "id_estante": id_estante,
-            "idproducto": resultado_deteccion.get("idproducto"),
-            "idproducto_detectado": resultado_deteccion.get("idproducto_detectado"),
-            "rut_usuario": None,  # NULL = Sistema automático
-            "cantidad": cantidad,  # Del frontend: +1 (adición) o -1 (retiro)
-            "tipo_evento": 'gris',
-            "peso_total": peso_nuevo,
-            "peso_por_unidad": datos.get('peso_por_unidad') or resultado_deteccion.get('peso_por_unidad') or peso_nuevo,
-            "timestamp": timestamp_actual.isoformat(),
-            "match_por_peso": resultado_deteccion.get("match_por_peso"),
-            "es_venta_validada": resultado_deteccion.get("es_venta_validada"),
-            "es_retiro_sospechoso": resultado_deteccion.get("es_retiro_sospechoso"),
-            "motivo_sospecha": resultado_deteccion.get("motivo_sospecha"),
-            "observacion": observacion_final  # Del frontend con [Lectura: ID]
-        }
-
-        print(f"💾 [Movimiento Gris] Valores finales:")
-        print(f"   - cantidad: {cantidad} (frontend: {datos.get('cantidad')}, detección: {resultado_deteccion.get('cantidad')})")
-        print(f"   - observacion: '{observacion_final}'")
-        print(f"   - peso_total: {peso_nuevo} kg")
 
-        # Insertar en la base de datos
-        response = supabase.table("movimientos_inventario").insert(movimiento_gris).execute()
-        
-        if response.data:
-            print(f"✅ [Movimiento Gris] Registrado: {response.data[0].get('id_movimiento')}")
-            
-            # Registrar evento en auditoría
-            from app.utils.eventohumano import registrar_evento_humano
-            registrar_evento_humano(
-                "movimiento_gris",
-                f"Sistema detectó peso estable no identificado en estante {datos['id_estante']}: {datos.get('peso_total', 0):.2f}kg"
-            )
-            
-            return jsonify({
-                "success": True,
-                "data": response.data[0],
-                "mensaje": "Movimiento gris registrado correctamente"
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "error": "No se pudo registrar el movimiento"
-            }), 500
+        resultado, status = registrar_movimiento_gris(datos)
+        return jsonify(resultado), status
         
     except Exception as e:
         print(f"❌ [Movimiento Gris] Error: {e}")
@@ -578,6 +471,163 @@ def crear_movimiento_gris():
             "error": str(e)
         }), 500
 
+
+def registrar_movimiento_gris(datos):
+    """
+    Registra un movimiento 'gris' (peso estable detectado por el sensor).
+    Lo usan el endpoint /api/movimientos/gris y el detector de peso del servidor.
+    Devuelve ``(respuesta, status_http)``.
+    """
+    from datetime import datetime, timedelta
+
+    id_estante = datos['id_estante']
+    peso_nuevo = datos.get('peso_total', 0)
+    timestamp_actual = datetime.now()
+    
+    # peso_total llega siempre positivo: la dirección la da la cantidad (+1 adición, -1 retiro)
+    try:
+        direccion = -1 if float(datos.get('cantidad') or 1) < 0 else 1
+    except (TypeError, ValueError):
+        direccion = 1
+
+    # Intentar identificar producto por peso PRIMERO (necesario para buscar VentaPendiente)
+    from app.data.movimiento_service import procesar_movimiento
+    resultado_deteccion = procesar_movimiento(
+        id_estante,
+        peso_nuevo,
+        'gris',
+        timestamp_actual,
+        None,
+        direccion=direccion
+    )
+    
+    # Enriquecer datos con detección de producto
+    datos_enriquecidos = datos.copy()
+    if resultado_deteccion.get('idproducto'):
+        datos_enriquecidos['idproducto'] = resultado_deteccion.get('idproducto')
+        datos_enriquecidos['idproducto_detectado'] = resultado_deteccion.get('idproducto_detectado')
+        print(f"🔍 [Movimiento Gris] Producto detectado: {resultado_deteccion.get('idproducto')}")
+    
+    # PRIMERO: Intentar actualizar un movimiento VentaPendiente existente
+    # Si se detecta un retiro de peso, puede corresponder a una venta pendiente
+    print(f"🔍 [Movimiento Gris] Buscando VentaPendiente antes de crear gris...")
+    movimiento_actualizado = actualizar_movimiento_pendiente_o_gris(
+        id_estante,
+        peso_nuevo,
+        timestamp_actual,
+        datos_enriquecidos,  # Usar datos enriquecidos con detección
+        es_desde_sensor=True  # Indica que viene del sensor
+    )
+    
+    if movimiento_actualizado:
+        print(f"✅ [Movimiento Gris] VentaPendiente encontrado y actualizado: {movimiento_actualizado.get('id_movimiento')}")
+        return {
+            "success": True,
+            "data": movimiento_actualizado,
+            "mensaje": "Venta pendiente confirmada con sensor"
+        }, 200
+    
+    print(f"ℹ️ [Movimiento Gris] No hay VentaPendiente, creando movimiento gris...")
+    
+    # Extraer ID de lectura de la observación (si existe)
+    observacion = datos.get('observacion', '')
+    id_lectura_actual = None
+    if '[Lectura:' in observacion:
+        try:
+            id_lectura_actual = int(observacion.split('[Lectura:')[1].split(']')[0].strip())
+            print(f"🔍 [Movimiento Gris] ID Lectura extraído: {id_lectura_actual}")
+        except Exception as e:
+            print(f"⚠️ [Movimiento Gris] Error extrayendo ID lectura: {e}")
+            pass
+    else:
+        print(f"⚠️ [Movimiento Gris] Observación sin ID lectura: '{observacion}'")
+    
+    # Verificar si ya existe un movimiento con esta lectura
+    if id_lectura_actual:
+        # Buscar en los últimos 5 minutos de movimientos grises
+        tiempo_limite = (datetime.now() - timedelta(minutes=5)).isoformat()
+        
+        movimientos_existentes = supabase.table("movimientos_inventario").select(
+            "id_movimiento, observacion, timestamp"
+        ).eq("id_estante", id_estante).eq("tipo_evento", "gris").gte(
+            "timestamp", tiempo_limite
+        ).execute()
+        
+        print(f"🔍 [Movimiento Gris] Verificando {len(movimientos_existentes.data)} movimientos recientes")
+        
+        for mov in movimientos_existentes.data:
+            obs = mov.get('observacion', '')
+            if f'[Lectura: {id_lectura_actual}]' in obs:
+                print(f"❌ [Movimiento Gris] DUPLICADO detectado - Lectura {id_lectura_actual} ya en movimiento {mov.get('id_movimiento')}")
+                return {
+                    "success": True,
+                    "data": None,
+                    "mensaje": f"Movimiento ya registrado (lectura {id_lectura_actual} duplicada)"
+                }, 200
+        
+        print(f"✅ [Movimiento Gris] Lectura {id_lectura_actual} no encontrada en duplicados, procediendo...")
+    
+    # PRIORIZAR datos del frontend sobre detección automática
+    # La cantidad del frontend indica correctamente si es adición (+1) o retiro (-1)
+    cantidad = datos.get('cantidad', 1)
+    if cantidad is None:
+        cantidad = resultado_deteccion.get('cantidad', 1)
+        print(f"⚠️ [Movimiento Gris] Usando cantidad de detección: {cantidad}")
+    
+    # La observación del frontend incluye [Lectura: ID] para evitar duplicados
+    observacion_final = datos.get('observacion', '')
+    if not observacion_final or observacion_final == '':
+        observacion_final = resultado_deteccion.get('observacion', 'Detección automática: Peso estable sin identificación')
+    elif resultado_deteccion.get('cesta'):
+        # Varios productos distintos: dejar la cesta detectada junto al [Lectura: ID]
+        observacion_final = f"{observacion_final} | {resultado_deteccion['observacion']}"
+    
+    movimiento_gris = {
+        "id_estante": id_estante,
+        "idproducto": resultado_deteccion.get("idproducto"),
+        "idproducto_detectado": resultado_deteccion.get("idproducto_detectado"),
+        "rut_usuario": None,  # NULL = Sistema automático
+        "cantidad": cantidad,  # Del frontend: +1 (adición) o -1 (retiro)
+        "tipo_evento": 'gris',
+        "peso_total": peso_nuevo,
+        "peso_por_unidad": datos.get('peso_por_unidad') or resultado_deteccion.get('peso_por_unidad') or peso_nuevo,
+        "timestamp": timestamp_actual.isoformat(),
+        "match_por_peso": resultado_deteccion.get("match_por_peso"),
+        "es_venta_validada": resultado_deteccion.get("es_venta_validada"),
+        "es_retiro_sospechoso": resultado_deteccion.get("es_retiro_sospechoso"),
+        "motivo_sospecha": resultado_deteccion.get("motivo_sospecha"),
+        "observacion": observacion_final  # Del frontend con [Lectura: ID]
+    }
+
+    print(f"💾 [Movimiento Gris] Valores finales:")
+    print(f"   - cantidad: {cantidad} (frontend: {datos.get('cantidad')}, detección: {resultado_deteccion.get('cantidad')})")
+    print(f"   - observacion: '{observacion_final}'")
+    print(f"   - peso_total: {peso_nuevo} kg")
+
+    # Insertar en la base de datos
+    response = supabase.table("movimientos_inventario").insert(movimiento_gris).execute()
+    
+    if response.data:
+        print(f"✅ [Movimiento Gris] Registrado: {response.data[0].get('id_movimiento')}")
+        
+        # Registrar evento en auditoría
+        from app.utils.eventohumano import registrar_evento_humano
+        registrar_evento_humano(
+            "movimiento_gris",
+            f"Sistema detectó peso estable no identificado en estante {datos['id_estante']}: {datos.get('peso_total', 0):.2f}kg"
+        )
+        
+        return {
+            "success": True,
+            "data": response.data[0],
+            "mensaje": "Movimiento gris registrado correctamente"
+        }, 200
+    else:
+        return {
+            "success": False,
+            "error": "No se pudo registrar el movimiento"
+        }, 500
+
 def actualizar_movimiento_pendiente_o_gris(id_estante, peso_total, timestamp_retiro, datos_retiro, es_desde_sensor=False):
     """
     Busca movimientos pendientes o grises que coincidan con un retiro y los actualiza.
@@ -852,6 +902,7 @@ def nuevo_movimiento():
                 "idproducto": datos.get("idproducto"),
                 "idusuario": rut_usuario
             }).execute()
+            invalidar_notificaciones()
 
         # Mantener respuesta compatible
         return jsonify({
@@ -6,7 +6,11 @@ from . import bp
 from .utils import obtener_notificaciones
 from .decorators import requiere_rol
 
+from app.ia.ia_engine import ConfigInvalida, engine as default_engine
+from app.ia.ia_ml_retrain import JOB_NAME as TAREA_REENTRENAMIENTO, model_retrainer
 from app.ia.ia_service import generar_recomendacion
+from app.ia.ia_snapshot_cache import snapshot_cache
+from app.utils.scheduler import scheduler
 
 
 
@@ -149,6 +153,103 @@ def api_recomendacion_header():
 
 
 
+# ============================================================
+# === ESTADO DEL CACHÉ DE SNAPSHOTS IA ===
+# ============================================================
+
+@bp.route('/api/ia/snapshot-cache', methods=['GET'])
+@requiere_rol('administrador')
+def api_ia_snapshot_cache():
+    """Expone hits/misses y edad de los snapshots IA cacheados."""
+    return jsonify({"ok": True, "data": snapshot_cache.stats()})
+
+
+@bp.route('/api/ia/estadisticas', methods=['GET'])
+@requiere_rol('administrador')
+def api_ia_estadisticas():
+    """Filas por serie, high-water marks y edad de las estadísticas incrementales del snapshot."""
+    from app.ia.ia_online_stats import online_stats
+
+    return jsonify({"ok": True, "data": online_stats.stats()})
+
+
+@bp.route('/api/ia/analizadores', methods=['GET'])
+@requiere_rol('administrador')
+def api_ia_analizadores():
+    """Edad, TTL, timeouts y duración de cada analizador de hallazgos ML."""
+    from app.ia.ia_analyzer_runner import get_analyzer_runner
+
+    return jsonify({"ok": True, "data": get_analyzer_runner().stats()})
+
+
+# ============================================================
+# === CONFIGURACIÓN DEL MOTOR IA (RECARGA Y MODO SOMBRA) ===
+# ============================================================
+
+@bp.route('/api/ia/engine', methods=['GET'])
+@requiere_rol('administrador')
+def api_ia_engine():
+    """Configuración activa, avisos de validación y deltas de la configuración en sombra."""
+    return jsonify({"ok": True, "data": default_engine.status()})
+
+
+@bp.route('/api/ia/engine/reload', methods=['POST'])
+@requiere_rol('administrador')
+def api_ia_engine_reload():
+    """Recarga ia_engine.json en este worker (los demás la detectan al revisar el archivo)."""
+    try:
+        return jsonify({"ok": True, "data": default_engine.reload()})
+    except ConfigInvalida as exc:
+        return _error_response("Configuración IA inválida; se mantiene la vigente", status=400, detail=str(exc))
+
+
+@bp.route('/api/ia/engine/shadow', methods=['PUT', 'DELETE'])
+@requiere_rol('administrador')
+def api_ia_engine_shadow():
+    """PUT: evalúa el JSON recibido en sombra junto a la config vigente. DELETE: apaga la sombra."""
+    if request.method == 'DELETE':
+        default_engine.clear_shadow()
+        return jsonify({"ok": True, "data": default_engine.status()})
+    try:
+        return jsonify({"ok": True, "data": default_engine.set_shadow(request.get_json(silent=True))})
+    except ConfigInvalida as exc:
+        return _error_response("Configuración IA inválida", status=400, detail=str(exc))
+
+
+@bp.route('/api/ia/engine/shadow/promote', methods=['POST'])
+@requiere_rol('administrador')
+def api_ia_engine_shadow_promote():
+    """Publica la configuración en sombra como ia_engine.json."""
+    try:
+        return jsonify({"ok": True, "data": default_engine.promote_shadow()})
+    except ConfigInvalida as exc:
+        return _error_response("No se pudo publicar la configuración en sombra", status=400, detail=str(exc))
+
+
+# ============================================================
+# === REENTRENAMIENTO DEL MODELO ML ===
+# ============================================================
+
+@bp.route('/api/ia/modelo', methods=['GET'])
+@requiere_rol('administrador')
+def api_ia_modelo():
+    """Versión vigente, última vuelta de reentrenamiento y métricas del holdout."""
+    tarea = next((t for t in scheduler.status()["tareas"] if t["nombre"] == TAREA_REENTRENAMIENTO), None)
+    return jsonify({"ok": True, "data": {**model_retrainer.status(), "tarea": tarea}})
+
+
+@bp.route('/api/ia/modelo/reentrenar', methods=['POST'])
+@requiere_rol('administrador')
+def api_ia_modelo_reentrenar():
+    """Adelanta el reentrenamiento; corre en el scheduler y no espera a que termine."""
+    try:
+        iniciado = scheduler.trigger(TAREA_REENTRENAMIENTO)
+    except KeyError:
+        return _error_response("El reentrenamiento automático está desactivado (IA_RETRAIN_ENABLED=0)", status=409)
+    mensaje = "Reentrenamiento en curso" if iniciado else "Ya hay un reentrenamiento en curso; se repetirá al terminar"
+    return jsonify({"ok": True, "mensaje": mensaje, "data": model_retrainer.status()})
+
+
 # ============================================================
 # === ENDPOINT NOTIFICACIONES ===
 # ============================================================
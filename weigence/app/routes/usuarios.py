@@ -7,6 +7,7 @@ from . import bp
 from .decorators import requiere_rol
 from api.conexion_supabase import supabase
 from app.utils.security import hash_password, validar_fortaleza_password, validar_email, validar_rut_chileno, sanitizar_input
+from app.utils.auth_lookup import olvidar_usuario
 import re
 import uuid
 from datetime import datetime
@@ -264,6 +265,7 @@ def api_crear_usuario():
         
         if hasattr(response, 'data') and response.data:
             logger.info(f"[API-CREAR-USUARIO] ✅ Usuario creado: {rut}")
+            olvidar_usuario(rut, correo, nombre)
             
             # Registrar evento de auditoría
             from app.utils.eventohumano import registrar_evento_humano
@@ -352,6 +354,7 @@ def api_editar_usuario(rut):
         
         if hasattr(response, 'data') and response.data:
             print(f"[API-EDITAR-USUARIO] ✅ Usuario actualizado: {rut}")
+            olvidar_usuario(update_data.get('nombre'), update_data.get('correo'))
             
             # Registrar evento de auditoría
             from app.utils.eventohumano import registrar_evento_humano
@@ -6,6 +6,9 @@ from functools import wraps
 from collections import defaultdict
 import requests
 
+from app.data.alert_store import alert_store
+from app.utils.notificaciones_cache import NotificacionesCache
+
 
 def requiere_login(f):
     """
@@ -76,176 +79,136 @@ def agrupar_notificaciones_por_fecha(notificaciones):
     return grupos
 
 
-def obtener_notificaciones(usuario_id=None):
+def _construir_notificaciones():
+    """
+    Lee alertas abiertas y arma la lista del panel de notificaciones.
+    La ejecuta el refresco en segundo plano de ``notificaciones_cache``; la
+    generación de alertas corre aparte, en el scheduler (ver ``alertas.py``).
+    """
+    # === 1) Obtener productos activos (una sola lectura) ===
     try:
-        # === 1) Generar alertas nuevas antes de leer (sin llamada HTTP) ===
-        try:
-            from .alertas import generar_alertas_basicas
-            generar_alertas_basicas()
-        except Exception as err:
-            print(f"Advertencia: no se pudieron regenerar alertas automáticamente ({err})")
+        productos_activos = supabase.table("productos").select("idproducto, nombre").eq("activo", True).execute().data or []
+    except:
+        productos_activos = supabase.table("productos").select("idproducto, nombre").execute().data or []
 
-        # === 2) Obtener productos activos primero ===
-        try:
-            productos_activos = supabase.table("productos").select("idproducto, nombre").eq("activo", True).execute().data or []
-        except:
-            productos_activos = supabase.table("productos").select("idproducto, nombre").execute().data or []
-        
-        ids_activos = {p["idproducto"] for p in productos_activos}
-        nombres_activos = {p["nombre"].lower() for p in productos_activos}
-        
-        print(f"[DEBUG] Productos activos: {len(ids_activos)}")
-        
-        # === 3) Leer alertas desde Supabase ===
-        query = (
-            supabase.table("alertas")
-            .select("*")
-            .in_("estado", ["pendiente", "activo"])
-            .order("fecha_creacion", desc=True)
-        )
-        data = query.limit(50).execute()
-        alertas_raw = data.data or []
-        
-        print(f"[DEBUG] Alertas obtenidas: {len(alertas_raw)}")
-        
-        # === 4) Filtrar y resolver alertas de productos inexistentes ===
-        alertas = []
-        alertas_a_resolver = []
-        
-        for a in alertas_raw:
-            id_prod = a.get("idproducto")
-            id_estante = a.get("id_estante")
-            titulo = a.get("titulo", "")
-            
-            # Alertas de estantes (sin idproducto) siempre pasan
-            if id_estante and not id_prod:
-                alertas.append(a)
+    ids_activos = {p["idproducto"] for p in productos_activos}
+    nombres_activos = {(p.get("nombre") or "").lower() for p in productos_activos}
+
+    # === 2) Leer alertas abiertas (recarga el índice del store) ===
+    alert_store.refresh()
+    alertas_raw = sorted(
+        alert_store.abiertas(),
+        key=lambda a: str(a.get("fecha_creacion") or ""),
+        reverse=True,
+    )[:50]
+    # Copias: el formateo de abajo no debe tocar las filas del índice
+    alertas_raw = [dict(a) for a in alertas_raw]
+
+    # === 3) Filtrar y resolver alertas de productos inexistentes ===
+    alertas = []
+    alertas_a_resolver = []
+
+    for a in alertas_raw:
+        id_prod = a.get("idproducto")
+        id_estante = a.get("id_estante")
+        titulo = a.get("titulo", "")
+
+        # Alertas de estantes (sin idproducto) siempre pasan
+        if id_estante and not id_prod:
+            alertas.append(a)
+            continue
+
+        if id_prod:
+            if id_prod not in ids_activos:
+                alertas_a_resolver.append(a["id"])
                 continue
-            
-            # Si la alerta tiene idproducto, verificar que el producto existe
-            if id_prod:
-                if id_prod not in ids_activos:
-                    # Marcar para resolver
-                    alertas_a_resolver.append(a["id"])
-                    print(f"[FILTRO] Alerta descartada (producto inexistente): {titulo}")
-                    continue
-            
-            # Si el título menciona un producto específico, verificar que existe
+
+            # Si el título menciona un producto, verificar que ese nombre existe
             titulo_lower = titulo.lower()
             if any(palabra in titulo_lower for palabra in ["vencer", "vencido", "stock", "agotado"]):
-                # Solo filtrar si tiene idproducto
-                if id_prod:
-                    # Extraer nombre del producto del título
-                    encontrado = False
-                    for nombre in nombres_activos:
-                        if nombre in titulo_lower:
-                            encontrado = True
-                            break
-                    
-                    if not encontrado:
-                        # El producto mencionado no existe
-                        alertas_a_resolver.append(a["id"])
-                        print(f"[FILTRO] Alerta descartada (nombre no encontrado): {titulo}")
-                        continue
-            
-            # Alerta válida
-            alertas.append(a)
-        
-        # Resolver alertas inválidas en batch
-        if alertas_a_resolver:
-            try:
-                for alert_id in alertas_a_resolver:
-                    supabase.table("alertas").update({"estado": "resuelto"}).eq("id", alert_id).execute()
-                print(f"[LIMPIEZA] {len(alertas_a_resolver)} alertas resueltas automáticamente")
-            except Exception as resolve_err:
-                print(f"[ERROR] Error al resolver alertas: {resolve_err}")
-        
-        print(f"[DEBUG] Alertas válidas: {len(alertas)}")
-
-        # === 5) Alerta dinámica: productos sin pesaje en 7 días ===
-        hoy = datetime.now()
-        hace_7d = (hoy - timedelta(days=7)).isoformat()
-
-        pesajes_7d = (
-            supabase.table("pesajes")
-            .select("idproducto,fecha_pesaje")
-            .gte("fecha_pesaje", hace_7d)
-            .execute()
-            .data or []
-        )
-        ids_con_pesaje = {p["idproducto"] for p in pesajes_7d if p.get("idproducto")}
-
-        prods = supabase.table("productos").select("idproducto,nombre").execute().data or []
-        sin_pesaje = [p for p in prods if p["idproducto"] not in ids_con_pesaje]
-
-        if sin_pesaje:
-            # Fecha antigua para que aparezca al final (hace 30 días)
-            fecha_antigua = (hoy - timedelta(days=30)).isoformat()
-            alerta_sint = {
-                "id": "__no_pesaje_7d__",
-                "tipo_color": "amarillo",
-                "icono": "warning",
-                "titulo": "Productos sin pesaje reciente",
-                "descripcion": f"No se han pesado {len(sin_pesaje)} producto(s) en los últimos 7 días.",
-                "detalle": "Sugerencia: planificar control de estantes y calibración si aplica.",
-                "enlace": "/movimientos",
-                "fecha_creacion": fecha_antigua,  # Fecha antigua para que aparezca al final
-            }
-            if not any(a.get("id") == alerta_sint["id"] for a in alertas):
-                # Agregar al final - el ordenamiento por fecha la colocará al final automáticamente
-                alertas.append(alerta_sint)
-
-        # === 6) Ordenar alertas por fecha (más recientes primero) ===
-        def obtener_timestamp(alerta):
-            try:
-                # Obtener fecha_creacion o timestamp
-                fecha = alerta.get("fecha_creacion") or alerta.get("timestamp") or hoy.isoformat()
-                # Limpiar microsegundos y zona horaria si existen
-                fecha_str = str(fecha).split(".")[0].replace("Z", "").replace("+00:00", "")
-                # Convertir a timestamp
-                dt = datetime.fromisoformat(fecha_str)
-                return dt.timestamp()
-            except Exception as e:
-                print(f"[WARN] Error parseando fecha {alerta.get('titulo')}: {e}")
-                return 0
-        
-        # Ordenar por fecha descendente (más recientes primero)
-        alertas = sorted(alertas, key=lambda a: obtener_timestamp(a), reverse=True)
+                if not any(nombre in titulo_lower for nombre in nombres_activos):
+                    alertas_a_resolver.append(a["id"])
+                    continue
 
-        # === 7) Agrupar por fecha para el header y formatear fechas ===
-        hoy_d = datetime.now().date()
-        ayer_d = hoy_d - timedelta(days=1)
-        grupos = defaultdict(list)
+        alertas.append(a)
 
-        for a in alertas:
-            f_raw = a.get("fecha_creacion") or a.get("timestamp")
-            try:
-                f_dt = (
-                    datetime.fromisoformat(str(f_raw).split(".")[0])
-                    if f_raw
-                    else datetime.now()
-                )
-                f = f_dt.date()
-                # Formatear fecha como "HH:MM:SS - DD/MM/YYYY"
-                a["fecha_formateada"] = f_dt.strftime("%H:%M:%S - %d/%m/%Y")
-            except Exception:
-                f = hoy_d
-                a["fecha_formateada"] = datetime.now().strftime("%H:%M:%S - %d/%m/%Y")
+    # Resolver alertas inválidas en un solo UPDATE
+    if alertas_a_resolver:
+        try:
+            alert_store.resolve_many(alertas_a_resolver)
+            print(f"[LIMPIEZA] {len(alertas_a_resolver)} alertas resueltas automáticamente")
+        except Exception as resolve_err:
+            print(f"[ERROR] Error al resolver alertas: {resolve_err}")
 
-            if f == hoy_d:
-                grupos["Hoy"].append(a)
-            elif f == ayer_d:
-                grupos["Ayer"].append(a)
-            else:
-                grupos[f.strftime("%d/%m/%Y")].append(a)
+    # === 4) Alerta dinámica: productos sin pesaje en 7 días ===
+    hoy = datetime.now()
+    hace_7d = (hoy - timedelta(days=7)).isoformat()
+
+    pesajes_7d = (
+        supabase.table("pesajes")
+        .select("idproducto")
+        .gte("fecha_pesaje", hace_7d)
+        .execute()
+        .data or []
+    )
+    ids_con_pesaje = {p["idproducto"] for p in pesajes_7d if p.get("idproducto")}
+    sin_pesaje = ids_activos - ids_con_pesaje
+
+    if sin_pesaje:
+        alertas.append({
+            "id": "__no_pesaje_7d__",
+            "tipo_color": "amarillo",
+            "icono": "warning",
+            "titulo": "Productos sin pesaje reciente",
+            "descripcion": f"No se han pesado {len(sin_pesaje)} producto(s) en los últimos 7 días.",
+            "detalle": "Sugerencia: planificar control de estantes y calibración si aplica.",
+            "enlace": "/movimientos",
+            # Fecha antigua para que quede al final del panel
+            "fecha_creacion": (hoy - timedelta(days=30)).isoformat(),
+        })
+
+    # === 5) Formatear y ordenar por fecha (más recientes primero) ===
+    def obtener_timestamp(alerta):
+        try:
+            fecha = alerta.get("fecha_creacion") or alerta.get("timestamp") or hoy.isoformat()
+            fecha_str = str(fecha).split(".")[0].replace("Z", "").replace("+00:00", "")
+            return datetime.fromisoformat(fecha_str).timestamp()
+        except Exception:
+            return 0
+
+    for a in alertas:
+        f_raw = a.get("fecha_creacion") or a.get("timestamp")
+        try:
+            f_dt = datetime.fromisoformat(str(f_raw).split(".")[0]) if f_raw else hoy
+        except Exception:
+            f_dt = hoy
+        # Formato "HH:MM:SS - DD/MM/YYYY"
+        a["fecha_formateada"] = f_dt.strftime("%H:%M:%S - %d/%m/%Y")
+
+    return sorted(alertas, key=obtener_timestamp, reverse=True)
+
+
+notificaciones_cache = NotificacionesCache(_construir_notificaciones, agrupar_notificaciones_por_fecha)
 
-        return alertas, grupos
 
+def obtener_notificaciones(usuario_id=None):
+    """Notificaciones del header desde memoria: ``(alertas, grupos_por_fecha)``."""
+    try:
+        return notificaciones_cache.obtener()
     except Exception as e:
         print(f"Error al obtener notificaciones: {e}")
         return [], {}
 
 
+def invalidar_notificaciones():
+    """Avisar que cambió la tabla ``alertas``; el panel se refresca en segundo plano."""
+    notificaciones_cache.invalidar()
+
+
+# Toda escritura hecha a través del AlertStore refresca el panel
+alert_store.suscribir(invalidar_notificaciones)
+
+
 # === UTILIDADES PARA INVENTARIO ===
 
 def asignar_estante(categoria):
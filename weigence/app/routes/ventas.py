@@ -147,8 +147,10 @@ def calcular_crecimiento_producto_simple(registros):
 @bp.route("/api/ventas/nueva", methods=["POST"])
 @requiere_login
 def crear_nueva_venta():
+    from app.data.venta_service import VentaRechazada, registrar_venta
+
     try:
-        datos = request.json
+        datos = request.json or {}
         
         # Validar datos requeridos
         if not datos.get("productos") or len(datos["productos"]) == 0:
@@ -158,122 +160,20 @@ def crear_nueva_venta():
         if not rut_usuario:
             return jsonify({"success": False, "error": "Usuario no identificado"}), 401
         
-        # Calcular total de la venta
-        total_venta = sum(
-            producto["cantidad"] * producto["precio_unitario"] 
-            for producto in datos["productos"]
-        )
-        
-        # 1. Crear la venta principal
-        venta_data = {
-            "rut_usuario": rut_usuario,
-            "fecha_venta": datetime.now().isoformat(),
-            "total": total_venta
-        }
-        
-        venta_response = supabase.table("ventas").insert(venta_data).execute()
-        
-        if not venta_response.data:
-            return jsonify({"success": False, "error": "Error al crear la venta"}), 500
+        # Venta, detalles, stock y conciliación de retiros en una sola transacción
+        try:
+            venta = registrar_venta(rut_usuario, datos["productos"])
+        except VentaRechazada as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         
-        id_venta = venta_response.data[0]["idventa"]
+        id_venta = venta["id_venta"]
+        total_venta = venta["total"]
         
         # Registrar evento de venta en auditoría
         from app.utils.eventohumano import registrar_evento_humano
         usuario_nombre = session.get("usuario_nombre", "Usuario")
         registrar_evento_humano("venta", f"{usuario_nombre} realizó Venta #{id_venta} por ${total_venta:,.0f}")
         
-        # 2. Crear detalles de venta y actualizar inventario
-        detalles_venta = []
-        movimientos_inventario = []
-        
-        for producto in datos["productos"]:
-            idproducto = producto["idproducto"]
-            cantidad = producto["cantidad"]
-            precio_unitario = producto["precio_unitario"]
-            
-            # Obtener información del producto (incluyendo peso en GRAMOS)
-            producto_info = supabase.table("productos").select("id_estante, stock, peso").eq("idproducto", idproducto).execute()
-            
-            if not producto_info.data:
-                continue
-            
-            stock_actual = producto_info.data[0].get("stock", 0)
-            id_estante = producto_info.data[0].get("id_estante")
-            peso_gramos = producto_info.data[0].get("peso", 0)  # Peso en GRAMOS desde BD
-            peso_kg = peso_gramos / 1000  # Convertir a kilogramos
-            
-            # Validar stock disponible
-            if stock_actual < cantidad:
-                return jsonify({
-                    "success": False, 
-                    "error": f"Stock insuficiente para el producto ID {idproducto}. Disponible: {stock_actual}, Solicitado: {cantidad}"
-                }), 400
-            
-            # Detalle de venta (sin subtotal, es columna generada automáticamente)
-            detalle = {
-                "idventa": id_venta,
-                "idproducto": idproducto,
-                "cantidad": cantidad,
-                "precio_unitario": precio_unitario
-            }
-            detalles_venta.append(detalle)
-            
-
-            # Intentar emparejar con retiro ya registrado (asíncrono)
-            from datetime import timedelta
-            now = datetime.now()
-            ventana_ini = (now - timedelta(minutes=5)).isoformat()
-            ventana_fin = (now + timedelta(minutes=5)).isoformat()
-            # Buscar retiro pendiente (no validado por venta) en la ventana
-            retiro_match = supabase.table("movimientos_inventario").select("id_movimiento, cantidad, peso_total, timestamp, es_venta_validada").eq("idproducto", idproducto).eq("tipo_evento", "Retirar").eq("es_venta_validada", False).gte("timestamp", ventana_ini).lte("timestamp", ventana_fin).execute().data
-            if retiro_match:
-                # Emparejar: actualizar retiro como validado
-                for retiro in retiro_match:
-                    supabase.table("movimientos_inventario").update({
-                        "es_venta_validada": True,
-                        "motivo_sospecha": None,
-                        "observacion": f"Emparejado con venta #{id_venta}"
-                    }).eq("id_movimiento", retiro["id_movimiento"]).execute()
-            else:
-                # No hay retiro, registrar venta pendiente
-                movimiento = {
-                    "tipo_evento": "VentaPendiente",
-                    "idproducto": idproducto,
-                    "id_estante": id_estante,
-                    "cantidad": cantidad,
-                    "peso_por_unidad": peso_kg,
-                    "peso_total": cantidad * peso_kg,
-                    "rut_usuario": rut_usuario,
-                    "timestamp": now.isoformat(),
-                    "observacion": f"Venta #{id_venta} pendiente de retiro"
-                }
-                movimientos_inventario.append(movimiento)
-            
-            # Actualizar stock del producto
-            nuevo_stock = stock_actual - cantidad
-            supabase.table("productos").update({
-                "stock": nuevo_stock,
-                "fecha_modificacion": datetime.now().isoformat(),
-                "modificado_por": rut_usuario
-            }).eq("idproducto", idproducto).execute()
-        
-        # 3. Insertar detalles de venta
-        if detalles_venta:
-            try:
-                detalle_response = supabase.table("detalle_ventas").insert(detalles_venta).execute()
-                if not detalle_response.data:
-                    return jsonify({"success": False, "error": "Error al registrar detalles de venta"}), 500
-            except Exception as e:
-                return jsonify({"success": False, "error": f"Error al insertar detalles: {str(e)}"}), 500
-        
-        # 4. Insertar movimientos de inventario
-        if movimientos_inventario:
-            try:
-                movimiento_response = supabase.table("movimientos_inventario").insert(movimientos_inventario).execute()
-            except Exception as e:
-                pass  # No crítico
-        
         return jsonify({
             "success": True,
             "mensaje": "Venta registrada exitosamente",
@@ -282,7 +182,7 @@ def crear_nueva_venta():
         })
         
     except Exception as e:
-        import traceback
+        print(f"[VENTAS] Error registrando venta: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 
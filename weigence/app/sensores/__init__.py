@@ -0,0 +1,3 @@
+"""
+Sensores package - Lectura continua de las pesas de los estantes
+"""
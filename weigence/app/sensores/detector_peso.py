@@ -0,0 +1,213 @@
+"""
+Detección de peso estable en el servidor.
+
+Se suscribe a ``lecturas_stream`` y mantiene por estante un buffer circular
+de las últimas lecturas. Cuando las ``DETECTOR_LECTURAS_ESTABLES`` lecturas
+más recientes quedan dentro de ``DETECTOR_TOLERANCIA_G`` gramos entre sí, el
+peso se considera estable; si difiere del último peso estable en al menos
+``DETECTOR_CAMBIO_REAL_G`` gramos se registra un movimiento gris.
+
+Cada movimiento queda asociado al ``id_lectura`` que cerró la ventana, así
+que una lectura nunca genera dos movimientos aunque llegue repetida.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import statistics
+import threading
+import time
+
+from .lecturas_stream import NAMESPACE, lecturas_stream, sala_estante
+
+logger = logging.getLogger(__name__)
+
+DETECTOR_ENABLED = os.getenv("DETECTOR_PESO_ENABLED", "1").lower() not in ("0", "false", "no")
+
+TOLERANCIA_G = float(os.getenv("DETECTOR_TOLERANCIA_G", "15"))
+CAMBIO_REAL_G = float(os.getenv("DETECTOR_CAMBIO_REAL_G", "50"))
+LECTURAS_ESTABLES = int(os.getenv("DETECTOR_LECTURAS_ESTABLES", "3"))
+
+_BUFFER_POR_ESTANTE = 20
+_MAX_IDS_EMITIDOS = 5000
+
+
+def _peso(lectura):
+    try:
+        return float(lectura.get("peso_leido"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _EstadoEstante:
+    """Lecturas recientes y último peso estable de un estante."""
+
+    def __init__(self):
+        self.lecturas = deque(maxlen=_BUFFER_POR_ESTANTE)
+        self.peso_base = None
+        self.ultimo_id = 0
+
+
+class DetectorPesoEstable:
+    """Convierte el flujo de lecturas en movimientos grises.
+
+    Las lecturas se procesan en el hilo del lector (solo cálculos en memoria);
+    el registro del movimiento, que consulta Supabase, corre en un único hilo
+    aparte para no frenar el stream y mantener el orden por estante.
+    """
+
+    def __init__(
+        self,
+        registrar=None,
+        tolerancia_g=TOLERANCIA_G,
+        cambio_real_g=CAMBIO_REAL_G,
+        lecturas_estables=LECTURAS_ESTABLES,
+    ):
+        self._registrar = registrar
+        self._tolerancia = float(tolerancia_g)
+        self._cambio_real = float(cambio_real_g)
+        self._lecturas_estables = max(1, int(lecturas_estables))
+        self._lock = threading.Lock()
+        self._estantes = {}
+        self._emitidos = set()
+        self._emitidos_orden = deque()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="detector-peso")
+        self._socketio = None
+        self._movimientos = 0
+        self._errores = 0
+        self._ultimo_evento = None
+
+    def start(self, stream=None, socketio=None):
+        self._socketio = socketio
+        (stream or lecturas_stream).suscribir(self.procesar)
+        logger.info(
+            f"[PESOS] Detector de peso estable activo "
+            f"(tolerancia {self._tolerancia}g, cambio real {self._cambio_real}g, ventana {self._lecturas_estables})"
+        )
+
+    # ------------------------------------------------------------
+    # Flujo de lecturas
+    # ------------------------------------------------------------
+    def procesar(self, lecturas):
+        """Incorpora un lote de lecturas (ordenado por ``id_lectura``)."""
+        eventos = []
+        with self._lock:
+            for lectura in lecturas:
+                evento = self._incorporar(lectura)
+                if evento is not None:
+                    eventos.append(evento)
+        for evento in eventos:
+            self._worker.submit(self._registrar_evento, evento)
+        return eventos
+
+    def _incorporar(self, lectura):
+        try:
+            id_estante = int(lectura.get("id_estante"))
+            id_lectura = int(lectura.get("id_lectura"))
+        except (TypeError, ValueError):
+            return None
+        peso = _peso(lectura)
+        if peso is None:
+            return None
+
+        estado = self._estantes.get(id_estante)
+        if estado is None:
+            estado = self._estantes[id_estante] = _EstadoEstante()
+        # Lecturas repetidas o fuera de orden no cambian el estado
+        if id_lectura <= estado.ultimo_id:
+            return None
+        estado.ultimo_id = id_lectura
+        estado.lecturas.append(peso)
+
+        if len(estado.lecturas) < self._lecturas_estables:
+            return None
+        ventana = list(estado.lecturas)[-self._lecturas_estables:]
+        if max(ventana) - min(ventana) > self._tolerancia:
+            return None  # Todavía se está moviendo
+
+        estable = statistics.median(ventana)
+        if estado.peso_base is None:
+            estado.peso_base = estable
+            return None
+
+        delta = estable - estado.peso_base
+        if abs(delta) < self._cambio_real:
+            return None
+        if id_lectura in self._emitidos:
+            return None
+
+        estado.peso_base = estable
+        self._marcar_emitido(id_lectura)
+        return {
+            "id_estante": id_estante,
+            "id_lectura": id_lectura,
+            "delta_g": delta,
+            "peso_estable_g": estable,
+        }
+
+    def _marcar_emitido(self, id_lectura):
+        self._emitidos.add(id_lectura)
+        self._emitidos_orden.append(id_lectura)
+        while len(self._emitidos_orden) > _MAX_IDS_EMITIDOS:
+            self._emitidos.discard(self._emitidos_orden.popleft())
+
+    # ------------------------------------------------------------
+    # Registro del movimiento
+    # ------------------------------------------------------------
+    def _registrar_evento(self, evento):
+        delta = evento["delta_g"]
+        tipo_cambio = "ADICIÓN" if delta > 0 else "RETIRO"
+        datos = {
+            "id_estante": evento["id_estante"],
+            "idproducto": None,
+            "cantidad": 1 if delta > 0 else -1,
+            "tipo_evento": "gris",
+            "peso_total": abs(delta) / 1000,  # kg - siempre positivo para buscar coincidencias
+            "peso_por_unidad": abs(delta) / 1000,
+            "observacion": f"{tipo_cambio}: {abs(delta):.0f}g [Lectura: {evento['id_lectura']}]",
+        }
+        try:
+            registrar = self._registrar
+            if registrar is None:
+                from app.routes.movimientos import registrar_movimiento_gris as registrar
+            resultado, status = registrar(datos)
+            if status >= 400 or not resultado.get("success"):
+                raise RuntimeError(resultado.get("error") or f"HTTP {status}")
+        except Exception as e:
+            with self._lock:
+                self._errores += 1
+            logger.error(f"[PESOS] No se pudo registrar movimiento del estante {evento['id_estante']}: {e}")
+            return None
+
+        with self._lock:
+            self._movimientos += 1
+            self._ultimo_evento = {**evento, "registrado_en": time.time()}
+        logger.info(f"[PESOS] Estante {evento['id_estante']}: {tipo_cambio} de {abs(delta):.0f}g registrado")
+
+        if self._socketio is not None and resultado.get("data"):
+            try:
+                self._socketio.emit(
+                    "movimiento_detectado",
+                    {**evento, "tipo": tipo_cambio, "mensaje": resultado.get("mensaje")},
+                    to=sala_estante(evento["id_estante"]),
+                    namespace=NAMESPACE,
+                )
+            except Exception as e:
+                logger.warning(f"[PESOS] No se pudo notificar el movimiento: {e}")
+        return resultado
+
+    def estado(self):
+        with self._lock:
+            return {
+                "activo": DETECTOR_ENABLED,
+                "movimientos": self._movimientos,
+                "errores": self._errores,
+                "ultimo_evento": self._ultimo_evento,
+                "estantes": {
+                    k: {"peso_base_g": v.peso_base, "ultimo_id": v.ultimo_id, "lecturas": len(v.lecturas)}
+                    for k, v in self._estantes.items()
+                },
+            }
+
+
+detector_peso = DetectorPesoEstable()
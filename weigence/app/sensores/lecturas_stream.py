@@ -0,0 +1,241 @@
+"""
+Lector único de ``lecturas_peso`` para todo el proceso.
+
+Un hilo consulta las lecturas nuevas (``id_lectura`` mayor al último visto)
+cada ``LECTURAS_POLL_SECONDS`` y las reparte: las emite por Socket.IO a la
+sala de cada estante y las guarda en un buffer circular por estante para que
+los clientes que se reconectan recuperen lo que se perdieron. La carga sobre
+Supabase es una consulta por tick, sin importar cuántas pestañas miren.
+"""
+from collections import deque
+import logging
+import os
+import threading
+import time
+
+from api.conexion_supabase import supabase
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/pesos"
+
+_POLL_SECONDS = float(os.getenv("LECTURAS_POLL_SECONDS", "2"))
+_BUFFER_POR_ESTANTE = int(os.getenv("LECTURAS_BUFFER_POR_ESTANTE", "200"))
+# Con varios workers solo uno lee lecturas_peso; sus emit llegan al resto por la cola de Socket.IO
+LECTURAS_STREAM_ENABLED = os.getenv("LECTURAS_STREAM_ENABLED", "1").lower() not in ("0", "false", "no")
+_PAGE_SIZE = 500
+
+
+def sala_estante(id_estante):
+    return f"estante:{id_estante}"
+
+
+class LecturasStream:
+    """Sigue ``lecturas_peso`` por high-water mark y reparte las lecturas nuevas.
+
+    ``suscribir`` permite a otros componentes del servidor (p. ej. el detector
+    de peso estable) recibir cada lote de lecturas en orden de ``id_lectura``.
+    """
+
+    def __init__(self, client=None, poll_seconds=_POLL_SECONDS, buffer_por_estante=_BUFFER_POR_ESTANTE):
+        self._client = client or supabase
+        self._poll_seconds = max(0.2, float(poll_seconds))
+        self._buffer_por_estante = int(buffer_por_estante)
+        self._lock = threading.Lock()
+        self._buffers = {}
+        # Menor id_lectura desde el que el buffer de cada estante tiene todas sus lecturas;
+        # los estantes sin entrada propia quedan cubiertos desde el inicio de la precarga
+        self._cubierto_desde = {}
+        self._cubierto_global = None
+        self._high_water_mark = None
+        self._socketio = None
+        self._suscriptores = []
+        self._iniciado = False
+        self._ultimo_tick = None
+        self._errores = 0
+
+    # ------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------
+    def start(self, socketio=None):
+        """Arranca el lector (idempotente). ``socketio`` es opcional."""
+        with self._lock:
+            if socketio is not None:
+                self._socketio = socketio
+            if self._iniciado:
+                return False
+            self._iniciado = True
+
+        if self._socketio is not None:
+            self._socketio.start_background_task(self._bucle)
+        else:
+            threading.Thread(target=self._bucle, name="lecturas-stream", daemon=True).start()
+        logger.info(f"[PESOS] Lector de lecturas_peso iniciado (cada {self._poll_seconds}s)")
+        return True
+
+    @property
+    def activo(self):
+        return self._iniciado
+
+    def suscribir(self, callback):
+        """``callback(lecturas)`` se llama con cada lote nuevo, ordenado por id."""
+        self._suscriptores.append(callback)
+
+    # ------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------
+    def recientes(self, estantes=None, desde_id=None, limite=None):
+        """Lecturas en memoria (más antiguas primero) posteriores a ``desde_id``.
+
+        Devuelve ``(lecturas, completo)``; ``completo`` es False si el buffer ya
+        no cubre ``desde_id`` (lecturas descartadas del buffer o anteriores a la
+        precarga) y el cliente debería pedir el tramo faltante a la BD. En un
+        proceso que no ejecuta el lector el buffer está vacío y nunca es completo.
+        """
+        with self._lock:
+            claves = list(self._buffers.keys()) if estantes is None else [int(e) for e in estantes]
+            lecturas = []
+            completo = self._iniciado and self._cubierto_global is not None
+            if desde_id is not None and completo:
+                cubiertos = [self._cubierto_desde.get(e, self._cubierto_global) for e in claves]
+                if estantes is None:
+                    cubiertos.append(self._cubierto_global)
+                # Faltan las lecturas con id entre desde_id y el inicio de la cobertura
+                completo = all(desde_id + 1 >= cubierto for cubierto in cubiertos)
+            for id_estante in claves:
+                buffer = self._buffers.get(id_estante)
+                if not buffer:
+                    continue
+                lecturas.extend(
+                    l for l in buffer if desde_id is None or l["id_lectura"] > desde_id
+                )
+        lecturas.sort(key=lambda l: l["id_lectura"])
+        if limite:
+            lecturas = lecturas[-int(limite):]
+        return lecturas, completo
+
+    def ultima(self, id_estante):
+        with self._lock:
+            buffer = self._buffers.get(int(id_estante))
+            return dict(buffer[-1]) if buffer else None
+
+    def estado(self):
+        with self._lock:
+            return {
+                "activo": self._iniciado,
+                "high_water_mark": self._high_water_mark,
+                "estantes": {k: len(v) for k, v in self._buffers.items()},
+                "ultimo_tick": self._ultimo_tick,
+                "errores": self._errores,
+            }
+
+    # ------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------
+    def _bucle(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                self._errores += 1
+                logger.warning(f"[PESOS] Error leyendo lecturas_peso: {e}")
+            time.sleep(self._poll_seconds)
+
+    def tick(self):
+        """Una pasada: lee lecturas nuevas, las guarda y las reparte."""
+        if self._high_water_mark is None:
+            self._precargar()
+            return []
+
+        nuevas = []
+        while True:
+            filas = (
+                self._client.table("lecturas_peso")
+                .select("*")
+                .gt("id_lectura", self._high_water_mark)
+                .order("id_lectura")
+                .limit(_PAGE_SIZE)
+                .execute()
+                .data or []
+            )
+            if not filas:
+                break
+            self._guardar(filas)
+            nuevas.extend(filas)
+            if len(filas) < _PAGE_SIZE:
+                break
+
+        self._ultimo_tick = time.time()
+        if nuevas:
+            self._repartir(nuevas)
+        return nuevas
+
+    def _precargar(self):
+        # Arranque: llenar los buffers con lo más reciente sin re-emitir historia
+        filas = (
+            self._client.table("lecturas_peso")
+            .select("*")
+            .order("id_lectura", desc=True)
+            .limit(self._buffer_por_estante)
+            .execute()
+            .data or []
+        )
+        filas.reverse()
+        with self._lock:
+            self._high_water_mark = 0
+            # Si la tabla tenía más lecturas que las precargadas, las anteriores a la
+            # primera solo están en la BD
+            self._cubierto_global = 0
+            if filas and len(filas) >= self._buffer_por_estante:
+                try:
+                    self._cubierto_global = int(filas[0].get("id_lectura"))
+                except (TypeError, ValueError):
+                    pass
+        self._guardar(filas)
+        self._ultimo_tick = time.time()
+
+    def _guardar(self, filas):
+        with self._lock:
+            for fila in filas:
+                try:
+                    id_lectura = int(fila.get("id_lectura"))
+                except (TypeError, ValueError):
+                    continue
+                self._high_water_mark = max(self._high_water_mark or 0, id_lectura)
+                try:
+                    id_estante = int(fila.get("id_estante"))
+                except (TypeError, ValueError):
+                    continue
+                buffer = self._buffers.get(id_estante)
+                if buffer is None:
+                    buffer = self._buffers[id_estante] = deque(maxlen=self._buffer_por_estante)
+                lleno = len(buffer) == buffer.maxlen
+                buffer.append(fila)
+                if lleno:
+                    # Se descartó la lectura más antigua del estante
+                    self._cubierto_desde[id_estante] = int(buffer[0]["id_lectura"])
+
+    def _repartir(self, lecturas):
+        if self._socketio is not None:
+            por_estante = {}
+            for lectura in lecturas:
+                por_estante.setdefault(lectura.get("id_estante"), []).append(lectura)
+            for id_estante, lote in por_estante.items():
+                try:
+                    self._socketio.emit(
+                        "lecturas_peso",
+                        {"id_estante": id_estante, "lecturas": lote},
+                        to=sala_estante(id_estante),
+                        namespace=NAMESPACE,
+                    )
+                except Exception as e:
+                    logger.warning(f"[PESOS] No se pudo emitir al estante {id_estante}: {e}")
+
+        for callback in list(self._suscriptores):
+            try:
+                callback(lecturas)
+            except Exception as e:
+                logger.exception(f"[PESOS] Suscriptor falló: {e}")
+
+
+lecturas_stream = LecturasStream()
@@ -0,0 +1,81 @@
+"""
+Eventos Socket.IO del namespace ``/pesos``.
+
+Cada cliente se une a la sala de los estantes que muestra y recibe las
+lecturas nuevas que reparte ``lecturas_stream``. Al (re)conectarse envía el
+último ``id_lectura`` que vio y recibe de inmediato lo que se perdió.
+"""
+from flask import session
+from flask_socketio import emit, join_room, leave_room
+
+from .detector_peso import DETECTOR_ENABLED, detector_peso
+from .lecturas_stream import LECTURAS_STREAM_ENABLED, NAMESPACE, lecturas_stream, sala_estante
+
+
+def _parse_estantes(data):
+    estantes = []
+    for valor in (data or {}).get("estantes") or []:
+        try:
+            estantes.append(int(valor))
+        except (TypeError, ValueError):
+            continue
+    return estantes
+
+
+def on_connect():
+    if not session.get("usuario_id"):
+        print("[WS PESOS] conexion denegada (sin sesion)")
+        return False
+
+
+def on_suscribir(data):
+    """``{"estantes": [1, 2], "desde_id": 123}`` -> une a las salas y envía el catch-up."""
+    if not isinstance(data, dict):
+        emit("error", {"msg": "Datos insuficientes"})
+        return
+
+    estantes = _parse_estantes(data)
+    if not estantes:
+        emit("error", {"msg": "estantes requerido"})
+        return
+
+    for id_estante in estantes:
+        join_room(sala_estante(id_estante))
+
+    desde_id = data.get("desde_id")
+    try:
+        desde_id = int(desde_id) if desde_id is not None else None
+    except (TypeError, ValueError):
+        desde_id = None
+
+    lecturas, completo = ([], True)
+    if desde_id is not None:
+        lecturas, completo = lecturas_stream.recientes(estantes, desde_id=desde_id)
+
+    emit("suscrito", {
+        "estantes": estantes,
+        "lecturas": lecturas,
+        "completo": completo,
+        "ultimas": {e: lecturas_stream.ultima(e) for e in estantes},
+        # Con el detector activo el navegador solo muestra; no registra movimientos
+        "detector_servidor": DETECTOR_ENABLED,
+    })
+
+
+def on_desuscribir(data):
+    for id_estante in _parse_estantes(data):
+        leave_room(sala_estante(id_estante))
+
+
+def init_pesos_ws(socketio):
+    """Registra el namespace ``/pesos`` y arranca el lector de lecturas y el detector."""
+    socketio.on_event("connect", on_connect, namespace=NAMESPACE)
+    socketio.on_event("suscribir_estantes", on_suscribir, namespace=NAMESPACE)
+    socketio.on_event("desuscribir_estantes", on_desuscribir, namespace=NAMESPACE)
+    if not LECTURAS_STREAM_ENABLED:
+        # Otro worker lee lecturas_peso y corre el detector; aquí solo se atienden las salas
+        print("[WS PESOS] Lector de lecturas desactivado en este proceso (LECTURAS_STREAM_ENABLED=0)")
+        return
+    if DETECTOR_ENABLED:
+        detector_peso.start(lecturas_stream, socketio)
+    lecturas_stream.start(socketio)
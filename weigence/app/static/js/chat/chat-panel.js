@@ -995,7 +995,8 @@ const ChatFloat = (() => {
         if (!unreadBadge) return;
 
         try {
-            const res = await fetch("/api/chat/conversaciones");
+            // Solo el total: el servidor lo suma desde el contador por conversación
+            const res = await fetch("/api/chat/no_leidos");
             const data = await res.json();
 
             if (!data.success) {
@@ -1003,8 +1004,7 @@ const ChatFloat = (() => {
                 return;
             }
 
-            // Sumar todos los mensajes no leídos
-            const total = data.lista.reduce((sum, conv) => sum + (conv.unread || 0), 0);
+            const total = data.total || 0;
 
             // Solo mostrar badge si hay mensajes no leídos
             if (total > 0) {
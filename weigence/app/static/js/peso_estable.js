@@ -1,6 +1,9 @@
 /**
  * Sistema Simple de Detección de Cambios de Peso - Movimientos Grises
- * Lee directamente de lecturas_peso y registra movimientos cuando diferencia_anterior > 15g
+ * Recibe las lecturas de lecturas_peso por Socket.IO (namespace /pesos). Si el
+ * servidor tiene el detector de peso estable activo, él registra los movimientos y
+ * aquí solo se muestran; si no, se registran cuando diferencia_anterior > 15g.
+ * Sin Socket.IO, vuelve a consultar /api/lecturas_peso_recientes por estante.
  */
 
 class DetectorPesoSimple {
@@ -9,6 +12,9 @@ class DetectorPesoSimple {
     this.lecturasYaProcesadas = new Set(); // IDs de lecturas ya procesadas
     this.ultimoMovimientoPorEstante = {}; // Rastrear último peso por estante
     this.UMBRAL_CAMBIO_REAL = 50; // gramos - cambio mínimo para considerar movimiento real
+    this.ultimoIdLectura = null; // Última lectura recibida (para catch-up al reconectar)
+    this.socket = null;
+    this.detectorServidor = false; // true: el servidor registra los movimientos grises
   }
 
   async verificarEstante(idEstante) {
@@ -41,8 +47,23 @@ class DetectorPesoSimple {
         return;
       }
 
-      const lectura = resultado.data[0]; // La más reciente
+      await this.procesarLectura(idEstante, resultado.data[0]); // La más reciente
+
+    } catch (error) {
+      console.error(`❌ [Verificar] Error verificando estante ${idEstante}:`, error);
+      console.error(`   Stack:`, error.stack);
+    }
+  }
+
+  async procesarLectura(idEstante, lectura) {
+    try {
       const idLectura = lectura.id_lectura;
+      if (this.ultimoIdLectura === null || idLectura > this.ultimoIdLectura) {
+        this.ultimoIdLectura = idLectura;
+      }
+      if (this.detectorServidor) {
+        return; // El servidor ya detecta y registra el movimiento
+      }
       const diferencia = parseFloat(lectura.diferencia_anterior) || 0;
       const timestampLectura = new Date(lectura.timestamp);
       const ahora = new Date();
@@ -94,11 +115,90 @@ class DetectorPesoSimple {
       await this.registrarMovimientoGris(idEstante, lectura);
 
     } catch (error) {
-      console.error(`❌ [Verificar] Error verificando estante ${idEstante}:`, error);
-      console.error(`   Stack:`, error.stack);
+      console.error(`❌ [Verificar] Error procesando lectura del estante ${idEstante}:`, error);
+    }
+  }
+
+  async procesarLote(lecturas) {
+    // Igual que el polling: solo la lectura más reciente de cada estante
+    const ultimaPorEstante = {};
+    for (const lectura of lecturas || []) {
+      const actual = ultimaPorEstante[lectura.id_estante];
+      if (!actual || lectura.id_lectura > actual.id_lectura) {
+        ultimaPorEstante[lectura.id_estante] = lectura;
+      }
+    }
+    for (const [idEstante, lectura] of Object.entries(ultimaPorEstante)) {
+      await this.procesarLectura(parseInt(idEstante), lectura);
     }
   }
 
+  async recuperarDesdeStream(estantes) {
+    // El buffer del servidor no alcanzó: pedir el tramo faltante por HTTP
+    try {
+      const params = new URLSearchParams({ estantes: estantes.join(',') });
+      if (this.ultimoIdLectura !== null) params.set('desde_id', this.ultimoIdLectura);
+      const response = await fetch(`/api/lecturas_peso/stream?${params}`, { credentials: 'include' });
+      if (!response.ok) return;
+      const resultado = await response.json();
+      if (resultado.success) await this.procesarLote(resultado.lecturas);
+    } catch (error) {
+      console.error('❌ [Stream] Error en catch-up:', error);
+    }
+  }
+
+  conectarStream(estantes) {
+    this.socket = io('/pesos', {
+      transports: ['polling'],
+      upgrade: false,
+      reconnection: true,
+      reconnectionDelay: 1000,
+      reconnectionDelayMax: 5000,
+      timeout: 10000
+    });
+
+    // En cada (re)conexión: unirse a las salas y recibir lo perdido
+    this.socket.on('connect', () => {
+      this.socket.emit('suscribir_estantes', { estantes: estantes, desde_id: this.ultimoIdLectura });
+    });
+
+    this.socket.on('suscrito', async (data) => {
+      console.log(`📡 [Stream] Suscrito a estantes: ${data.estantes.join(', ')}`);
+      const primeraConexion = this.ultimoIdLectura === null;
+      this.detectorServidor = data.detector_servidor === true;
+      if (primeraConexion && !this.detectorServidor) {
+        await this.recuperarMovimientosPerdidos(estantes);
+      }
+      if (primeraConexion) {
+        // Primera conexión: tomar la última lectura como punto de partida
+        for (const lectura of Object.values(data.ultimas || {})) {
+          if (lectura && (this.ultimoIdLectura === null || lectura.id_lectura > this.ultimoIdLectura)) {
+            this.ultimoIdLectura = lectura.id_lectura;
+          }
+        }
+        return;
+      }
+      if (data.completo === false) {
+        await this.recuperarDesdeStream(estantes);
+      } else {
+        await this.procesarLote(data.lecturas);
+      }
+    });
+
+    this.socket.on('lecturas_peso', (data) => this.procesarLote(data.lecturas));
+
+    this.socket.on('movimiento_detectado', (data) => {
+      const gramos = Math.abs(data.delta_g).toFixed(0);
+      console.log(`✅ [Servidor] Movimiento gris registrado - Estante ${data.id_estante}: ${data.tipo} ${gramos}g`);
+      if (window.mostrarToast) {
+        window.mostrarToast(
+          `${data.delta_g > 0 ? '📥' : '📤'} ${data.tipo} en estante ${data.id_estante}: ${gramos}g`,
+          data.delta_g > 0 ? 'warning' : 'info'
+        );
+      }
+    });
+  }
+
   async registrarMovimientoGris(idEstante, lectura, desdeRecuperacion = false) {
     const diferencia = parseFloat(lectura.diferencia_anterior);
     const pesoActual = parseFloat(lectura.peso_leido);
@@ -289,13 +389,17 @@ class DetectorPesoSimple {
   async iniciarMonitoreo(estantes, intervalo = 15000) {
     console.log(`🚀 Iniciando monitoreo de estantes: ${estantes.join(', ')} cada ${intervalo/1000}s`);
     
-    // 1. Primero recuperar movimientos perdidos
+    // 1. Lecturas en tiempo real empujadas por el servidor
+    //    (la recuperación se decide al suscribirse, según el detector del servidor)
+    if (typeof io !== 'undefined') {
+      this.conectarStream(estantes);
+      return;
+    }
+
+    // 2. Sin Socket.IO: recuperar movimientos perdidos, verificación inicial y polling
+    console.warn('⚠️ Socket.IO no disponible, usando polling');
     await this.recuperarMovimientosPerdidos(estantes);
-    
-    // 2. Luego verificación inicial
     estantes.forEach(estante => this.verificarEstante(estante));
-    
-    // 3. Iniciar monitoreo continuo
     setInterval(() => {
       estantes.forEach(estante => this.verificarEstante(estante));
     }, intervalo);
@@ -0,0 +1,331 @@
+"""
+Escritura diferida (write-behind) de ``auditoria_eventos``.
+
+``registrar`` solo encola el evento; un hilo los inserta en lotes cada
+``AUDITORIA_FLUSH_MS`` milisegundos o al juntar ``AUDITORIA_LOTE_MAX``
+eventos, así que navegar o iniciar sesión ya no espera un INSERT.
+
+- Cola acotada (``AUDITORIA_COLA_MAX``). Si se llena, ``AUDITORIA_POLITICA``
+  decide: ``disco`` escribe el evento en el archivo de pendientes y
+  ``descartar`` lo pierde (queda contado en ``estado()``).
+- Si Supabase no responde (conexión o 5xx), el lote va a un JSONL en
+  ``data/auditoria/`` y los reintentos se espacian hasta
+  ``_BACKOFF_MAX_SECONDS``. Con el primer lote que vuelve a entrar se
+  reproduce el archivo en orden.
+- Si Postgres rechaza datos (4xx: texto demasiado largo, restricción, ...)
+  el lote se divide hasta aislar la fila culpable, que se aparta en
+  ``auditoria_rechazada.jsonl``; el resto del lote y de la cola sigue su curso.
+- Al terminar el proceso se vacía la cola (a la BD o al archivo).
+"""
+import atexit
+from collections import deque
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+
+from api.conexion_supabase import supabase
+
+try:
+    from postgrest.exceptions import APIError
+except ImportError:  # pragma: no cover - versiones antiguas del cliente
+    APIError = Exception
+
+logger = logging.getLogger(__name__)
+
+TABLA = "auditoria_eventos"
+PENDIENTES_PATH = Path(__file__).parent.parent.parent / "data" / "auditoria" / "auditoria_pendiente.jsonl"
+RECHAZADOS_PATH = PENDIENTES_PATH.with_name("auditoria_rechazada.jsonl")
+
+AUDITORIA_WRITE_BEHIND = os.getenv("AUDITORIA_WRITE_BEHIND", "1").lower() not in ("0", "false", "no")
+_FLUSH_MS = float(os.getenv("AUDITORIA_FLUSH_MS", "500"))
+_LOTE_MAX = int(os.getenv("AUDITORIA_LOTE_MAX", "100"))
+_COLA_MAX = int(os.getenv("AUDITORIA_COLA_MAX", "5000"))
+_POLITICA = os.getenv("AUDITORIA_POLITICA", "disco")
+_BACKOFF_MAX_SECONDS = 60.0
+
+# Clases SQLSTATE que indican un problema del servidor y no de la fila:
+# conexión, recursos, cancelación/apagado, errores del sistema y transacciones abortadas
+_SQLSTATE_TRANSITORIOS = ("08", "53", "57", "58", "40", "XX")
+
+
+def _es_error_de_datos(error):
+    """True si reintentar el mismo lote fallaría igual (4xx), False si es un corte (conexión o 5xx)."""
+    if not isinstance(error, APIError) or APIError is Exception:
+        return False
+    codigo = getattr(error, "code", None)
+    if isinstance(codigo, int):
+        # Respuesta sin JSON: el código es el status HTTP
+        return 400 <= codigo < 500
+    codigo = str(codigo or "")
+    if not codigo:
+        return False
+    # PGRST0xx son errores de conexión de PostgREST con la BD (503)
+    if codigo.startswith("PGRST"):
+        return not codigo.startswith("PGRST0")
+    return not codigo.startswith(_SQLSTATE_TRANSITORIOS)
+
+
+class AuditoriaSink:
+    """Cola acotada de eventos con un hilo que los inserta en lote."""
+
+    def __init__(self, client=None, *, flush_ms=_FLUSH_MS, lote_max=_LOTE_MAX,
+                 cola_max=_COLA_MAX, politica=_POLITICA, pendientes_path=PENDIENTES_PATH,
+                 rechazados_path=None):
+        self._client = client if client is not None else supabase
+        self._intervalo = max(0.01, float(flush_ms) / 1000.0)
+        self._lote_max = max(1, int(lote_max))
+        self._cola_max = max(1, int(cola_max))
+        self._politica = politica if politica in ("disco", "descartar") else "disco"
+        self._path = Path(pendientes_path)
+        self._rechazados_path = Path(rechazados_path or self._path.with_name(RECHAZADOS_PATH.name))
+        self._cola = deque()
+        self._cond = threading.Condition()
+        self._archivo_lock = threading.Lock()
+        self._hilo = None
+        self._fallos_seguidos = 0
+        self._reintentar_en = 0.0
+        self._encolados = 0
+        self._insertados = 0
+        self._lotes = 0
+        self._a_disco = 0
+        self._reproducidos = 0
+        self._descartados = 0
+        self._rechazados = 0
+        self._ultimo_error = None
+        self._ultimo_rechazo = None
+
+    # ------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------
+    def registrar(self, payload):
+        """Encola un evento (dict con fecha, usuario, accion, detalle). No bloquea."""
+        self._asegurar_hilo()
+        with self._cond:
+            if len(self._cola) < self._cola_max:
+                self._cola.append(payload)
+                self._encolados += 1
+                if len(self._cola) >= self._lote_max:
+                    self._cond.notify()
+                return True
+        # Cola llena: Supabase no da abasto o está caído
+        if self._politica == "descartar":
+            with self._cond:
+                self._descartados += 1
+            return False
+        return self._a_archivo([payload])
+
+    def flush(self, timeout=5.0):
+        """Inserta (o manda a disco) todo lo encolado, desde el hilo que llama."""
+        limite = time.monotonic() + float(timeout)
+        while time.monotonic() < limite:
+            lote = self._tomar_lote()
+            if not lote:
+                return True
+            self._escribir(lote)
+        return False
+
+    def estado(self):
+        with self._cond:
+            return {
+                "write_behind": True,
+                "activo": bool(self._hilo and self._hilo.is_alive()),
+                "en_cola": len(self._cola),
+                "encolados": self._encolados,
+                "insertados": self._insertados,
+                "lotes": self._lotes,
+                "a_disco": self._a_disco,
+                "reproducidos": self._reproducidos,
+                "descartados": self._descartados,
+                "rechazados": self._rechazados,
+                "ultimo_rechazo": self._ultimo_rechazo,
+                "pendientes_en_disco": self._path.exists(),
+                "fallos_seguidos": self._fallos_seguidos,
+                "ultimo_error": self._ultimo_error,
+                "politica": self._politica,
+            }
+
+    # ------------------------------------------------------------
+    # Hilo de escritura
+    # ------------------------------------------------------------
+    def _asegurar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._cond:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="auditoria-sink", daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                if len(self._cola) < self._lote_max:
+                    self._cond.wait(timeout=self._intervalo)
+            lote = self._tomar_lote()
+            if lote:
+                self._escribir(lote)
+            elif self._path.exists() and time.monotonic() >= self._reintentar_en:
+                # Sin tráfico también se reintenta el archivo cuando vence la espera
+                self._reproducir()
+
+    def _tomar_lote(self):
+        with self._cond:
+            cantidad = min(len(self._cola), self._lote_max)
+            return [self._cola.popleft() for _ in range(cantidad)]
+
+    def _escribir(self, lote):
+        # Durante un corte no se golpea a Supabase en cada tick: el lote va directo a disco
+        if self._fallos_seguidos and time.monotonic() < self._reintentar_en:
+            self._a_archivo(lote)
+            return
+        _, error, restantes = self._insertar_separando(lote)
+        if error is not None:
+            self._registrar_fallo(error)
+            self._a_archivo(restantes)
+            return
+        if self._fallos_seguidos:
+            logger.info("[AUDITORIA] Supabase disponible de nuevo; reproduciendo eventos pendientes")
+            with self._cond:
+                self._fallos_seguidos = 0
+        self._reproducir()
+
+    def _insertar(self, lote):
+        self._client.table(TABLA).insert(lote).execute()
+        with self._cond:
+            self._insertados += len(lote)
+            self._lotes += 1
+
+    def _insertar_separando(self, lote):
+        """Inserta ``lote`` partiéndolo en mitades ante errores de datos.
+
+        Las filas que Postgres rechaza por sí solas van a cuarentena. Si hay un
+        corte, se detiene y devuelve lo que falta por insertar, en orden.
+
+        Returns:
+            Tupla (insertados, error_de_corte o None, eventos_no_insertados)
+        """
+        insertados = 0
+        pendientes = [lote]
+        while pendientes:
+            parte = pendientes.pop()
+            try:
+                self._insertar(parte)
+            except Exception as e:
+                if not _es_error_de_datos(e):
+                    restantes = parte + [evento for resto in reversed(pendientes) for evento in resto]
+                    return insertados, e, restantes
+                if len(parte) == 1:
+                    self._a_cuarentena(parte[0], e)
+                    continue
+                mitad = len(parte) // 2
+                # Se apila primero la segunda mitad para procesar en orden
+                pendientes.append(parte[mitad:])
+                pendientes.append(parte[:mitad])
+                continue
+            insertados += len(parte)
+        return insertados, None, []
+
+    def _registrar_fallo(self, error):
+        with self._cond:
+            self._fallos_seguidos += 1
+            espera = min(_BACKOFF_MAX_SECONDS, 2.0 ** self._fallos_seguidos)
+            self._reintentar_en = time.monotonic() + espera
+            self._ultimo_error = str(error)
+        logger.warning(f"[AUDITORIA] No se pudo insertar el lote ({error}); reintento en {espera:.0f}s")
+
+    # ------------------------------------------------------------
+    # Archivo de pendientes
+    # ------------------------------------------------------------
+    def _a_archivo(self, eventos):
+        try:
+            with self._archivo_lock:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                with self._path.open("a", encoding="utf-8") as archivo:
+                    for evento in eventos:
+                        archivo.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.error(f"[AUDITORIA] ✗ Se perdieron {len(eventos)} eventos: no se pudo escribir {self._path}: {e}")
+            with self._cond:
+                self._descartados += len(eventos)
+            return False
+        with self._cond:
+            self._a_disco += len(eventos)
+        return True
+
+    def _a_cuarentena(self, evento, error):
+        """Aparta una fila que Postgres rechaza para no bloquear el resto de la cola."""
+        logger.warning(f"[AUDITORIA] Evento rechazado por la BD ({error}); se aparta en {self._rechazados_path}")
+        registro = {"evento": evento, "error": str(error), "fecha_rechazo": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        try:
+            with self._archivo_lock:
+                self._rechazados_path.parent.mkdir(parents=True, exist_ok=True)
+                with self._rechazados_path.open("a", encoding="utf-8") as archivo:
+                    archivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.error(f"[AUDITORIA] ✗ No se pudo escribir {self._rechazados_path}: {e}")
+        with self._cond:
+            self._rechazados += 1
+            self._ultimo_rechazo = str(error)
+
+    def _reproducir(self):
+        """Inserta el archivo de pendientes en lotes; si hay un corte, lo que falta vuelve al archivo."""
+        if not self._path.exists():
+            return
+        tomado = self._path.with_suffix(f".{os.getpid()}.reproduciendo")
+        try:
+            with self._archivo_lock:
+                # El rename es atómico: con varios workers solo uno se lleva el archivo
+                self._path.replace(tomado)
+            with tomado.open(encoding="utf-8") as archivo:
+                eventos = [json.loads(linea) for linea in archivo if linea.strip()]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"[AUDITORIA] Archivo de pendientes ilegible ({e}); se deja en {tomado}")
+            return
+
+        reproducidos = 0
+        for inicio in range(0, len(eventos), self._lote_max):
+            lote = eventos[inicio:inicio + self._lote_max]
+            insertados, error, restantes = self._insertar_separando(lote)
+            reproducidos += insertados
+            with self._cond:
+                self._reproducidos += insertados
+            if error is not None:
+                self._registrar_fallo(error)
+                if not self._a_archivo(restantes + eventos[inicio + self._lote_max:]):
+                    return  # El archivo tomado queda en disco para no perder nada
+                break
+            with self._cond:
+                self._fallos_seguidos = 0
+        tomado.unlink(missing_ok=True)
+        logger.info(f"[AUDITORIA] {reproducidos} de {len(eventos)} eventos pendientes reproducidos")
+
+
+auditoria_sink = AuditoriaSink()
+
+
+def registrar_auditoria(payload):
+    """Punto único de escritura de ``auditoria_eventos``.
+
+    Con ``AUDITORIA_WRITE_BEHIND=0`` inserta en el momento (y lanza si falla).
+    """
+    if not AUDITORIA_WRITE_BEHIND:
+        supabase.table(TABLA).insert(payload).execute()
+        return True
+    return auditoria_sink.registrar(payload)
+
+
+def estado_auditoria():
+    if not AUDITORIA_WRITE_BEHIND:
+        return {"write_behind": False}
+    return auditoria_sink.estado()
+
+
+@atexit.register
+def _vaciar_al_salir():
+    if AUDITORIA_WRITE_BEHIND:
+        auditoria_sink.flush(timeout=3.0)
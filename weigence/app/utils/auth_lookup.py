@@ -0,0 +1,118 @@
+"""
+Búsqueda de usuarios para el login y la recuperación de contraseña.
+
+En vez de traer toda la tabla ``usuarios`` y recorrerla, se consulta por
+RUT/correo/nombre con un único filtro ``or`` (ver
+``migrations/usuarios_indices_login.sql``). Dos cachés negativos de vida corta
+absorben las ráfagas de fuerza bruta:
+
+- identificadores inexistentes: no vuelven a consultar Supabase;
+- combinaciones usuario + contraseña ya rechazadas: no vuelven a pasar por
+  bcrypt. La clave incluye el hash almacenado, así que un cambio de
+  contraseña la invalida sola.
+"""
+from collections import OrderedDict
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from api.conexion_supabase import supabase
+
+_NEGATIVO_TTL = float(os.getenv("LOGIN_NEGATIVE_CACHE_SECONDS", "30"))
+_MAX_ENTRADAS = 10000
+
+# Clave por proceso: los digests en memoria no sirven fuera de este proceso
+_CLAVE_PROCESO = os.urandom(32)
+
+COLUMNAS_LOGIN = ("rut_usuario", "correo", "nombre")
+
+
+class CacheNegativo:
+    """Conjunto con vencimiento por entrada y tamaño acotado."""
+
+    def __init__(self, ttl=_NEGATIVO_TTL, max_entradas=_MAX_ENTRADAS):
+        self._ttl = float(ttl)
+        self._max = int(max_entradas)
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+
+    def contiene(self, clave):
+        with self._lock:
+            vence = self._entradas.get(clave)
+            if vence is None:
+                return False
+            if vence < time.monotonic():
+                del self._entradas[clave]
+                return False
+            return True
+
+    def agregar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+            self._entradas[clave] = time.monotonic() + self._ttl
+            while len(self._entradas) > self._max:
+                self._entradas.popitem(last=False)
+
+    def olvidar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+usuarios_inexistentes = CacheNegativo()
+intentos_fallidos = CacheNegativo()
+
+
+def _literal(valor):
+    # Valor entre comillas para el filtro or de PostgREST (admite comas, puntos y paréntesis)
+    return '"' + valor.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def buscar_usuario(identificador, columnas=COLUMNAS_LOGIN):
+    """
+    Usuario cuyo RUT, correo o nombre (en ese orden de prioridad) es
+    ``identificador``, o None. Usa una sola consulta filtrada.
+    """
+    if not identificador:
+        return None
+    clave = (tuple(columnas), identificador)
+    if usuarios_inexistentes.contiene(clave):
+        return None
+
+    filtro = ",".join(f"{columna}.eq.{_literal(identificador)}" for columna in columnas)
+    filas = supabase.table("usuarios").select("*").or_(filtro).limit(5).execute().data or []
+    for columna in columnas:
+        for fila in filas:
+            if fila.get(columna) == identificador:
+                return fila
+
+    usuarios_inexistentes.agregar(clave)
+    return None
+
+
+def olvidar_usuario(*identificadores):
+    """Quita identificadores del caché negativo (p. ej. al crear un usuario)."""
+    for identificador in identificadores:
+        if not identificador:
+            continue
+        for columnas in (COLUMNAS_LOGIN, ("correo",)):
+            usuarios_inexistentes.olvidar((columnas, identificador))
+
+
+def _clave_intento(usuario, password, password_hash):
+    mensaje = "\0".join([str(usuario.get("rut_usuario")), password_hash or "", password])
+    return hmac.new(_CLAVE_PROCESO, mensaje.encode("utf-8"), hashlib.sha256).digest()
+
+
+def intento_rechazado(usuario, password, password_hash):
+    """True si esta misma contraseña ya fue rechazada hace poco para este usuario."""
+    return intentos_fallidos.contiene(_clave_intento(usuario, password, password_hash))
+
+
+def registrar_rechazo(usuario, password, password_hash):
+    intentos_fallidos.agregar(_clave_intento(usuario, password, password_hash))
@@ -4,7 +4,7 @@ Permite registrar errores de Python en la tabla auditoria_eventos
 """
 from datetime import datetime
 from flask import session
-from api.conexion_supabase import supabase
+from app.utils.auditoria_sink import registrar_auditoria
 import logging
 import traceback
 
@@ -63,7 +63,7 @@ def registrar_error_auditoria(
             "detalle": f"[{modulo}] {mensaje}. {detalle_completo}".strip()
         }
         
-        supabase.table("auditoria_eventos").insert(payload).execute()
+        registrado = registrar_auditoria(payload)
         
         # Log adicional en consola del servidor
         log_msg = f"[AUDITORIA-ERROR] [{modulo}] {mensaje}"
@@ -74,7 +74,7 @@ def registrar_error_auditoria(
         else:
             logger.error(log_msg)
         
-        return True
+        return registrado
         
     except Exception as e:
         # Error al registrar en auditoría, solo log local
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
-from flask import session
-from api.conexion_supabase import supabase
+from flask import has_request_context, session
+from app.utils.auditoria_sink import registrar_auditoria
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,16 +8,21 @@ logger = logging.getLogger(__name__)
 def registrar_evento_humano(accion: str, detalle: str = ""):
     """
     Registra eventos generados por usuarios (login, logout, navegación, exportación, acciones manuales, etc.).
-    Guarda en la tabla auditoria_eventos de Supabase.
+    Guarda en la tabla auditoria_eventos de Supabase mediante la cola de
+    escritura diferida (no espera el INSERT).
     """
     try:
-        usuario = (
-            session.get("usuario_nombre") 
-            or session.get("usuario_id") 
-            or "desconocido"
-        )
+        # Fuera de un request (hilos en segundo plano) el autor es el sistema
+        if not has_request_context():
+            usuario = "sistema"
+        else:
+            usuario = (
+                session.get("usuario_nombre") 
+                or session.get("usuario_id") 
+                or "desconocido"
+            )
         
-        # Insertar en la tabla auditoria_eventos
+        # Encolar para auditoria_eventos
         payload = {
             "fecha": datetime.now(timezone.utc).isoformat(),
             "usuario": usuario,
@@ -25,10 +30,10 @@ def registrar_evento_humano(accion: str, detalle: str = ""):
             "detalle": detalle or accion
         }
         
-        resultado = supabase.table("auditoria_eventos").insert(payload).execute()
+        registrado = registrar_auditoria(payload)
         
         logger.info(f"[AUDITORIA] ✓ Evento registrado: {accion} - {detalle} (Usuario: {usuario})")
-        return True
+        return registrado
 
     except Exception as e:
         logger.error(f"[AUDITORIA] ✗ Error registrando evento humano: {e}", exc_info=True)
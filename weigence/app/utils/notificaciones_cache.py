@@ -0,0 +1,103 @@
+"""
+Caché en memoria de las notificaciones del header.
+
+Un hilo en segundo plano reconstruye la lista cada ``NOTIFICACIONES_REFRESH_SECONDS``
+o apenas alguien la invalida (escrituras en ``alertas``). Los renders de página
+solo leen la última versión ya ordenada y agrupada, sin tocar la base de datos.
+"""
+from datetime import date
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_REFRESH_SECONDS = float(os.getenv("NOTIFICACIONES_REFRESH_SECONDS", "60"))
+
+
+class NotificacionesCache:
+    """Lista de notificaciones mantenida por un refresco en segundo plano.
+
+    ``builder`` devuelve la lista de alertas ya ordenada y formateada, y
+    ``agrupar`` la convierte en los grupos por fecha del panel. Los grupos se
+    recalculan al leer solo si cambió el día ("Hoy"/"Ayer" dependen de la fecha).
+    """
+
+    def __init__(self, builder, agrupar, refresh_seconds=_REFRESH_SECONDS):
+        self._builder = builder
+        self._agrupar = agrupar
+        self._refresh_seconds = max(1.0, float(refresh_seconds))
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._cambios = threading.Event()
+        self._hilo = None
+        self._alertas = None
+        self._grupos = {}
+        self._dia = None
+        self._actualizado_en = None
+        self._errores = 0
+
+    def obtener(self):
+        """Devuelve ``(alertas, grupos)`` desde memoria."""
+        if self._alertas is None:
+            # Primer acceso del proceso: construir una vez de forma síncrona
+            self.refrescar()
+        self._asegurar_hilo()
+
+        with self._lock:
+            alertas = self._alertas or []
+            if self._dia != date.today():
+                self._grupos = self._agrupar(alertas)
+                self._dia = date.today()
+            return list(alertas), {k: list(v) for k, v in self._grupos.items()}
+
+    def invalidar(self):
+        """Pide un refresco inmediato; los lectores siguen viendo la versión anterior."""
+        self._cambios.set()
+
+    def refrescar(self):
+        """Reconstruye la lista; las llamadas concurrentes esperan a la que está en curso."""
+        with self._build_lock:
+            self._cambios.clear()
+            try:
+                alertas = self._builder()
+            except Exception as e:
+                self._errores += 1
+                logger.error(f"[NOTIFICACIONES] Error al refrescar: {e}")
+                with self._lock:
+                    if self._alertas is None:
+                        self._alertas = []
+                return False
+
+            grupos = self._agrupar(alertas)
+            with self._lock:
+                self._alertas = alertas
+                self._grupos = grupos
+                self._dia = date.today()
+                self._actualizado_en = time.time()
+            return True
+
+    def estado(self):
+        with self._lock:
+            return {
+                "total": len(self._alertas or []),
+                "actualizado_en": self._actualizado_en,
+                "refresh_seconds": self._refresh_seconds,
+                "errores": self._errores,
+                "hilo_activo": bool(self._hilo and self._hilo.is_alive()),
+            }
+
+    def _asegurar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="notificaciones-refresh", daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            self._cambios.wait(timeout=self._refresh_seconds)
+            self.refrescar()
@@ -0,0 +1,61 @@
+"""
+Integración Flask del perfilador de consultas Supabase.
+
+Abre un perfil por request, agrega el header ``Server-Timing`` con el tiempo
+y la cantidad de consultas, y avisa en el log cuando una ruta supera el
+presupuesto de llamadas configurado (``QUERY_BUDGET_PER_REQUEST``).
+"""
+import logging
+
+from flask import g, request
+
+from api.query_profiler import finish_profile, start_profile
+
+logger = logging.getLogger(__name__)
+
+# Rutas que no consultan la base de datos
+_IGNORED_PREFIXES = ('/static', '/socket.io', '/favicon.ico')
+
+
+def _server_timing(profile, max_tables=5):
+    entradas = [f'db;desc="{profile.count} queries";dur={profile.total_ms:.1f}']
+    tablas = sorted(profile.by_table().items(), key=lambda item: item[1]["ms"], reverse=True)
+    for tabla, datos in tablas[:max_tables]:
+        nombre = "db-" + "".join(c if c.isalnum() or c in "-_" else "_" for c in tabla)
+        entradas.append(f'{nombre};desc="{int(datos["count"])}x";dur={datos["ms"]:.1f}')
+    return ", ".join(entradas)
+
+
+def init_query_profiler(app):
+    """Registra los hooks before/after request del perfilador."""
+    if not app.config.get("QUERY_PROFILER_ENABLED", True):
+        return
+
+    budget = int(app.config.get("QUERY_BUDGET_PER_REQUEST", 0) or 0)
+
+    @app.before_request
+    def _abrir_perfil_consultas():
+        if request.path.startswith(_IGNORED_PREFIXES):
+            return None
+        g._query_profile_token = start_profile(request.url_rule.rule if request.url_rule else request.path, request.method)
+        return None
+
+    @app.after_request
+    def _cerrar_perfil_consultas(response):
+        token = g.pop("_query_profile_token", None)
+        if token is None:
+            return response
+        profile = finish_profile(token)
+        if profile is None:
+            return response
+
+        response.headers["Server-Timing"] = _server_timing(profile)
+        if budget and profile.count > budget:
+            tablas = ", ".join(
+                f"{tabla}={int(datos['count'])}" for tabla, datos in profile.by_table().items()
+            )
+            logger.warning(
+                f"[QUERY-BUDGET] {request.method} {profile.route} hizo {profile.count} consultas "
+                f"(presupuesto {budget}, {profile.total_ms:.0f} ms): {tablas}"
+            )
+        return response
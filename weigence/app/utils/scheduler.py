@@ -0,0 +1,178 @@
+"""
+Programador de tareas en segundo plano (generación de alertas, etc.).
+
+Un único hilo despacha las tareas registradas según su intervalo, con un
+jitter aleatorio para que varios procesos no consulten Supabase al mismo
+tiempo. Cada ejecución corre en su propio hilo; si una tarea sigue corriendo
+cuando vuelve a tocarle, la nueva ejecución se descarta (coalescing).
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """Tarea registrada y estadísticas de sus ejecuciones."""
+
+    def __init__(self, nombre, funcion, intervalo, jitter, retraso_inicial):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.intervalo = float(intervalo)
+        self.jitter = max(0.0, float(jitter))
+        self.retraso_inicial = float(retraso_inicial)
+        self.corriendo = False
+        self.repetir = False
+        self.ejecuciones = 0
+        self.fallos = 0
+        self.descartadas = 0
+        self.ultimo_inicio = None
+        self.ultima_duracion_ms = None
+        self.ultimas_filas = None
+        self.ultimo_estado = None
+        self.ultimo_error = None
+        self.proxima = None
+
+    def siguiente(self, desde):
+        """Próximo instante (monotónico) con jitter de ±``jitter`` * intervalo."""
+        variacion = self.intervalo * self.jitter
+        return desde + self.intervalo + random.uniform(-variacion, variacion)
+
+    def to_dict(self):
+        return {
+            "nombre": self.nombre,
+            "intervalo_segundos": self.intervalo,
+            "corriendo": self.corriendo,
+            "ejecuciones": self.ejecuciones,
+            "fallos": self.fallos,
+            "descartadas": self.descartadas,
+            "ultimo_inicio": self.ultimo_inicio,
+            "ultima_duracion_ms": self.ultima_duracion_ms,
+            "ultimas_filas": self.ultimas_filas,
+            "ultimo_estado": self.ultimo_estado,
+            "ultimo_error": self.ultimo_error,
+            "proxima_en_segundos": (
+                round(max(0.0, self.proxima - time.monotonic()), 1) if self.proxima is not None else None
+            ),
+        }
+
+
+class JobScheduler:
+    """Registro de tareas periódicas con un hilo despachador.
+
+    Las funciones registradas devuelven la cantidad de filas afectadas (o
+    ``None``) y lanzan excepción si fallan; el fallo queda en ``status()`` y la
+    tarea se reintenta en su próximo turno, sin bloquear a nadie.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._cola = []
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    def register(self, nombre, funcion, intervalo, *, jitter=0.1, retraso_inicial=5.0):
+        """Registra (o reemplaza) una tarea periódica."""
+        with self._lock:
+            job = _Job(nombre, funcion, intervalo, jitter, retraso_inicial)
+            self._jobs[nombre] = job
+            if self._hilo is not None:
+                self._programar(job, time.monotonic() + job.retraso_inicial)
+        self._despertar.set()
+        return job
+
+    def start(self):
+        """Inicia el hilo despachador (idempotente)."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return False
+            ahora = time.monotonic()
+            self._cola = []
+            for job in self._jobs.values():
+                self._programar(job, ahora + job.retraso_inicial + random.uniform(0, job.intervalo * job.jitter))
+            self._hilo = threading.Thread(target=self._bucle, name="weigence-scheduler", daemon=True)
+            self._hilo.start()
+        logger.info(f"[SCHEDULER] Iniciado con {len(self._jobs)} tareas")
+        return True
+
+    def trigger(self, nombre):
+        """Pide una ejecución inmediata; si ya está corriendo, se repite una vez al terminar."""
+        with self._lock:
+            job = self._jobs.get(nombre)
+            if job is None:
+                raise KeyError(nombre)
+            if job.corriendo:
+                job.repetir = True
+                return False
+            self._lanzar(job)
+            return True
+
+    def status(self):
+        with self._lock:
+            return {
+                "activo": bool(self._hilo and self._hilo.is_alive()),
+                "tareas": [job.to_dict() for job in self._jobs.values()],
+            }
+
+    # ------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------
+    def _programar(self, job, cuando):
+        job.proxima = cuando
+        heapq.heappush(self._cola, (cuando, job.nombre))
+
+    def _bucle(self):
+        while True:
+            self._despertar.clear()
+            with self._lock:
+                ahora = time.monotonic()
+                while self._cola and self._cola[0][0] <= ahora:
+                    cuando, nombre = heapq.heappop(self._cola)
+                    job = self._jobs.get(nombre)
+                    # Entradas obsoletas (tarea reemplazada o reprogramada)
+                    if job is None or job.proxima != cuando:
+                        continue
+                    if job.corriendo:
+                        job.descartadas += 1
+                    else:
+                        self._lanzar(job)
+                    self._programar(job, job.siguiente(ahora))
+                espera = self._cola[0][0] - ahora if self._cola else None
+            self._despertar.wait(timeout=espera)
+
+    def _lanzar(self, job):
+        # Se llama con self._lock tomado
+        job.corriendo = True
+        threading.Thread(target=self._ejecutar, args=(job,), name=f"job-{job.nombre}", daemon=True).start()
+
+    def _ejecutar(self, job):
+        while True:
+            inicio = time.perf_counter()
+            job.ultimo_inicio = datetime.now().isoformat()
+            try:
+                filas = job.funcion()
+                estado, error = "ok", None
+            except Exception as e:
+                filas, estado, error = None, "error", str(e)
+                logger.error(f"[SCHEDULER] Tarea {job.nombre} falló: {e}")
+
+            with self._lock:
+                job.ejecuciones += 1
+                if estado == "error":
+                    job.fallos += 1
+                job.ultima_duracion_ms = round((time.perf_counter() - inicio) * 1000.0, 1)
+                job.ultimas_filas = filas if isinstance(filas, int) else None
+                job.ultimo_estado = estado
+                job.ultimo_error = error
+                if not job.repetir:
+                    job.corriendo = False
+                    return
+                job.repetir = False
+
+
+scheduler = JobScheduler()
@@ -2,9 +2,41 @@
 Utilidades de seguridad para hash de contraseñas y validación
 """
 import bcrypt
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
 from typing import Optional
 
+# Costo de bcrypt para hashes nuevos; los hashes con otro costo se rehacen al iniciar sesión
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Verificaciones simultáneas (cada una ocupa un núcleo ~250 ms con costo 12)
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+# Verificaciones en cola como máximo antes de rechazar con "servidor ocupado"
+BCRYPT_MAX_PENDIENTES = int(os.getenv("BCRYPT_MAX_PENDIENTES", "16"))
+BCRYPT_TIMEOUT_SECONDS = float(os.getenv("BCRYPT_TIMEOUT_SECONDS", "10"))
+
+
+def _crear_verificador():
+    # Con gevent (wsgi.py) los hilos parchados son greenlets y bcrypt bloquearía
+    # a todos los clientes del worker; el pool de gevent usa hilos nativos.
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("threading"):
+            from gevent.threadpool import ThreadPoolExecutor as PoolGevent
+            return PoolGevent(max_workers=max(1, BCRYPT_WORKERS))
+    except ImportError:
+        pass
+    return ThreadPoolExecutor(max_workers=max(1, BCRYPT_WORKERS), thread_name_prefix="bcrypt")
+
+
+_verificador = _crear_verificador()
+_cupos = threading.BoundedSemaphore(max(1, BCRYPT_MAX_PENDIENTES))
+
+
+class VerificacionSaturada(Exception):
+    """No hay cupo en el pool de verificación de contraseñas."""
+
 
 def hash_password(password: str) -> str:
     """
@@ -20,7 +52,7 @@ def hash_password(password: str) -> str:
         raise ValueError("La contraseña no puede estar vacía")
     
     # Generar salt y hash
-    salt = bcrypt.gensalt(rounds=12)
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -46,6 +78,51 @@ def verify_password(password: str, hashed: str) -> bool:
         return False
 
 
+def es_hash_bcrypt(valor: Optional[str]) -> bool:
+    return bool(valor) and (valor.startswith('$2b$') or valor.startswith('$2a$'))
+
+
+def necesita_rehash(hashed: str) -> bool:
+    """
+    Indica si un hash debe regenerarse: no es bcrypt (texto plano heredado)
+    o fue creado con un costo distinto a ``BCRYPT_ROUNDS``.
+    """
+    if not es_hash_bcrypt(hashed):
+        return True
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def verify_password_pool(password: str, hashed: str) -> bool:
+    """
+    Igual que ``verify_password`` pero en el pool acotado de verificación, para
+    que una ráfaga de logins no ocupe todos los hilos ni todos los núcleos.
+
+    Raises:
+        VerificacionSaturada: si ya hay ``BCRYPT_MAX_PENDIENTES`` verificaciones
+        en curso o la verificación no termina dentro del timeout.
+    """
+    if not _cupos.acquire(blocking=False):
+        raise VerificacionSaturada("Demasiadas verificaciones de contraseña en curso")
+    try:
+        futuro = _verificador.submit(verify_password, password, hashed)
+    except Exception:
+        _cupos.release()
+        raise
+    futuro.add_done_callback(lambda _: _cupos.release())
+    try:
+        return futuro.result(timeout=BCRYPT_TIMEOUT_SECONDS)
+    except FuturoTimeout:
+        raise VerificacionSaturada("La verificación de contraseña tardó demasiado")
+
+
+def en_segundo_plano(funcion, *args):
+    """Ejecuta ``funcion`` en el pool de bcrypt sin esperar el resultado (p. ej. rehash)."""
+    return _verificador.submit(funcion, *args)
+
+
 def validar_fortaleza_password(password: str) -> tuple[bool, Optional[str]]:
     """
     Valida que la contraseña cumpla requisitos mínimos de seguridad
@@ -0,0 +1,16 @@
+-- Migración: Índice para las consultas de alertas abiertas del AlertStore
+-- Fecha: 2026-10-18
+-- Descripción: El AlertStore recarga las alertas 'pendiente'/'activo' y confirma
+-- duplicados con un SELECT ... WHERE titulo IN (...) AND estado IN (...).
+-- Este índice parcial mantiene ambas consultas rápidas aunque crezca el histórico.
+
+CREATE INDEX IF NOT EXISTS idx_alertas_abiertas_titulo
+    ON alertas (titulo, idproducto, id_estante)
+    WHERE estado IN ('pendiente', 'activo');
+
+-- Verificar el uso del índice
+EXPLAIN
+SELECT id, titulo, idproducto, id_estante, estado
+FROM alertas
+WHERE titulo IN ('Estante 1 lleno', 'Estante 2 lleno')
+  AND estado IN ('pendiente', 'activo');
@@ -0,0 +1,16 @@
+-- Migración: Índices para la búsqueda de usuarios en el login
+-- Fecha: 2026-10-18
+-- Descripción: El login busca al usuario con un único filtro
+-- rut_usuario = X OR correo = X OR nombre = X, y la recuperación de contraseña
+-- por correo. Con estos índices la consulta no recorre toda la tabla.
+
+CREATE INDEX IF NOT EXISTS idx_usuarios_correo ON usuarios (correo);
+CREATE INDEX IF NOT EXISTS idx_usuarios_nombre ON usuarios (nombre);
+-- rut_usuario es la clave primaria y ya está indexada
+
+-- Verificar el uso de los índices (BitmapOr sobre los tres)
+EXPLAIN
+SELECT *
+FROM usuarios
+WHERE rut_usuario = '12345678-9' OR correo = '12345678-9' OR nombre = '12345678-9'
+LIMIT 5;
@@ -0,0 +1,145 @@
+-- Migración: Registro de ventas en una sola transacción
+-- Fecha: 2026-10-18
+-- Descripción: registrar_venta(rut, items, fecha) crea la venta, valida y descuenta
+-- el stock, inserta los detalles y concilia los retiros pendientes de todo el
+-- carrito en una sola llamada RPC (app/data/venta_service.py).
+-- Los productos se bloquean con FOR UPDATE en orden de idproducto: dos ventas
+-- simultáneas del mismo producto se serializan y no pueden sobrevender.
+--
+-- items: [{"idproducto": 1, "cantidad": 2, "precio_unitario": 1990}, ...]
+-- Errores (SQLSTATE P0001, el detalle va en DETAIL como JSON):
+--   'venta_vacia', 'producto_inexistente', 'stock_insuficiente'
+
+CREATE OR REPLACE FUNCTION registrar_venta(
+    p_rut_usuario TEXT,
+    p_items JSONB,
+    p_fecha TIMESTAMP DEFAULT LOCALTIMESTAMP
+) RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_idventa BIGINT;
+    v_total NUMERIC;
+    v_faltante RECORD;
+    v_producto RECORD;
+    v_emparejados INTEGER;
+    v_total_emparejados INTEGER := 0;
+    v_pendientes INTEGER := 0;
+BEGIN
+    IF p_items IS NULL OR jsonb_array_length(p_items) = 0 THEN
+        RAISE EXCEPTION 'venta_vacia';
+    END IF;
+
+    -- Líneas del carrito agrupadas por producto (un producto puede venir repetido)
+    DROP TABLE IF EXISTS _venta_items;
+    CREATE TEMP TABLE _venta_items ON COMMIT DROP AS
+    SELECT (item->>'idproducto')::BIGINT AS idproducto,
+           SUM((item->>'cantidad')::INTEGER) AS cantidad
+    FROM jsonb_array_elements(p_items) AS item
+    GROUP BY 1;
+
+    -- 1. Bloquear los productos del carrito (orden fijo para evitar deadlocks)
+    PERFORM 1 FROM productos p
+    WHERE p.idproducto IN (SELECT idproducto FROM _venta_items)
+    ORDER BY p.idproducto
+    FOR UPDATE;
+
+    SELECT i.idproducto INTO v_faltante
+    FROM _venta_items i
+    LEFT JOIN productos p ON p.idproducto = i.idproducto
+    WHERE p.idproducto IS NULL
+    LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'producto_inexistente'
+            USING DETAIL = jsonb_build_object('idproducto', v_faltante.idproducto)::TEXT;
+    END IF;
+
+    -- 2. Validar stock de todo el carrito antes de escribir nada
+    SELECT i.idproducto, COALESCE(p.stock, 0) AS disponible, i.cantidad AS solicitado INTO v_faltante
+    FROM _venta_items i
+    JOIN productos p ON p.idproducto = i.idproducto
+    WHERE COALESCE(p.stock, 0) < i.cantidad
+    ORDER BY i.idproducto
+    LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'stock_insuficiente'
+            USING DETAIL = jsonb_build_object(
+                'idproducto', v_faltante.idproducto,
+                'disponible', v_faltante.disponible,
+                'solicitado', v_faltante.solicitado
+            )::TEXT;
+    END IF;
+
+    -- 3. Venta y detalles
+    SELECT SUM((item->>'cantidad')::INTEGER * (item->>'precio_unitario')::NUMERIC) INTO v_total
+    FROM jsonb_array_elements(p_items) AS item;
+
+    INSERT INTO ventas (rut_usuario, fecha_venta, total)
+    VALUES (p_rut_usuario, p_fecha, v_total)
+    RETURNING idventa INTO v_idventa;
+
+    INSERT INTO detalle_ventas (idventa, idproducto, cantidad, precio_unitario)
+    SELECT v_idventa,
+           (item->>'idproducto')::BIGINT,
+           (item->>'cantidad')::INTEGER,
+           (item->>'precio_unitario')::NUMERIC
+    FROM jsonb_array_elements(p_items) AS item;
+
+    -- 4. Descontar stock
+    UPDATE productos p
+    SET stock = p.stock - i.cantidad,
+        fecha_modificacion = p_fecha,
+        modificado_por = p_rut_usuario
+    FROM _venta_items i
+    WHERE p.idproducto = i.idproducto;
+
+    -- 5. Conciliar con retiros no validados en ±5 minutos; si no hay, dejar la venta pendiente de retiro
+    FOR v_producto IN
+        SELECT i.idproducto, i.cantidad, p.id_estante, COALESCE(p.peso, 0) / 1000.0 AS peso_kg
+        FROM _venta_items i
+        JOIN productos p ON p.idproducto = i.idproducto
+        ORDER BY i.idproducto
+    LOOP
+        UPDATE movimientos_inventario
+        SET es_venta_validada = TRUE,
+            motivo_sospecha = NULL,
+            observacion = 'Emparejado con venta #' || v_idventa
+        WHERE idproducto = v_producto.idproducto
+          AND tipo_evento = 'Retirar'
+          AND es_venta_validada = FALSE
+          AND "timestamp" BETWEEN p_fecha - INTERVAL '5 minutes' AND p_fecha + INTERVAL '5 minutes';
+        GET DIAGNOSTICS v_emparejados = ROW_COUNT;
+
+        IF v_emparejados > 0 THEN
+            v_total_emparejados := v_total_emparejados + v_emparejados;
+        ELSE
+            INSERT INTO movimientos_inventario (
+                tipo_evento, idproducto, id_estante, cantidad, peso_por_unidad,
+                peso_total, rut_usuario, "timestamp", observacion
+            ) VALUES (
+                'VentaPendiente', v_producto.idproducto, v_producto.id_estante, v_producto.cantidad,
+                v_producto.peso_kg, v_producto.cantidad * v_producto.peso_kg, p_rut_usuario, p_fecha,
+                'Venta #' || v_idventa || ' pendiente de retiro'
+            );
+            v_pendientes := v_pendientes + 1;
+        END IF;
+    END LOOP;
+
+    RETURN jsonb_build_object(
+        'idventa', v_idventa,
+        'total', v_total,
+        'retiros_emparejados', v_total_emparejados,
+        'ventas_pendientes', v_pendientes
+    );
+END;
+$$;
+
+-- Índice para la conciliación de retiros por producto y ventana de tiempo
+CREATE INDEX IF NOT EXISTS idx_movimientos_retiros_pendientes
+    ON movimientos_inventario (idproducto, "timestamp")
+    WHERE tipo_evento = 'Retirar' AND es_venta_validada = FALSE;
+
+-- Verificar (reemplazar rut e idproducto por valores reales; hace ROLLBACK)
+-- BEGIN;
+-- SELECT registrar_venta('11111111-1', '[{"idproducto": 1, "cantidad": 1, "precio_unitario": 1000}]');
+-- ROLLBACK;
@@ -1,6 +1,11 @@
 """
 Script para entrenar el modelo de detección de anomalías con datos históricos.
-Ejecutar: python scripts/entrenar_ml_anomalies.py
+Ejecutar: python scripts/entrenar_ml_anomalies.py [--dias 7] [--backfill] [--programado]
+
+Lee los snapshots guardados en data/snapshots/; con --backfill (o si no hay
+suficientes) reconstruye primero snapshots horarios desde Supabase.
+Con --programado ejecuta una vez el reentrenamiento del scheduler (ventana
+deslizante, evaluación en holdout y publicación solo si el candidato pasa).
 """
 import sys
 from pathlib import Path
@@ -10,27 +15,44 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from datetime import datetime, timedelta
 from app.ia.ia_snapshots import snapshot_builder
-from app.ia.ia_ml_anomalies import get_detector
+from app.ia.ia_snapshot_store import snapshot_store
+from app.ia.ia_ml_anomalies import SnapshotBatch, get_detector
+from app.ia.ia_ml_retrain import model_retrainer
 
 
-def entrenar_modelo(dias_historicos: int = 7):
+def backfill_store(dias_historicos: int, paso_horas: int = 1) -> int:
     """
-    Entrena el modelo con snapshots históricos simulados.
+    Reconstruye snapshots horarios de los últimos días y agrega al store los que falten.
+    
+    Las horas se alinean a :00 para que repetir el backfill genere los mismos
+    instantes y no duplique snapshots ya guardados.
+    """
+    hasta = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    desde = hasta - timedelta(days=dias_historicos)
+    print(f"🗂️  Reconstruyendo snapshots cada {paso_horas}h desde {desde:%Y-%m-%d %H:%M}...")
+    historicos = snapshot_builder.build_historico(desde, hasta, paso_horas=paso_horas)
+    guardados = snapshot_store.append_missing(historicos, contexto="backfill")
+    print(f"💾 {guardados} snapshots nuevos agregados a {snapshot_store.path} ({len(historicos) - guardados} ya existían)")
+    return guardados
+
+
+def entrenar_modelo(dias_historicos: int = 7, backfill: bool = False):
+    """
+    Entrena el modelo con los snapshots históricos del store local.
     
     Args:
-        dias_historicos: Número de días de histórico a simular
+        dias_historicos: Número de días de histórico a usar
+        backfill: Reconstruir primero el histórico desde Supabase
     """
     print(f"🤖 Entrenando modelo de ML con {dias_historicos} días de histórico...")
     
-    # Generar snapshots históricos (uno por día)
-    snapshots = []
-    for i in range(dias_historicos):
-        print(f"📊 Generando snapshot día -{i}...")
-        try:
-            snapshot = snapshot_builder.build(contexto="auditoria")
-            snapshots.append(snapshot)
-        except Exception as e:
-            print(f"⚠️  Error generando snapshot: {e}")
+    desde = datetime.utcnow() - timedelta(days=dias_historicos)
+    registros = snapshot_store.read(desde=desde)
+    if backfill or len(registros) < 5:
+        backfill_store(dias_historicos)
+        registros = snapshot_store.read(desde=desde)
+    
+    snapshots = SnapshotBatch.from_records(registros)
     
     if len(snapshots) < 5:
         print(f"❌ Snapshots insuficientes ({len(snapshots)}). Mínimo: 5")
@@ -41,7 +63,7 @@ def entrenar_modelo(dias_historicos: int = 7):
         print("   - alertas (últimas 48h)")
         return False
     
-    print(f"\n✅ {len(snapshots)} snapshots generados correctamente")
+    print(f"\n✅ {len(snapshots)} snapshots leídos desde {snapshot_store.path}")
     
     # Entrenar modelo
     detector = get_detector()
@@ -82,6 +104,32 @@ def entrenar_modelo(dias_historicos: int = 7):
         return False
 
 
+def reentrenar_programado():
+    """Corre una vuelta del reentrenamiento programado y muestra su resultado."""
+    print("🤖 Reentrenamiento programado (ventana deslizante + holdout)...")
+    filas = model_retrainer.run()
+    ultima = model_retrainer.status()["ultima"]
+
+    print(f"\n📋 Estado: {ultima['estado'].upper()} ({ultima['duracion_ms']:.0f} ms)")
+    print(f"📦 Entrenamiento: {filas} snapshots | Holdout: {ultima['muestras_holdout']}")
+    if ultima['modo']:
+        print(f"🌲 Modo: {ultima['modo']} sobre {ultima['version_base'] or '(sin modelo previo)'}")
+    for nombre in ('actual', 'candidato'):
+        metricas = ultima[nombre]
+        if metricas:
+            recall = metricas['recall_criticas']
+            print(
+                f"   • {nombre}: {metricas['arboles']} árboles, "
+                f"{metricas['tasa_anomalias']:.1%} anómalos, "
+                f"recall críticas {'-' if recall is None else f'{recall:.1%}'}"
+            )
+    for motivo in ultima['motivos']:
+        print(f"   ⚠️  {motivo}")
+    if ultima['version_publicada']:
+        print(f"\n🎉 Publicada la versión {ultima['version_publicada']}")
+    return ultima['estado'] in ('publicado', 'rechazado', 'omitido')
+
+
 if __name__ == '__main__':
     import argparse
     
@@ -93,7 +141,22 @@ if __name__ == '__main__':
         help='Número de días de histórico a usar (default: 7)'
     )
     
+    parser.add_argument(
+        '--backfill',
+        action='store_true',
+        help='Reconstruir snapshots horarios desde Supabase antes de entrenar'
+    )
+    
+    parser.add_argument(
+        '--programado',
+        action='store_true',
+        help='Ejecutar una vez el reentrenamiento programado en lugar del entrenamiento completo'
+    )
+    
     args = parser.parse_args()
     
-    success = entrenar_modelo(dias_historicos=args.dias)
+    if args.programado:
+        success = reentrenar_programado()
+    else:
+        success = entrenar_modelo(dias_historicos=args.dias, backfill=args.backfill)
     sys.exit(0 if success else 1)
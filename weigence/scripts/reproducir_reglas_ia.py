@@ -0,0 +1,82 @@
+"""
+Reproduce las reglas del motor IA sobre el histórico de snapshots.
+Ejecutar: python scripts/reproducir_reglas_ia.py [--config nuevo.json] [--dias 30] [--contexto auditoria]
+
+Evalúa todos los perfiles sobre los snapshots de data/snapshots/ con la
+configuración actual (app/ia/config/ia_engine.json) y, si se pasa --config,
+con la candidata: muestra cuántos snapshots dispararía cada regla y en
+cuántos cambia la regla ganadora o la severidad antes de publicar el JSON.
+"""
+import sys
+from pathlib import Path
+
+# Añadir el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.ia.ia_engine import IAEngine
+from app.ia.ia_rule_plan import metric_matrix_from_records
+from app.ia.ia_snapshot_store import snapshot_store
+
+
+def _claves(engine, resultado, perfil):
+    """Clave de la regla ganadora por snapshot."""
+    claves = np.array([regla.key for regla in engine.profiles[perfil].rules] + ["(sin regla)"], dtype=object)
+    return claves[resultado.best]  # best == -1 toma la última posición
+
+
+def reproducir(config=None, dias=30, contexto=None):
+    desde = datetime.utcnow() - timedelta(days=dias)
+    registros = snapshot_store.read(desde=desde, contexto=contexto)
+    if len(registros) == 0:
+        print(f"❌ No hay snapshots en {snapshot_store.path} para los últimos {dias} días")
+        return False
+
+    matriz = metric_matrix_from_records(registros)
+    actual = IAEngine()
+    candidata = IAEngine(Path(config)) if config else None
+    print(f"📦 {len(matriz)} snapshots desde {desde:%Y-%m-%d %H:%M}\n")
+
+    for perfil in actual.profiles:
+        base = actual.evaluate_batch(matriz, profile=perfil)
+        print(f"{'='*60}\n📋 {perfil}\n{'='*60}")
+        for clave, cantidad in Counter(_claves(actual, base, perfil)).most_common():
+            print(f"   • {clave}: {cantidad}")
+
+        if candidata is None:
+            continue
+        if perfil not in candidata.profiles:
+            print("   ⚠️  El perfil no existe en la configuración candidata")
+            continue
+
+        nuevo = candidata.evaluate_batch(matriz, profile=perfil)
+        print("\n   Con la configuración candidata:")
+        for clave, cantidad in Counter(_claves(candidata, nuevo, perfil)).most_common():
+            print(f"   • {clave}: {cantidad}")
+
+        antes, despues = _claves(actual, base, perfil), _claves(candidata, nuevo, perfil)
+        cambia_regla = antes != despues
+        cambia_severidad = base.severity != nuevo.severity
+        print(f"\n   🔀 Regla ganadora distinta: {int(cambia_regla.sum())}")
+        print(f"   🔀 Severidad distinta: {int(cambia_severidad.sum())}")
+        for (a, b), cantidad in Counter(zip(antes[cambia_regla], despues[cambia_regla])).most_common(5):
+            print(f"      {a} → {b}: {cantidad}")
+        print()
+
+    return True
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reproducir reglas del motor IA sobre snapshots históricos')
+    parser.add_argument('--config', help='ia_engine.json candidato para comparar con el actual')
+    parser.add_argument('--dias', type=int, default=30, help='Días de histórico (default: 30)')
+    parser.add_argument('--contexto', help='Filtrar snapshots por contexto (auditoria, dashboard, ...)')
+
+    args = parser.parse_args()
+    sys.exit(0 if reproducir(args.config, args.dias, args.contexto) else 1)
@@ -0,0 +1,122 @@
+-- =====================================================
+-- SCRIPT DE MIGRACIÓN: RESUMEN DE CONVERSACIONES DEL CHAT
+-- Ejecutar en Supabase SQL Editor
+-- =====================================================
+-- La lista de conversaciones y el contador de no leídos leen un resumen por
+-- conversación (último mensaje) y un contador por participante (no leídos),
+-- mantenidos por triggers. Así cuestan O(conversaciones) en vez de traer
+-- todos los mensajes enviados.
+
+-- 1. Columnas del resumen
+ALTER TABLE chat_conversaciones
+ADD COLUMN IF NOT EXISTS ultimo_mensaje_id BIGINT,
+ADD COLUMN IF NOT EXISTS ultimo_mensaje_timestamp TIMESTAMPTZ,
+ADD COLUMN IF NOT EXISTS ultimo_mensaje_preview TEXT,
+ADD COLUMN IF NOT EXISTS ultimo_mensaje_usuario_id VARCHAR(20);
+
+ALTER TABLE chat_participantes
+ADD COLUMN IF NOT EXISTS no_leidos INTEGER NOT NULL DEFAULT 0;
+
+-- 2. Índices usados por los triggers y la lista de conversaciones
+CREATE INDEX IF NOT EXISTS idx_chat_mensajes_conversacion_id ON chat_mensajes(conversacion_id, id);
+CREATE INDEX IF NOT EXISTS idx_chat_participantes_usuario ON chat_participantes(usuario_id);
+
+-- 3. Nuevo mensaje: actualizar resumen y sumar 1 a los demás participantes
+CREATE OR REPLACE FUNCTION chat_mensaje_insertado() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE chat_conversaciones
+    SET ultimo_mensaje_id = NEW.id,
+        ultimo_mensaje_timestamp = NEW.fecha_envio,
+        ultimo_mensaje_preview = LEFT(NEW.contenido, 200),
+        ultimo_mensaje_usuario_id = NEW.usuario_id
+    WHERE id = NEW.conversacion_id
+      AND (ultimo_mensaje_id IS NULL OR ultimo_mensaje_id < NEW.id);
+
+    UPDATE chat_participantes
+    SET no_leidos = no_leidos + 1
+    WHERE conversacion_id = NEW.conversacion_id
+      AND usuario_id <> NEW.usuario_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_chat_mensaje_insertado ON chat_mensajes;
+CREATE TRIGGER trg_chat_mensaje_insertado
+AFTER INSERT ON chat_mensajes
+FOR EACH ROW EXECUTE FUNCTION chat_mensaje_insertado();
+
+-- 4. Mensaje eliminado: descontar no leídos y, si era el último, recalcular el resumen
+CREATE OR REPLACE FUNCTION chat_mensaje_eliminado() RETURNS TRIGGER AS $$
+DECLARE
+    anterior chat_mensajes%ROWTYPE;
+BEGIN
+    UPDATE chat_participantes
+    SET no_leidos = GREATEST(no_leidos - 1, 0)
+    WHERE conversacion_id = OLD.conversacion_id
+      AND usuario_id <> OLD.usuario_id
+      AND (ultimo_mensaje_leido IS NULL OR ultimo_mensaje_leido < OLD.id);
+
+    IF EXISTS (SELECT 1 FROM chat_conversaciones WHERE id = OLD.conversacion_id AND ultimo_mensaje_id = OLD.id) THEN
+        SELECT * INTO anterior FROM chat_mensajes
+        WHERE conversacion_id = OLD.conversacion_id
+        ORDER BY id DESC LIMIT 1;
+
+        UPDATE chat_conversaciones
+        SET ultimo_mensaje_id = anterior.id,
+            ultimo_mensaje_timestamp = anterior.fecha_envio,
+            ultimo_mensaje_preview = LEFT(anterior.contenido, 200),
+            ultimo_mensaje_usuario_id = anterior.usuario_id
+        WHERE id = OLD.conversacion_id;
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_chat_mensaje_eliminado ON chat_mensajes;
+CREATE TRIGGER trg_chat_mensaje_eliminado
+AFTER DELETE ON chat_mensajes
+FOR EACH ROW EXECUTE FUNCTION chat_mensaje_eliminado();
+
+-- 5. Marcar como leído: recalcular el contador con los mensajes posteriores (usa el índice del paso 2)
+CREATE OR REPLACE FUNCTION chat_participante_leyo() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.no_leidos := (
+        SELECT COUNT(*) FROM chat_mensajes m
+        WHERE m.conversacion_id = NEW.conversacion_id
+          AND m.usuario_id <> NEW.usuario_id
+          AND (NEW.ultimo_mensaje_leido IS NULL OR m.id > NEW.ultimo_mensaje_leido)
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_chat_participante_leyo ON chat_participantes;
+CREATE TRIGGER trg_chat_participante_leyo
+BEFORE UPDATE OF ultimo_mensaje_leido ON chat_participantes
+FOR EACH ROW EXECUTE FUNCTION chat_participante_leyo();
+
+-- 6. Rellenar el resumen para las conversaciones existentes
+UPDATE chat_conversaciones c
+SET ultimo_mensaje_id = m.id,
+    ultimo_mensaje_timestamp = m.fecha_envio,
+    ultimo_mensaje_preview = LEFT(m.contenido, 200),
+    ultimo_mensaje_usuario_id = m.usuario_id
+FROM (
+    SELECT DISTINCT ON (conversacion_id) *
+    FROM chat_mensajes
+    ORDER BY conversacion_id, id DESC
+) m
+WHERE m.conversacion_id = c.id;
+
+UPDATE chat_participantes p
+SET no_leidos = (
+    SELECT COUNT(*) FROM chat_mensajes m
+    WHERE m.conversacion_id = p.conversacion_id
+      AND m.usuario_id <> p.usuario_id
+      AND (p.ultimo_mensaje_leido IS NULL OR m.id > p.ultimo_mensaje_leido)
+);
+
+COMMENT ON COLUMN chat_conversaciones.ultimo_mensaje_preview IS 'Primeros 200 caracteres del último mensaje (mantenido por trigger)';
+COMMENT ON COLUMN chat_participantes.no_leidos IS 'Mensajes de otros participantes posteriores a ultimo_mensaje_leido (mantenido por trigger)';
+
+-- ✅ Migración completada
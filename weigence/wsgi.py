@@ -0,0 +1,27 @@
+"""
+Punto de entrada para producción con workers asíncronos.
+
+Aplica el monkey patch de gevent/eventlet según ``SOCKETIO_ASYNC_MODE`` antes
+de importar la app (Supabase, hilos y sockets deben cargarse ya parchados).
+Ver "INICIAR LA APLICACIÓN" en docs/INSTALACION.md.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ASYNC_MODE = os.getenv("SOCKETIO_ASYNC_MODE", "threading")
+
+if ASYNC_MODE == "gevent":
+    from gevent import monkey
+
+    monkey.patch_all()
+elif ASYNC_MODE == "eventlet":
+    import eventlet
+
+    eventlet.monkey_patch()
+
+from app import create_app  # noqa: E402
+
+app = create_app()